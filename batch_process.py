@@ -0,0 +1,237 @@
+""" Batch processing of a directory of recordings into gaze tracks, spread across a process pool.
+
+Every video file, image directory or recorded session found in the input directory is processed
+by headless.run in a worker process, with a bounded number of requests in flight per worker.
+Each finished recording leaves a checkpoint, so an interrupted run resumes where it stopped, and
+the per-recording results are merged into summary.json.
+
+Run from the repository root:
+    python batch_process.py recordings/ --matrix ~/.eye_tracking_game/profiles/default__webcam0.json \\
+        --output-dir tracks/ --workers 4 --in-flight 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import config as cfg
+from utils.filters import GAZE_FILTERS
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+CHECKPOINT_DIR = "checkpoints"
+SUMMARY_FILE = "summary.json"
+
+
+def find_recordings(input_dir):
+    """
+    List the recordings of a directory: video files, recorded sessions and directories of images.
+
+    Returns:
+    list: Paths of the recordings, sorted.
+    """
+    from headless import IMAGE_EXTENSIONS
+
+    recordings = []
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        if os.path.isfile(path) and name.lower().endswith(VIDEO_EXTENSIONS):
+            recordings.append(path)
+        elif os.path.isdir(path) and (os.path.exists(os.path.join(path, "meta.json"))
+                                      or any(entry.lower().endswith(IMAGE_EXTENSIONS) for entry in os.listdir(path))):
+            recordings.append(path)
+    return recordings
+
+
+def recording_name(path):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(os.path.normpath(path)))
+
+
+def checkpoint_path(output_dir, name):
+    return os.path.join(output_dir, CHECKPOINT_DIR, f"{name}.json")
+
+
+def load_checkpoints(output_dir):
+    """
+    Return the summaries of the recordings finished by previous runs, by recording name.
+    """
+    directory = os.path.join(output_dir, CHECKPOINT_DIR)
+    if not os.path.isdir(directory):
+        return {}
+
+    summaries = {}
+    for entry in os.listdir(directory):
+        if not entry.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, entry), encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint {entry}: {e}")
+            continue
+        summaries[summary["name"]] = summary
+    return summaries
+
+
+def write_json_atomic(path, document):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    os.replace(temporary_path, path)
+
+
+def track_jitter(output_path):
+    """
+    Mean distance between consecutive filtered gaze points, a filter quality measure that needs no ground truth.
+    """
+    points = []
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            gaze = json.loads(line)["gaze"]
+            if gaze is not None:
+                points.append(gaze)
+    if len(points) < 2:
+        return None
+    return float(np.mean(np.linalg.norm(np.diff(np.array(points), axis=0), axis=1)))
+
+
+def init_worker(log_level):
+    import cv2
+
+    # The pool already uses every core, OpenCV threads inside each worker would only compete with it
+    cv2.setNumThreads(1)
+    logging.getLogger().setLevel(log_level)
+
+
+def process_recording(source, output_dir, transformation_matrix, filter_name, in_flight, flip, url):
+    """
+    Process one recording in a worker process and leave its checkpoint.
+
+    The track is written to a temporary file and renamed once complete, so an interrupted
+    recording is processed again from the start on resume.
+
+    Returns:
+    dict: The summary of the recording, with an "error" entry if it failed.
+    """
+    import headless
+
+    name = recording_name(source)
+    output_path = os.path.join(output_dir, f"{name}.jsonl")
+    summary = {"name": name, "source": source, "output": output_path, "worker": os.getpid()}
+    try:
+        summary.update(headless.run(source, transformation_matrix, f"{output_path}.partial", filter_name, in_flight,
+                                    flip, url))
+        os.replace(f"{output_path}.partial", output_path)
+        summary["jitter"] = track_jitter(output_path)
+    except Exception as e:
+        logging.error(f"Failed to process {source}: {e}")
+        summary["error"] = str(e)
+        if os.path.exists(f"{output_path}.partial"):
+            os.remove(f"{output_path}.partial")
+        return summary
+
+    write_json_atomic(checkpoint_path(output_dir, name), summary)
+    return summary
+
+
+def merge_summaries(summaries, elapsed):
+    """
+    Merge the per-recording summaries into totals.
+    """
+    finished = [summary for summary in summaries if "error" not in summary]
+    processed_now = sum(summary["frames"] for summary in finished if not summary.get("resumed"))
+    return {
+        "recordings": len(summaries),
+        "failed": len(summaries) - len(finished),
+        "frames": sum(summary["frames"] for summary in finished),
+        "faces": sum(summary["faces"] for summary in finished),
+        "errors": sum(summary["errors"] for summary in finished),
+        "elapsed": elapsed,
+        # Frames processed by this run over its wall time, recordings from previous runs are not counted
+        "fps": processed_now / elapsed if elapsed > 0 else 0.0,
+        "sessions": sorted(summaries, key=lambda summary: summary["name"]),
+    }
+
+
+def run(input_dir, transformation_matrix, output_dir, filter_name=cfg.GAZE_FILTER, workers=cfg.BATCH_WORKERS,
+        in_flight=cfg.BATCH_IN_FLIGHT_PER_WORKER, flip=True, url=cfg.GAZE_DETECTION_URL, resume=True):
+    """
+    Process every recording of a directory with a process pool.
+
+    Args:
+    input_dir (str): Directory of video files, image directories and recorded sessions.
+    transformation_matrix (numpy.ndarray): The calibration matrix.
+    output_dir (str): Directory of the tracks, checkpoints and summary.
+    filter_name (str): One of GAZE_FILTERS.
+    workers (int): Number of processes, None for one per CPU core.
+    in_flight (int): Maximum number of pending detection requests per process.
+    flip (bool): Mirror the frames like the live video loop does.
+    url (str): The gaze detection endpoint.
+    resume (bool): Skip the recordings finished by a previous run.
+
+    Returns:
+    dict: The merged summary, also written to summary.json in the output directory.
+    """
+    os.makedirs(os.path.join(output_dir, CHECKPOINT_DIR), exist_ok=True)
+    recordings = find_recordings(input_dir)
+    done = load_checkpoints(output_dir) if resume else {}
+
+    summaries = []
+    pending = []
+    for source in recordings:
+        name = recording_name(source)
+        if name in done and os.path.exists(done[name]["output"]):
+            summaries.append(dict(done[name], resumed=True))
+        else:
+            pending.append(source)
+    logging.info(f"{len(recordings)} recordings, {len(recordings) - len(pending)} already processed")
+
+    start = time.perf_counter()
+    if pending:
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(logging.getLogger().level,)) as executor:
+            futures = [executor.submit(process_recording, source, output_dir, transformation_matrix, filter_name,
+                                       in_flight, flip, url) for source in pending]
+            for future in as_completed(futures):
+                summary = future.result()
+                summaries.append(summary)
+                if "error" not in summary:
+                    logging.info(f"{summary['name']}: {summary['frames']} frames at {summary['fps']:.1f} frames/s "
+                                 f"({len(summaries)}/{len(recordings)})")
+
+    summary = merge_summaries(summaries, time.perf_counter() - start)
+    write_json_atomic(os.path.join(output_dir, SUMMARY_FILE), summary)
+    logging.info(f"Processed {summary['frames']} frames from {summary['recordings']} recordings "
+                 f"({summary['failed']} failed) at {summary['fps']:.1f} frames/s")
+    return summary
+
+
+def main():
+    from headless import load_transformation_matrix
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="Directory of video files, image directories and recorded sessions")
+    parser.add_argument("--matrix", required=True, help="Calibration profile (.json) or transformation matrix (.npy)")
+    parser.add_argument("--output-dir", default="tracks", help="Directory of the tracks, checkpoints and summary")
+    parser.add_argument("--filter", choices=GAZE_FILTERS, default=cfg.GAZE_FILTER, help="Gaze filter")
+    parser.add_argument("--workers", type=int, default=cfg.BATCH_WORKERS, help="Worker processes")
+    parser.add_argument("--in-flight", type=int, default=cfg.BATCH_IN_FLIGHT_PER_WORKER,
+                        help="Requests in flight per worker")
+    parser.add_argument("--url", default=cfg.GAZE_DETECTION_URL, help="Gaze detection endpoint")
+    parser.add_argument("--no-flip", action="store_true", help="Do not mirror the frames")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoints of previous runs")
+    args = parser.parse_args()
+
+    # The gaze detection module configures logging at import, only the level is raised here
+    logging.getLogger().setLevel(logging.INFO)
+    summary = run(args.input_dir, load_transformation_matrix(args.matrix), args.output_dir, args.filter, args.workers,
+                  args.in_flight, not args.no_flip, args.url, resume=not args.restart)
+    print(json.dumps({key: value for key, value in summary.items() if key != "sessions"}))
+
+
+if __name__ == "__main__":
+    main()
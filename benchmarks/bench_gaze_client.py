@@ -0,0 +1,94 @@
+""" Benchmark the per-frame overhead of the pooled GazeClient against a bare requests.post per frame.
+
+Run from the repository root with the inference server up:
+    python -m benchmarks.bench_gaze_client --frames 200
+"""
+
+import argparse
+import base64
+import time
+import cv2
+import numpy as np
+import requests
+import config as cfg
+from benchmarks.common import synthetic_frame
+from utils.gaze_detection import GazeClient
+
+
+def bare_post(url, api_key, frame, timeout):
+    """
+    The original detect_gazes request: a new connection and a JSON-serialized payload per frame.
+    """
+    _, img_encode = cv2.imencode(".jpg", frame)
+    img_base64 = base64.b64encode(img_encode).decode("utf-8")
+    payload = {"api_key": api_key, "image": {"type": "base64", "value": img_base64}}
+    return requests.post(url, json=payload, timeout=timeout)
+
+
+def summarize(name, durations_s, overheads_s):
+    durations_ms = np.array(durations_s) * 1000
+    line = (f"{name:<22} mean {durations_ms.mean():7.2f} ms | p50 {np.percentile(durations_ms, 50):7.2f} ms"
+            f" | p95 {np.percentile(durations_ms, 95):7.2f} ms")
+    if overheads_s:
+        line += f" | overhead outside the model (p50) {np.median(overheads_s) * 1000:7.2f} ms"
+    print(line)
+
+
+def server_time(response_json):
+    """
+    The inference server reports its own processing time per image, if available.
+    """
+    try:
+        return float(response_json[0]["time"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def measure(send_frame, frame, frames):
+    """
+    Time send_frame(frame) including response parsing.
+
+    Returns:
+    tuple: (durations, overheads) in seconds, overheads only for responses reporting a server time.
+    """
+    durations, overheads = [], []
+    for _ in range(frames):
+        start = time.perf_counter()
+        response_json = send_frame(frame).json()
+        duration = time.perf_counter() - start
+        durations.append(duration)
+        reported = server_time(response_json)
+        if reported is not None:
+            overheads.append(duration - reported)
+    return durations, overheads
+
+
+def run(url, api_key, frames, timeout, transport, jpeg_quality, grayscale):
+    frame = synthetic_frame()
+
+    # The first request pays for loading the model on the server
+    bare_post(url, api_key, frame, timeout)
+    summarize("requests.post", *measure(lambda f: bare_post(url, api_key, f, timeout), frame, frames))
+
+    with GazeClient(url=url, api_key=api_key, timeout=timeout, transport=transport, jpeg_quality=jpeg_quality,
+                    grayscale=grayscale) as client:
+        client.warmup()
+        summarize(f"GazeClient ({client.transport})", *measure(client.request, frame, frames))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=cfg.GAZE_DETECTION_URL, help="Gaze detection endpoint")
+    parser.add_argument("--api-key", default=cfg.API_KEY, help="Roboflow API key")
+    parser.add_argument("--frames", type=int, default=100, help="Number of requests per client")
+    parser.add_argument("--timeout", type=float, default=cfg.GAZE_REQUEST_TIMEOUT, help="Request timeout in seconds")
+    parser.add_argument("--transport", choices=("json", "binary"), default=cfg.GAZE_TRANSPORT,
+                        help="How GazeClient uploads frames")
+    parser.add_argument("--jpeg-quality", type=int, default=cfg.JPEG_QUALITY, help="JPEG quality used by GazeClient")
+    parser.add_argument("--grayscale", action="store_true", help="Send grayscale frames with GazeClient")
+    args = parser.parse_args()
+    run(args.url, args.api_key, args.frames, args.timeout, args.transport, args.jpeg_quality, args.grayscale)
+
+
+if __name__ == "__main__":
+    main()
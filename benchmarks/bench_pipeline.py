@@ -0,0 +1,184 @@
+""" Per-stage latency benchmark of the gaze pipeline on synthetic frames.
+
+Every stage is timed on its own: JPEG encoding, base64 encoding, the HTTP round trip (against an
+in-process stand-in server unless --url is given), JSON parsing, the coordinate transforms, every
+filter and every drawing helper. Results are reported as p50/p95/p99 in microseconds and can be
+saved as a JSON baseline and compared against later runs.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline --save baseline.json
+    python -m benchmarks.bench_pipeline --compare baseline.json --tolerance 0.2
+"""
+
+import argparse
+import base64
+import json
+import platform
+import sys
+import cv2
+import numpy as np
+import config as cfg
+from benchmarks.common import synthetic_frame, time_calls, summarize, print_table, save_baseline, compare_with_baseline
+from server.stub_gaze_server import start_in_background
+from utils.compositor import GameCompositor
+from utils.coordinate_transform import (calculate_gaze_point_displacements, calculate_gaze_point, transform_coordinates,
+                                        calculate_screen_points_batch)
+from utils.filters import (apply_moving_average_filter, apply_median_filter, adaptive_weighted_moving_average,
+                           NoFilter, MovingAverageFilter, MedianFilter, AdaptiveWeightedMovingAverageFilter,
+                           KalmanFilter)
+from utils.gaze_detection import GazeClient
+from utils.gaze_record import FaceBox, GazeRecord, parse_predictions
+from utils import visualization
+
+ALIGNMENT_TEXT = "Please align your face in the green square for 5 seconds."
+BATCH_SIZE = 1000  # Gazes per call of the vectorized coordinate transforms
+
+
+def bench_encoding(frame, iterations):
+    _, img_encode = cv2.imencode(".jpg", frame)
+    return {
+        "encode: cv2.imencode": time_calls(lambda: cv2.imencode(".jpg", frame), iterations),
+        "encode: base64": time_calls(lambda: base64.b64encode(img_encode), iterations),
+    }
+
+
+def bench_http(url, frame, iterations):
+    """
+    Time the HTTP round trip alone, with the request body built in advance.
+
+    Returns:
+    tuple: (results, response_content) where response_content is a sample response body.
+    """
+    with GazeClient(url=url) as client:
+        _, img_encode = cv2.imencode(".jpg", frame)
+        body = client._json_prefix + base64.b64encode(img_encode) + client._json_suffix
+        client.warmup()
+
+        responses = []
+        durations = time_calls(lambda: responses.append(client.session.post(client.url, data=body,
+                                                                            timeout=client.timeout)), iterations)
+        response = responses[-1]
+        response.raise_for_status()
+        return {"http: round trip": durations}, response.content
+
+
+def bench_parsing(content, iterations):
+    return {
+        "parse: json.loads": time_calls(lambda: json.loads(content), iterations),
+        "parse: parse_predictions": time_calls(lambda: parse_predictions(content), iterations),
+    }
+
+
+def bench_coordinates(gaze, iterations):
+    transformation_matrix = np.array([[1.05, 0.02, -10], [0.01, 0.98, 5], [0.0, 0.0, 1.0]], dtype=np.float64)
+    width, height = cfg.WIDTH_OF_PLAYGROUND, cfg.HEIGHT_OF_PLAYGROUND
+    yaw = np.full(BATCH_SIZE, gaze.yaw)
+    pitch = np.full(BATCH_SIZE, gaze.pitch)
+    face_height = np.full(BATCH_SIZE, gaze.face.height)
+    return {
+        "coordinates: calculate_gaze_point_displacements":
+            time_calls(lambda: calculate_gaze_point_displacements(gaze), iterations),
+        "coordinates: calculate_gaze_point":
+            time_calls(lambda: calculate_gaze_point(12.5, -30.0, width, height), iterations),
+        "coordinates: transform_coordinates":
+            time_calls(lambda: transform_coordinates(330.0, 250.0, transformation_matrix, width, height), iterations),
+        # The whole chain for BATCH_SIZE gazes at once, compare with BATCH_SIZE times the three calls above
+        f"coordinates: calculate_screen_points_batch ({BATCH_SIZE})":
+            time_calls(lambda: calculate_screen_points_batch(yaw, pitch, face_height, transformation_matrix, width,
+                                                             height), iterations),
+    }
+
+
+def bench_filters(iterations):
+    rng = np.random.default_rng(0)
+    points = [tuple(point) for point in rng.integers(0, cfg.WIDTH_OF_PLAYGROUND, (iterations, 2)).tolist()]
+    window_size = cfg.GAZE_HISTORY_WINDOW_SIZE
+
+    def stream(update):
+        values = iter(points)
+        return time_calls(lambda: update(next(values)), iterations)
+
+    results = {}
+    for name, func in (("apply_moving_average_filter", apply_moving_average_filter),
+                       ("apply_median_filter", apply_median_filter),
+                       ("adaptive_weighted_moving_average", adaptive_weighted_moving_average)):
+        history = []
+        results[f"filter: {name}"] = stream(lambda point, func=func, history=history: func(history, point, window_size))
+
+    for gaze_filter in (NoFilter(), MovingAverageFilter(window_size), MedianFilter(window_size),
+                        AdaptiveWeightedMovingAverageFilter(cfg.ADAPTIVE_FILTER_WINDOW_SIZE),
+                        KalmanFilter([cfg.WIDTH_OF_PLAYGROUND // 2, cfg.HEIGHT_OF_PLAYGROUND // 2])):
+        results[f"filter: {type(gaze_filter).__name__}"] = stream(gaze_filter.update)
+    return results
+
+
+def bench_drawing(frame, gaze, iterations):
+    canvas = frame.copy()
+    compositor = GameCompositor(frame.shape)
+    compositor.set_targets([(100 + 60 * i, 150 + 30 * i) for i in range(cfg.NUMBER_OF_TARGETS)])
+    return {
+        "render: white background (game)": time_calls(lambda: np.ones_like(canvas) * 255, iterations),
+        "render: GameCompositor.render": time_calls(lambda: compositor.render(frame.shape, (320, 240), "12.3 s"),
+                                                    iterations),
+        "render: draw_face_square": time_calls(lambda: visualization.draw_face_square(canvas, gaze), iterations),
+        "render: draw_ideal_square": time_calls(lambda: visualization.draw_ideal_square(canvas), iterations),
+        "render: draw_gaze_point": time_calls(lambda: visualization.draw_gaze_point(canvas, (320, 240)), iterations),
+        "render: draw_calibration_point":
+            time_calls(lambda: visualization.draw_calibration_point(canvas, (100, 100)), iterations),
+        "render: add_text_overlay": time_calls(lambda: visualization.add_text_overlay(canvas, ALIGNMENT_TEXT), iterations),
+        "render: show_timer": time_calls(lambda: visualization.show_timer(canvas, "12.3 s"), iterations),
+        "render: draw_target": time_calls(lambda: visualization.draw_target(canvas, (200, 200)), iterations),
+    }
+
+
+def run(url, iterations, http_iterations):
+    frame = synthetic_frame()
+
+    server = None
+    if url is None:
+        server, url = start_in_background(latency_ms=0)
+
+    try:
+        durations = bench_encoding(frame, iterations)
+        http_durations, content = bench_http(url, frame, http_iterations)
+        durations.update(http_durations)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    durations.update(bench_parsing(content, iterations))
+    predictions = parse_predictions(content)
+    gaze = predictions[0] if predictions else GazeRecord(0.1, -0.05, FaceBox(320, 240, 200, 200))
+    durations.update(bench_coordinates(gaze, iterations))
+    durations.update(bench_filters(iterations))
+    durations.update(bench_drawing(frame, gaze, iterations))
+    return {name: summarize(values) for name, values in durations.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Gaze detection endpoint, defaults to an in-process stand-in server")
+    parser.add_argument("--iterations", type=int, default=2000, help="Timed calls per local stage")
+    parser.add_argument("--http-iterations", type=int, default=200, help="Timed HTTP round trips")
+    parser.add_argument("--save", help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", help="Compare the results with a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown when comparing")
+    args = parser.parse_args()
+
+    results = run(args.url, args.iterations, args.http_iterations)
+    print_table(results)
+
+    if args.save:
+        save_baseline(args.save, results, {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "url": args.url or "stub",
+        })
+    if args.compare and compare_with_baseline(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+""" Benchmark of target hit testing, movement and drawing as the number of targets grows.
+
+For every target count the grid spatial hash of TargetField is compared with the linear scan the
+classic game used (one np.sqrt per target) and with a vectorized brute-force distance check.
+Hit tests are timed on static targets (index built once) and on moving targets (index rebuilt
+after every step).
+
+Run from the repository root:
+    python -m benchmarks.bench_targets --counts 10 100 1000 10000
+"""
+
+import argparse
+import numpy as np
+import config as cfg
+from benchmarks.common import time_calls, summarize, print_table
+from utils.compositor import GameCompositor
+from utils.targets import TargetField
+
+
+def linear_scan(target_positions, gaze_x, gaze_y, hit_radius):
+    hits = []
+    for i, target_pos in enumerate(target_positions):
+        if np.sqrt((gaze_x - target_pos[0])**2 + (gaze_y - target_pos[1])**2) < hit_radius:
+            hits.append(i)
+    return hits
+
+
+def brute_force(positions, gaze_x, gaze_y, hit_radius):
+    offsets = positions - (gaze_x, gaze_y)
+    return np.flatnonzero(np.einsum("ij,ij->i", offsets, offsets) < hit_radius * hit_radius)
+
+
+def bench_count(count, iterations, rng):
+    targets = TargetField.random(count, speed=cfg.SWARM_TARGET_SPEED, margin=cfg.SWARM_TARGET_RADIUS,
+                                 radius=cfg.SWARM_TARGET_RADIUS, hit_radius=cfg.SWARM_TARGET_HIT_RADIUS, rng=rng)
+    gazes = iter(rng.uniform((0, 0), (cfg.WIDTH_OF_PLAYGROUND, cfg.HEIGHT_OF_PLAYGROUND), (4 * iterations, 2)))
+    target_list = [tuple(position) for position in targets.positions.tolist()]
+    hit_radius = targets.hit_radius
+
+    # Make sure the index agrees with the brute force before timing it
+    for gaze_x, gaze_y in rng.uniform((0, 0), (cfg.WIDTH_OF_PLAYGROUND, cfg.HEIGHT_OF_PLAYGROUND), (100, 2)):
+        assert np.array_equal(targets.hit_test(gaze_x, gaze_y),
+                              brute_force(targets.positions, gaze_x, gaze_y, hit_radius))
+
+    compositor = GameCompositor((cfg.HEIGHT_OF_PLAYGROUND, cfg.WIDTH_OF_PLAYGROUND, 3))
+
+    def moving_hit_test():
+        targets.step(1 / 30)
+        targets.hit_test(*next(gazes))
+
+    def draw():
+        targets.step(1 / 30)
+        compositor.set_targets(targets.pixel_positions(), targets.radius)
+        compositor.render(compositor.frame_shape)
+
+    results = {
+        f"{count:>6} targets: linear scan": time_calls(lambda: linear_scan(target_list, *next(gazes), hit_radius),
+                                                       iterations),
+        f"{count:>6} targets: brute force": time_calls(lambda: brute_force(targets.positions, *next(gazes),
+                                                                           hit_radius), iterations),
+        f"{count:>6} targets: grid hit test": time_calls(lambda: targets.hit_test(*next(gazes)), iterations),
+        f"{count:>6} targets: step + grid hit test": time_calls(moving_hit_test, iterations),
+        f"{count:>6} targets: step + render": time_calls(draw, min(iterations, 200)),
+    }
+    return {name: summarize(durations) for name, durations in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Target counts")
+    parser.add_argument("--iterations", type=int, default=1000, help="Timed calls per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for count in args.counts:
+        results.update(bench_count(count, args.iterations, rng))
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
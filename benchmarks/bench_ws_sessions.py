@@ -0,0 +1,155 @@
+""" Load-test the WebSocket gaze server and report how many sessions it serves at a target latency.
+
+Every simulated session streams the same synthetic webcam frame at --fps and measures the time
+from sending a frame to receiving its gaze point. The number of sessions grows level by level;
+a level passes when the p95 latency is under --target-ms and each session still gets at least
+--min-rate of its frames answered (the server drops frames instead of queueing them, so an
+overloaded server shows up as a lower answer rate first).
+
+Without --ws-url, a stub inference server and the WebSocket server are started as subprocesses.
+
+Run from the repository root:
+    python -m benchmarks.bench_ws_sessions --sessions 1 2 4 8 16 32 --target-ms 100 --latency-ms 30
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+import websockets
+import config as cfg
+from benchmarks.common import synthetic_frame
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout} s")
+
+
+def start_servers(latency_ms, concurrency, workers, max_fps):
+    """
+    Start a stub inference server and the WebSocket server as subprocesses.
+
+    Returns:
+    tuple: (list of processes, WebSocket URL).
+    """
+    stub_port, ws_port = free_port(), free_port()
+    stub = subprocess.Popen([sys.executable, "-m", "server.stub_gaze_server", "--port", str(stub_port),
+                             "--latency-ms", str(latency_ms), "--concurrency", str(concurrency)])
+    wait_for_port(stub_port)
+    ws = subprocess.Popen([sys.executable, "-m", "server.gaze_ws_server", "--port", str(ws_port),
+                           "--url", f"http://127.0.0.1:{stub_port}/gaze/gaze_detection", "--workers", str(workers),
+                           "--max-fps", str(max_fps), "--max-sessions", "100000"])
+    wait_for_port(ws_port)
+    return [stub, ws], f"ws://127.0.0.1:{ws_port}"
+
+
+async def run_session(url, image, fps, duration, warmup, latencies):
+    """
+    Stream frames for duration seconds and collect the latencies measured after the warm-up.
+
+    Returns:
+    tuple: (frames sent after the warm-up, gaze points received for them).
+    """
+    sent_times = {}
+    measured_from = time.perf_counter() + warmup
+    sent = received = 0
+    async with websockets.connect(url, max_size=cfg.WS_MAX_FRAME_BYTES) as websocket:
+        async def receive():
+            nonlocal received
+            async for message in websocket:
+                reply = json.loads(message)
+                sent_time = sent_times.pop(reply.get("frame"), None)
+                if reply["type"] == "gaze" and sent_time is not None and sent_time >= measured_from:
+                    latencies.append((time.perf_counter() - sent_time) * 1000)
+                    received += 1
+
+        receiver = asyncio.create_task(receive())
+        start = time.perf_counter()
+        frame_number = 0
+        # Sessions send at a steady rate, late sends are not made up for
+        while (now := time.perf_counter()) < start + duration:
+            sent_times[frame_number] = now
+            sent += now >= measured_from
+            await websocket.send(image)
+            frame_number += 1
+            await asyncio.sleep(max(0.0, start + frame_number / fps - time.perf_counter()))
+        # Replies of the last frames
+        await asyncio.sleep(0.5)
+        receiver.cancel()
+    return sent, received
+
+
+async def run_level(url, image, sessions, fps, duration, warmup):
+    latencies = []
+    results = await asyncio.gather(*[run_session(url, image, fps, duration, warmup, latencies)
+                                     for _ in range(sessions)])
+    sent = sum(result[0] for result in results)
+    received = sum(result[1] for result in results)
+    return np.array(latencies), received / sent if sent else 0.0
+
+
+def run(url, levels, fps, duration, warmup, target_ms, min_rate):
+    _, image = cv2.imencode(".jpg", synthetic_frame())
+    image = image.tobytes()
+
+    supported = 0
+    print(f"{'sessions':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'answered':>8}")
+    for sessions in levels:
+        latencies, rate = asyncio.run(run_level(url, image, sessions, fps, duration, warmup))
+        p50, p95 = np.percentile(latencies, (50, 95)) if len(latencies) else (float("nan"), float("nan"))
+        passed = p95 <= target_ms and rate >= min_rate
+        print(f"{sessions:>8} | {p50:>8.1f} | {p95:>8.1f} | {rate:>7.0%}  {'ok' if passed else 'over target'}")
+        if not passed:
+            break
+        supported = sessions
+    print(f"Sessions supported at p95 <= {target_ms:g} ms with {min_rate:.0%} of {fps:g} fps answered: {supported}")
+    return supported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ws-url", help="WebSocket server to test, started locally with a stub server if omitted")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+                        help="Numbers of concurrent sessions to try, in increasing order")
+    parser.add_argument("--fps", type=float, default=15, help="Frames per second sent by each session")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per level")
+    parser.add_argument("--warmup", type=float, default=1, help="Seconds of each level left out of the figures")
+    parser.add_argument("--target-ms", type=float, default=100, help="Target p95 latency")
+    parser.add_argument("--min-rate", type=float, default=0.9, help="Fraction of the frames that must be answered")
+    parser.add_argument("--latency-ms", type=float, default=30, help="Latency of the local stub inference server")
+    parser.add_argument("--concurrency", type=int, default=8, help="Images the local stub server processes at once")
+    parser.add_argument("--workers", type=int, default=cfg.WS_INFERENCE_WORKERS,
+                        help="Inference requests at once of the local WebSocket server")
+    args = parser.parse_args()
+
+    processes, url = [], args.ws_url
+    if url is None:
+        processes, url = start_servers(args.latency_ms, args.concurrency, args.workers, max(args.fps, cfg.WS_MAX_FPS))
+    try:
+        run(url, args.sessions, args.fps, args.duration, args.warmup, args.target_ms, args.min_rate)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
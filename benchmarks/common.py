@@ -0,0 +1,95 @@
+""" Shared helpers for the benchmark scripts. """
+
+import json
+import time
+import cv2
+import numpy as np
+import config as cfg
+
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_frame(width=cfg.WIDTH_OF_PLAYGROUND, height=cfg.HEIGHT_OF_PLAYGROUND, seed=0):
+    """
+    Build a noisy frame, so the JPEG size is close to a real webcam frame.
+    """
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frame, (7, 7), 0)
+
+
+def time_calls(func, iterations, setup=None):
+    """
+    Time func() individually for the given number of iterations.
+
+    Args:
+    func (callable): The function to time, called without arguments.
+    iterations (int): Number of timed calls.
+    setup (callable): Called before every call, outside of the timing.
+
+    Returns:
+    numpy.ndarray: Duration of every call in microseconds.
+    """
+    durations = np.empty(iterations, dtype=np.float64)
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter_ns()
+        func()
+        durations[i] = (time.perf_counter_ns() - start) / 1000
+    return durations
+
+
+def summarize(durations_us):
+    """
+    Return the mean and the percentiles of a set of durations in microseconds.
+    """
+    summary = {"mean_us": float(np.mean(durations_us)), "count": int(len(durations_us))}
+    for percentile, value in zip(PERCENTILES, np.percentile(durations_us, PERCENTILES)):
+        summary[f"p{percentile}_us"] = float(value)
+    return summary
+
+
+def print_table(results):
+    """
+    Print one line per stage with its percentiles.
+    """
+    width = max(len(name) for name in results)
+    header = " | ".join(f"{f'p{p}':>10}" for p in PERCENTILES)
+    print(f"{'stage':<{width}} | {header} |       mean")
+    for name, summary in results.items():
+        values = " | ".join(f"{summary[f'p{p}_us']:>10.1f}" for p in PERCENTILES)
+        print(f"{name:<{width}} | {values} | {summary['mean_us']:>10.1f}  (us)")
+
+
+def save_baseline(path, results, metadata=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"metadata": metadata or {}, "results": results}, f, indent=2)
+
+
+def compare_with_baseline(path, results, tolerance):
+    """
+    Compare the p50 of every stage with a saved baseline.
+
+    Args:
+    path (str): The baseline JSON file.
+    results (dict): The current results.
+    tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+    list: Names of the stages slower than the baseline by more than the tolerance.
+    """
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p50_us"], summary["p50_us"]
+        change = (after - before) / before if before else 0.0
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"{name:<40} p50 {before:>10.1f} -> {after:>10.1f} us ({change:+.0%}) {flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
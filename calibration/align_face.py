@@ -27,21 +27,21 @@ class AlignFace:
         Check if the face is within the ideal square.
 
         Args:
-            gaze: A dictionary containing gaze information.
+            gaze: The GazeRecord of the face.
 
         Returns:
             A boolean indicating whether the face is within the ideal square or not.
         """
-        face = gaze["face"]
+        face = gaze.face
         x_min = int(cfg.WIDTH_OF_PLAYGROUND / 2 - cfg.HEIGHT_OF_HUMAN_FACE / 2)
         x_max = int(cfg.WIDTH_OF_PLAYGROUND / 2 + cfg.HEIGHT_OF_HUMAN_FACE / 2)
         y_min = int(cfg.HEIGHT_OF_PLAYGROUND / 2 - cfg.HEIGHT_OF_HUMAN_FACE / 2)
         y_max = int(cfg.HEIGHT_OF_PLAYGROUND / 2 + cfg.HEIGHT_OF_HUMAN_FACE / 2)
 
-        return (x_min < face["x"] - face["width"] / 2 < x_max and
-                x_min < face["x"] + face["width"] / 2 < x_max and
-                y_min < face["y"] - face["height"] / 2 < y_max and
-                y_min < face["y"] + face["height"] / 2 < y_max)
+        return (x_min < face.x - face.width / 2 < x_max and
+                x_min < face.x + face.width / 2 < x_max and
+                y_min < face.y - face.height / 2 < y_max and
+                y_min < face.y + face.height / 2 < y_max)
 
     def frame_processing_func(self, frame):
         """
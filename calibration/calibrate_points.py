@@ -1,16 +1,150 @@
 """This module contains classes for calibrating the gaze mapping."""
 
+import collections
+import time
 import cv2
 import numpy as np
 import config as cfg
 import logging
 from utils.gaze_detection import detect_gazes
 from utils.coordinate_transform import calculate_gaze_point_displacements, calculate_gaze_point
-from utils.visualization import draw_face_square, draw_calibration_point
-from utils.video import video_loop
+from utils.visualization import draw_face_square, draw_calibration_point, draw_calibration_progress
+from utils.video import video_loop, poll_key
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Scales the median absolute deviation to the standard deviation of normally distributed samples
+MAD_TO_STD = 1.4826
+
+# Any 4 points fit a homography exactly, so RANSAC needs at least 2 more to single out a bad point
+MIN_RANSAC_POINTS = 6
+
+
+def raw_gaze_point(gaze, frame_shape):
+    """
+    Calculate the uncalibrated gaze point of a gaze.
+
+    Args:
+        gaze: The gaze data.
+        frame_shape: The shape of the frame the gaze was detected in.
+
+    Returns:
+        The (x, y) raw gaze point.
+    """
+    dx, dy = calculate_gaze_point_displacements(gaze)
+    image_width, image_height = frame_shape[:2]
+    return calculate_gaze_point(dx, dy, image_width, image_height)
+
+
+def robust_mean(points, threshold=cfg.CALIBRATION_OUTLIER_MAD):
+    """
+    Average gaze samples after rejecting outliers, such as samples taken during a blink.
+
+    A sample is rejected when it is further than threshold scaled median absolute deviations
+    from the median on either axis.
+
+    Args:
+        points: (N, 2) array of gaze samples.
+        threshold: Rejection threshold in scaled MADs.
+
+    Returns:
+        A tuple of the mean of the kept samples and the boolean mask of the kept samples.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    median = np.median(points, axis=0)
+    deviations = np.abs(points - median)
+    # A floor on the spread keeps identical samples from rejecting everything else
+    scale = np.maximum(MAD_TO_STD * np.median(deviations, axis=0), 1.0)
+    inliers = np.all(deviations <= threshold * scale, axis=1)
+    return points[inliers].mean(axis=0), inliers
+
+
+def calibration_points(grid=cfg.CALIBRATION_GRID):
+    """
+    Return the calibration points of the playground.
+
+    Args:
+        grid: 5 for the corners and the middle, 9 for a 3x3 grid.
+
+    Returns:
+        A list of (x, y, name) tuples.
+    """
+    width, height = cfg.WIDTH_OF_PLAYGROUND, cfg.HEIGHT_OF_PLAYGROUND
+    if grid == 5:
+        return [
+            (0, 0, "top-left"),
+            (width, 0, "top-right"),
+            (0, height, "bottom-left"),
+            (width, height, "bottom-right"),
+            (width // 2, height // 2, "middle")
+        ]
+    if grid == 9:
+        rows = [(0, "top"), (height // 2, "middle"), (height, "bottom")]
+        columns = [(0, "left"), (width // 2, "center"), (width, "right")]
+        return [(x, y, f"{row_name}-{column_name}" if (row_name, column_name) != ("middle", "center") else "middle")
+                for y, row_name in rows for x, column_name in columns]
+    raise ValueError(f"Unsupported calibration grid: {grid}")
+
+
+def fit_gaze_mapping(src_points, dst_points, ransac_threshold=cfg.CALIBRATION_RANSAC_THRESHOLD):
+    """
+    Fit the homography from raw gaze points to playground points.
+
+    With at least MIN_RANSAC_POINTS points, RANSAC keeps the calibration points that agree with
+    each other, so one badly fixated point does not bend the whole mapping; the homography is
+    then refined on the points it kept. With fewer points every 4-point subset fits exactly and
+    RANSAC cannot tell which point is bad, so all of them are fitted by least squares.
+
+    Args:
+        src_points: (N, 2) raw gaze points, N >= 4.
+        dst_points: (N, 2) playground points.
+        ransac_threshold: Reprojection error in pixels of the points kept.
+
+    Returns:
+        A tuple of the 3x3 transformation matrix and the boolean mask of the points kept.
+    """
+    src_points = np.asarray(src_points, dtype=np.float32).reshape(-1, 2)
+    dst_points = np.asarray(dst_points, dtype=np.float32).reshape(-1, 2)
+
+    transformation_matrix, mask = None, None
+    if len(src_points) >= MIN_RANSAC_POINTS:
+        transformation_matrix, mask = cv2.findHomography(src_points, dst_points, cv2.RANSAC, ransac_threshold)
+    if transformation_matrix is None or mask is None or mask.sum() < 4:
+        # Too few points for RANSAC, or no consensus: every point is needed
+        transformation_matrix, _ = cv2.findHomography(src_points, dst_points)
+        mask = np.ones(len(src_points), dtype=np.uint8)
+    return transformation_matrix, mask.ravel().astype(bool)
+
+
+class FixationDetector:
+    """
+    Detect a stable fixation from the dispersion of the last gaze samples.
+
+    The gaze is fixating when the last window samples span at most dispersion pixels, measured
+    as the sum of their x and y ranges (dispersion-threshold identification).
+    """
+
+    def __init__(self, window=cfg.CALIBRATION_FIXATION_WINDOW, dispersion=cfg.CALIBRATION_FIXATION_DISPERSION):
+        self.dispersion = dispersion
+        self.samples = collections.deque(maxlen=window)
+
+    def update(self, point):
+        """
+        Add a gaze sample.
+
+        Returns:
+            True if the last window samples form a fixation.
+        """
+        self.samples.append(point)
+        if len(self.samples) < self.samples.maxlen:
+            return False
+        samples = np.asarray(self.samples)
+        return float(np.ptp(samples[:, 0]) + np.ptp(samples[:, 1])) <= self.dispersion
+
+    def reset(self):
+        self.samples.clear()
+
+
 class CalibrateCorner:
     """Class for calibrating a specific corner of the gaze mapping."""
 
@@ -45,11 +179,8 @@ class CalibrateCorner:
             gaze = gazes[0]
             draw_face_square(frame, gaze)
             draw_calibration_point(frame, (self.corner_x, self.corner_y))
-            if cv2.waitKey(1) & 0xFF == ord(" "):
-                dx, dy = calculate_gaze_point_displacements(gaze)
-                image_width, image_height = frame.shape[:2]
-                gaze_x, gaze_y = calculate_gaze_point(dx, dy, image_width, image_height)
-                self.gaze_points.append((gaze_x, gaze_y))
+            if poll_key() == ord(" "):
+                self.gaze_points.append(raw_gaze_point(gaze, frame.shape))
                 logging.debug(f"Calibration point {len(self.gaze_points)} captured.")
             if len(self.gaze_points) == cfg.CALIBRATION_POINTS:
                 return frame, True
@@ -60,34 +191,107 @@ class CalibrateCorner:
         Perform the calibration for the corner.
 
         Returns:
-            The mean gaze point coordinates for the corner.
+            The robust mean of the gaze point coordinates for the corner, or None without samples.
         """
         text = f"Look at the {self.corner_name} corner of the playground and press the spacebar."
         video_loop(self.cap, self.frame_processing_func, display_name="Gaze Calibration", extra_text=text, destroy_windows=False)
         if self.gaze_points:
-            return np.mean(self.gaze_points, axis=0)
+            return robust_mean(self.gaze_points)[0]
 
-        return (0.0, 0.0)
+        return None
+
+
+class FixationCalibrationPoint(CalibrateCorner):
+    """
+    Calibrate a point by sampling the gaze continuously while the user looks at it.
+
+    Samples of the first CALIBRATION_SETTLE_TIME seconds, while the eyes move to the point, are
+    ignored. Once the gaze is stable, CALIBRATION_SAMPLES_PER_POINT samples are collected and
+    averaged after outlier rejection. After CALIBRATION_POINT_TIMEOUT seconds the fixation
+    samples collected so far are used, or all the settled samples if no fixation was detected.
+    """
+
+    def __init__(self, cap, corner_x, corner_y, corner_name):
+        super().__init__(cap, corner_x, corner_y, corner_name)
+        self.fixation = FixationDetector()
+        self.settled_samples = []
+        self.start_time = None
+
+    def frame_processing_func(self, frame):
+        """
+        Process each frame of the video capture.
+
+        Args:
+            frame: The current frame of the video capture.
+
+        Returns:
+            A tuple containing the processed frame and a boolean indicating if the calibration is complete.
+        """
+        now = time.time()
+        if self.start_time is None:
+            self.start_time = now
+        elapsed = now - self.start_time
+
+        gazes = detect_gazes(frame)
+        if gazes and elapsed >= cfg.CALIBRATION_SETTLE_TIME:
+            gaze = gazes[0]
+            draw_face_square(frame, gaze)
+            point = raw_gaze_point(gaze, frame.shape)
+            self.settled_samples.append(point)
+            if self.gaze_points:
+                self.gaze_points.append(point)
+            elif self.fixation.update(point):
+                # The samples of the detected fixation are the first ones of the point
+                self.gaze_points.extend(self.fixation.samples)
+                logging.debug(f"Fixation detected on the {self.corner_name} point after {elapsed:.1f} s")
+
+        progress = min(len(self.gaze_points) / cfg.CALIBRATION_SAMPLES_PER_POINT, 1.0)
+        draw_calibration_progress(frame, (self.corner_x, self.corner_y), progress)
+        return frame, progress >= 1.0 or elapsed >= cfg.CALIBRATION_POINT_TIMEOUT
+
+    def calibrate(self):
+        """
+        Perform the calibration for the point.
+
+        Returns:
+            The robust mean of the gaze point coordinates for the point, or None without samples.
+        """
+        text = f"Look at the {self.corner_name} point until the circle is complete."
+        video_loop(self.cap, self.frame_processing_func, display_name="Gaze Calibration", extra_text=text, destroy_windows=False)
+
+        # The samples from the detected fixation on, even if the point timed out before collecting all of them
+        samples = self.gaze_points
+        if not samples:
+            logging.warning(f"No stable fixation on the {self.corner_name} point, using all of its samples")
+            samples = self.settled_samples
+        if not samples:
+            return None
+
+        mean, inliers = robust_mean(samples)
+        logging.debug(f"{self.corner_name} point: {inliers.sum()} of {len(samples)} samples kept")
+        return mean
 
 
 class CalibrateGazeMapping:
     """Class for calibrating the gaze mapping."""
 
-    def __init__(self, cap):
+    def __init__(self, cap, mode=cfg.CALIBRATION_MODE, grid=cfg.CALIBRATION_GRID):
         """
         Initialize the CalibrateGazeMapping object.
 
         Args:
             cap: The video capture object.
+            mode: "manual" to capture the samples with the spacebar, "continuous" to detect fixations.
+            grid: 5 or 9 calibration points.
         """
+        if mode not in ("manual", "continuous"):
+            raise ValueError(f"Unknown calibration mode: {mode}")
+
         self.cap = cap
-        self.corners = [
-            (0, 0, "top-left"),
-            (cfg.WIDTH_OF_PLAYGROUND, 0, "top-right"),
-            (0, cfg.HEIGHT_OF_PLAYGROUND, "bottom-left"),
-            (cfg.WIDTH_OF_PLAYGROUND, cfg.HEIGHT_OF_PLAYGROUND, "bottom-right"),
-            (cfg.WIDTH_OF_PLAYGROUND // 2, cfg.HEIGHT_OF_PLAYGROUND // 2, "middle")
-        ]
+        self.mode = mode
+        self.src_points = None
+        self.dst_points = None
+        self.corners = calibration_points(grid)
 
     def perform_calibration(self):
         """
@@ -96,21 +300,29 @@ class CalibrateGazeMapping:
         Returns:
             The transformation matrix for the gaze mapping.
         """
-        src_points = []
+        point_calibration = FixationCalibrationPoint if self.mode == "continuous" else CalibrateCorner
+        src_points, dst_points, names = [], [], []
         for corner in self.corners:
-            x, y = CalibrateCorner(self.cap, *corner).calibrate()
-            src_points.append([x, y])
+            point = point_calibration(self.cap, *corner).calibrate()
+            if point is None:
+                logging.warning(f"No gaze detected for the {corner[2]} point, it is left out of the calibration")
+                continue
+            src_points.append(point)
+            dst_points.append(corner[:2])
+            names.append(corner[2])
 
-        dst_points = np.float32([[0, 0],
-                                [cfg.WIDTH_OF_PLAYGROUND, 0],
-                                [0, cfg.HEIGHT_OF_PLAYGROUND],
-                                [cfg.WIDTH_OF_PLAYGROUND, cfg.HEIGHT_OF_PLAYGROUND],
-                                [cfg.WIDTH_OF_PLAYGROUND // 2, cfg.HEIGHT_OF_PLAYGROUND // 2]])
+        if len(src_points) < 4:
+            raise Exception("Not enough calibration points with a detected gaze")
 
         # Convert to numpy arrays with float32 data type
         src_points = np.array(src_points, dtype=np.float32)
         dst_points = np.array(dst_points, dtype=np.float32)
 
-        transformation_matrix, _ = cv2.findHomography(src_points, dst_points)
+        transformation_matrix, inliers = fit_gaze_mapping(src_points, dst_points)
+        if not inliers.all():
+            rejected = [name for name, kept in zip(names, inliers) if not kept]
+            logging.info(f"Calibration points rejected by RANSAC: {', '.join(rejected)}")
+        self.src_points = src_points
+        self.dst_points = dst_points
         cv2.destroyAllWindows()
         return transformation_matrix
@@ -6,10 +6,12 @@ import numpy as np
 import config as cfg
 import logging
 from utils.coordinate_transform import transform_coordinates, calculate_gaze_point_displacements, calculate_gaze_point
-from utils.filters import KalmanFilter
+from utils.filters import create_filter
 from utils.gaze_detection import detect_gazes
+from utils.metrics import registry
+from utils.motion_gate import MotionGate
 from utils.visualization import draw_face_square, draw_calibration_point, draw_gaze_point
-from utils.video import video_loop
+from utils.video import video_loop, poll_key
 
 logging.basicConfig(level=logging.INFO)
 
@@ -21,6 +23,9 @@ class CheckGazeAccuracyForTarget:
         cap (object): The video capture object.
         transformation_matrix (numpy.ndarray): The transformation matrix for coordinate transformation.
         target_point (tuple): The coordinates of the target point.
+        target_duration (float): The duration for which the target should be held, in seconds.
+        auto_start (bool): Start start_delay seconds after the first detected face instead of waiting for the spacebar.
+        start_delay (float): Time given to look at the target before collecting gaze points with auto_start.
 
     Attributes:
         cap (object): The video capture object.
@@ -30,22 +35,28 @@ class CheckGazeAccuracyForTarget:
         target_start_time (float): The start time of the target.
         target_duration (float): The duration for which the target should be held.
         started (bool): A flag indicating if the target has started.
-        gaze_history (list): A list to store the gaze history.
-        kalman_filter (KalmanFilter): An instance of the KalmanFilter class.
+        gaze_filter: The filter configured with cfg.GAZE_FILTER.
+        motion_gate (MotionGate): Skips gaze detection on frames where the face barely moved.
+        last_gaze (dict): The last detected gaze, or None if no face was found.
 
     """
 
-    def __init__(self, cap, transformation_matrix, target_point):
+    def __init__(self, cap, transformation_matrix, target_point, target_duration=cfg.ACCURACY_TARGET_DURATION,
+                 auto_start=False, start_delay=1.0):
         self.cap = cap
         self.transformation_matrix = transformation_matrix
         self.target_point = target_point
         self.gaze_points = []
         self.target_start_time = None
-        self.target_duration = cfg.ACCURACY_TARGET_DURATION
+        self.target_duration = target_duration
         self.started = False
+        self.auto_start = auto_start
+        self.start_delay = start_delay
+        self.first_face_time = None
 
-        self.gaze_history = []
-        self.kalman_filter = KalmanFilter([cfg.WIDTH_OF_PLAYGROUND // 2, cfg.HEIGHT_OF_PLAYGROUND // 2])
+        self.gaze_filter = create_filter(cfg.GAZE_FILTER)
+        self.motion_gate = MotionGate()
+        self.last_gaze = None
 
     def frame_processing_func(self, frame):
         """
@@ -58,25 +69,41 @@ class CheckGazeAccuracyForTarget:
             tuple: A tuple containing the processed frame and a flag indicating if the target duration has elapsed.
 
         """
-        gazes = detect_gazes(frame)
-        if len(gazes) > 0:
-            gaze = gazes[0]
+        detected = self.motion_gate.should_infer(frame)
+        if detected:
+            gazes = detect_gazes(frame)
+            self.motion_gate.update(frame, gazes)
+            self.last_gaze = gazes[0] if len(gazes) > 0 else None
+
+        if self.last_gaze is not None:
+            gaze = self.last_gaze
             frame = draw_face_square(frame, gaze)
-            image_width, image_height = frame.shape[:2]
-            dx, dy = calculate_gaze_point_displacements(gaze)
-            gaze_x, gaze_y = calculate_gaze_point(dx, dy, image_width, image_height)
-            gaze_x, gaze_y = transform_coordinates(gaze_x, gaze_y, self.transformation_matrix, image_width, image_height)
 
             target_x, target_y = self.target_point
             draw_calibration_point(frame, (target_x, target_y))
 
-            # add kalman filter
-            filtered_point = self.kalman_filter.update(np.array([gaze_x, gaze_y]))
+            if detected:
+                image_width, image_height = frame.shape[:2]
+                dx, dy = calculate_gaze_point_displacements(gaze)
+                gaze_x, gaze_y = calculate_gaze_point(dx, dy, image_width, image_height)
+                gaze_x, gaze_y = transform_coordinates(gaze_x, gaze_y, self.transformation_matrix, image_width, image_height)
+
+                # apply the configured filter
+                with registry.timer("gaze_filter_latency_ms"):
+                    filtered_point = self.gaze_filter.update((gaze_x, gaze_y))
+            else:
+                # skipped by the motion gate, only advance the filter
+                filtered_point = self.gaze_filter.predict()
             gaze_x, gaze_y = map(int, filtered_point)
 
             # Draw gaze point
             frame = draw_gaze_point(frame, (gaze_x, gaze_y))
 
+            if self.auto_start and self.target_start_time is None:
+                if self.first_face_time is None:
+                    self.first_face_time = time.time()
+                self.started = time.time() - self.first_face_time >= self.start_delay
+
             if self.started:
                 self.gaze_points.append((gaze_x, gaze_y))
 
@@ -86,7 +113,7 @@ class CheckGazeAccuracyForTarget:
                     self.started = False
                     return frame, True
 
-        if cv2.waitKey(1) & 0xFF == ord(" "):
+        if poll_key() == ord(" "):
             self.started = True
             self.gaze_points = []
 
@@ -100,11 +127,16 @@ class CheckGazeAccuracyForTarget:
             float: The accuracy for the target.
 
         """
-        text = f"Look at the target point and press the spacebar to start. Hold for {self.target_duration} seconds."
+        if self.auto_start:
+            text = f"Look at the target point for {self.target_duration} seconds."
+        else:
+            text = f"Look at the target point and press the spacebar to start. Hold for {self.target_duration} seconds."
         video_loop(self.cap, self.frame_processing_func, "Gaze Accuracy Check", text, destroy_windows=False)
 
         accuracy = self.calculate_accuracy()
         logging.info(f"Accuracy for this target: {accuracy:.2f}%")
+        if self.motion_gate.enabled:
+            logging.info(f"Motion gate skip ratio for this target: {self.motion_gate.skip_ratio:.2f}")
         return accuracy
 
     def calculate_accuracy(self):
@@ -118,16 +150,51 @@ class CheckGazeAccuracyForTarget:
         if not self.gaze_points:
             return 0.0
 
+        avg_distance = self.average_distance()
+        max_distance = np.sqrt(cfg.WIDTH_OF_PLAYGROUND ** 2 + cfg.HEIGHT_OF_PLAYGROUND ** 2)
+        accuracy = (1 - avg_distance / max_distance) * 100
+        return accuracy
+
+    def average_distance(self):
+        """
+        Calculate the average distance between the gaze points and the target.
+
+        Returns:
+            float: The average distance in pixels, or None without gaze points.
+
+        """
+        if not self.gaze_points:
+            return None
+
         target_x, target_y = self.target_point
         total_distance = 0
         for gaze_x, gaze_y in self.gaze_points:
             distance = np.sqrt((gaze_x - target_x) ** 2 + (gaze_y - target_y) ** 2)
             total_distance += distance
 
-        avg_distance = total_distance / len(self.gaze_points)
-        max_distance = np.sqrt(cfg.WIDTH_OF_PLAYGROUND ** 2 + cfg.HEIGHT_OF_PLAYGROUND ** 2)
-        accuracy = (1 - avg_distance / max_distance) * 100
-        return accuracy
+        return total_distance / len(self.gaze_points)
+
+
+def validate_calibration(cap, transformation_matrix, target_point, duration=cfg.QUICK_VALIDATION_DURATION):
+    """
+    Quickly check a stored calibration at a single point, without waiting for the spacebar.
+
+    Args:
+        cap (object): The video capture object.
+        transformation_matrix (numpy.ndarray): The stored transformation matrix.
+        target_point (tuple): The coordinates of the validation point.
+        duration (float): Seconds of gaze points collected.
+
+    Returns:
+        float: The drift, i.e. the average distance in pixels between the gaze points and the target,
+        or None if no gaze point was collected.
+
+    """
+    checker = CheckGazeAccuracyForTarget(cap, transformation_matrix, target_point, target_duration=duration,
+                                         auto_start=True)
+    checker.run()
+    cv2.destroyAllWindows()
+    return checker.average_distance()
 
 
 class CheckGazeAccuracy:
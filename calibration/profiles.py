@@ -0,0 +1,115 @@
+"""This module stores calibration profiles on disk, so a user does not have to calibrate at every launch."""
+
+import json
+import logging
+import os
+import re
+import time
+import numpy as np
+import config as cfg
+
+
+class CalibrationProfile:
+    """
+    Calibration of one user with one camera.
+
+    Attributes:
+        user (str): Name of the user.
+        camera (str): Identifier of the camera.
+        transformation_matrix (numpy.ndarray): The 3x3 homography from cv2.findHomography.
+        src_points (numpy.ndarray): The raw gaze points measured at the calibration points.
+        accuracy (float): Overall accuracy measured after calibrating, in percent.
+        resolution (tuple): (width, height) of the camera frames.
+        created_at (float): Time of the calibration.
+        validated_at (float): Time of the last quick validation, or None.
+        last_drift (float): Drift measured at the last quick validation, in pixels, or None.
+    """
+
+    def __init__(self, user, camera, transformation_matrix, src_points, accuracy, resolution, created_at=None,
+                 validated_at=None, last_drift=None):
+        self.user = user
+        self.camera = camera
+        if transformation_matrix is None:
+            raise ValueError(f"Calibration profile of {user} needs a transformation matrix")
+        self.transformation_matrix = np.asarray(transformation_matrix, dtype=np.float64).reshape(3, 3)
+        self.src_points = np.asarray(src_points, dtype=np.float32).reshape(-1, 2)
+        self.accuracy = float(accuracy)
+        self.resolution = tuple(int(value) for value in resolution)
+        self.created_at = created_at if created_at is not None else time.time()
+        self.validated_at = validated_at
+        self.last_drift = last_drift
+
+    def to_dict(self):
+        return {
+            "user": self.user,
+            "camera": self.camera,
+            "transformation_matrix": self.transformation_matrix.tolist(),
+            "src_points": self.src_points.tolist(),
+            "accuracy": self.accuracy,
+            "resolution": list(self.resolution),
+            "created_at": self.created_at,
+            "validated_at": self.validated_at,
+            "last_drift": self.last_drift,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["user"], data["camera"], data["transformation_matrix"], data["src_points"], data["accuracy"],
+                   data["resolution"], data.get("created_at"), data.get("validated_at"), data.get("last_drift"))
+
+
+def profile_path(user, camera, directory=cfg.CALIBRATION_PROFILE_DIR):
+    """
+    Return the file of the profile of a user and camera.
+    """
+    def safe(name):
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))
+
+    return os.path.join(directory, f"{safe(user)}__{safe(camera)}.json")
+
+
+def save_profile(profile, directory=cfg.CALIBRATION_PROFILE_DIR):
+    """
+    Write a profile, replacing the previous one of the same user and camera atomically.
+
+    Returns:
+    str: The path of the profile file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = profile_path(profile.user, profile.camera, directory)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f, indent=2)
+    os.replace(temporary_path, path)
+    logging.info(f"Calibration profile saved to {path}")
+    return path
+
+
+def load_profile(user, camera, resolution=None, directory=cfg.CALIBRATION_PROFILE_DIR):
+    """
+    Load the profile of a user and camera.
+
+    Args:
+    user (str): Name of the user.
+    camera (str): Identifier of the camera.
+    resolution (tuple): Expected (width, height) of the frames, a profile made at another resolution is ignored.
+    directory (str): The profile directory.
+
+    Returns:
+    CalibrationProfile: The profile, or None if there is no usable profile.
+    """
+    path = profile_path(user, camera, directory)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = CalibrationProfile.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring unreadable calibration profile {path}: {e}")
+        return None
+
+    if resolution is not None and profile.resolution != tuple(resolution):
+        logging.info(f"Ignoring calibration profile made at {profile.resolution}, the camera runs at {tuple(resolution)}")
+        return None
+    return profile
@@ -6,7 +6,38 @@ load_dotenv()
 
 # API Configuration
 API_KEY = os.environ.get("API_KEY")
-GAZE_DETECTION_URL = f"http://127.0.0.1:9001/gaze/gaze_detection?api_key={API_KEY}"
+GAZE_SERVER_URL = "http://127.0.0.1:9001"
+GAZE_DETECTION_URL = f"{GAZE_SERVER_URL}/gaze/gaze_detection"
+GAZE_REQUEST_TIMEOUT = 10  # seconds
+GAZE_CONNECTION_POOL_SIZE = 4  # Keep-alive connections kept open to the inference server
+GAZE_KEEP_LANDMARKS = False  # Keep the face landmarks of the predictions (nothing draws them)
+ASYNC_GAZE_CLIENT = False  # Keep several frames at the inference server at once, gazes then lag by about one round trip
+GAZE_IN_FLIGHT = 3  # Frames pending at the inference server at once with the asynchronous client
+GAZE_MAX_BUFFERED_RESULTS = 4  # Delivered results waiting for the consumer before the oldest is dropped
+GAZE_LATEST_WINS = True  # Drop a late result when a newer frame completed first
+GAZE_TRANSPORT = "json"  # "json" (base64 image in a JSON body) or "binary" (raw JPEG body, falls back to json)
+JPEG_QUALITY = 95  # Quality of the JPEG frames sent to the inference server (OpenCV default is 95)
+GAZE_GRAYSCALE = False  # Send grayscale frames to the inference server
+
+# Face region tracking
+FACE_ROI_TRACKING = False  # Send only an enlarged box around the last detected face
+FACE_ROI_SCALE = 2.0  # Side of the box relative to the largest side of the last face
+FACE_ROI_MIN_SIZE = 160  # Minimum side of the box in pixels
+FACE_ROI_REFRESH_INTERVAL = 30  # Frames between full-frame detections (0 to only re-acquire when the face is lost)
+
+# Adaptive quality
+ADAPTIVE_QUALITY = False  # Lower the resolution, JPEG quality and detection rate when the inference latency is over target
+QUALITY_TARGET_LATENCY_MS = 80  # Median inference latency the controller stays under
+QUALITY_LADDER = (  # (downscale factor, JPEG quality, frames skipped between detections), best quality first
+    (1.0, 95, 0),
+    (1.0, 80, 0),
+    (0.75, 80, 0),
+    (0.5, 75, 0),
+    (0.5, 70, 1),
+    (0.5, 60, 2),
+)
+QUALITY_WINDOW = 10  # Latency samples per decision, collected again after every change
+QUALITY_UPGRADE_MARGIN = 0.6  # Go back up a level when the median latency is under this fraction of the target
 
 # Physical measurements
 DISTANCE_TO_OBJECT = 500  # mm
@@ -17,10 +48,35 @@ WIDTH_OF_PLAYGROUND = 640
 HEIGHT_OF_PLAYGROUND = 480
 
 # Calibration settings
-CALIBRATION_POINTS = 4  # Number of times to calibrate each corner
+CALIBRATION_POINTS = 4  # Number of times to calibrate each corner in manual mode
+FACE_ALIGNMENT_TIME = 5  # seconds
+CALIBRATION_MODE = "continuous"  # "manual" (spacebar for each sample) or "continuous" (automatic fixation detection)
+CALIBRATION_GRID = 5  # 5 (corners and middle) or 9 (3x3 grid) calibration points
+CALIBRATION_SETTLE_TIME = 0.5  # seconds after a point appears before its samples are used
+CALIBRATION_FIXATION_WINDOW = 10  # consecutive gaze samples a fixation is detected on
+CALIBRATION_FIXATION_DISPERSION = 60  # max x + y spread of the raw gaze samples of a fixation, in pixels
+CALIBRATION_SAMPLES_PER_POINT = 30  # samples collected per point once the fixation is stable
+CALIBRATION_POINT_TIMEOUT = 8  # seconds before a point is calibrated with the samples collected so far
+CALIBRATION_OUTLIER_MAD = 3.0  # samples further than this many scaled median absolute deviations are rejected
+CALIBRATION_RANSAC_THRESHOLD = 40  # reprojection error in pixels of the calibration points kept by RANSAC
+
+# Calibration profiles
+USE_CALIBRATION_PROFILES = True  # Reuse the stored calibration of the user and camera when it is still accurate
+CALIBRATION_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".eye_tracking_game", "profiles")
+PROFILE_USER = os.environ.get("EYE_TRACKING_USER", "default")
+QUICK_VALIDATION_DURATION = 2  # seconds of gaze collected at the validation point
+CALIBRATION_MAX_DRIFT = 60  # pixels between the validation point and the mean gaze before recalibrating
+
+# Motion gating
+MOTION_GATE_ENABLED = False  # Skip gaze detection on frames where the face region barely changed
+MOTION_GATE_THRESHOLD = 4.0  # Mean absolute difference (0-255) of the downsampled face region to run detection
+MOTION_GATE_MAX_SKIPPED_FRAMES = 3  # Maximum number of consecutive skipped frames
+MOTION_GATE_SIZE = 32  # Side of the downsampled face region in pixels
 
 # Gaze point filtering
+GAZE_FILTER = "kalman"  # "none", "moving_average", "median", "adaptive" or "kalman"
 GAZE_HISTORY_WINDOW_SIZE = 5  # Number of points to use for moving average
+ADAPTIVE_FILTER_WINDOW_SIZE = 10  # Number of points to use for the adaptive weighted moving average
 
 # Colors (in BGR format for OpenCV)
 FACE_SQUARE_COLOR = (255, 0, 0)  # Blue
@@ -37,6 +93,55 @@ GAZE_POINT_RADIUS = 15
 CALIBRATION_POINT_RADIUS = 15
 
 NUMBER_OF_TARGETS = 3
+TARGET_RADIUS = 40
+TARGET_HIT_RADIUS = 50  # Distance from the center of a target at which the gaze hits it
+TARGET_MARGIN = 100  # Minimum distance of new targets from the playground borders
+
+# Game mode: "classic" (NUMBER_OF_TARGETS static targets) or "swarm" (SWARM_NUMBER_OF_TARGETS moving targets)
+GAME_MODE = "classic"
+SWARM_NUMBER_OF_TARGETS = 500
+SWARM_TARGET_RADIUS = 6
+SWARM_TARGET_HIT_RADIUS = 15
+SWARM_TARGET_SPEED = 80  # pixels per second
 
 # Webcam settings
 WEBCAM_INDEX = 0  # Use 0 for the default webcam
+
+# Multi-face and multi-camera tracking (multi_track.py)
+MAX_TRACKED_FACES = 4  # Faces tracked at once per camera
+FACE_TRACK_MAX_DISTANCE = 1.0  # Largest move of a face between frames, relative to its height, to keep its ID
+FACE_TRACK_MAX_MISSED = 10  # Frames a face may go undetected before its ID is dropped
+MULTI_CAMERA_INDICES = (0,)  # Webcams driven at once
+MULTI_CAMERA_IN_FLIGHT = 1  # Gaze detection requests in flight per camera
+
+# Session recording and replay
+RECORD_SESSION_DIR = None  # Directory to record frames and gaze predictions to (None to disable)
+REPLAY_SESSION_DIR = None  # Directory of a recorded session to use instead of the webcam (None to disable)
+REPLAY_GAZES = True  # Return the recorded predictions instead of calling the inference server when replaying
+REPLAY_SPEED = None  # Replay speed relative to the recording (None for as fast as possible)
+SESSION_CHUNK_FRAMES = 256  # Frames per memory-mapped chunk file
+
+# Video loop settings
+PIPELINED_VIDEO_LOOP = False  # Run capture, processing and display in separate threads
+PIPELINE_QUEUE_SIZE = 1  # Frames buffered between pipeline stages, older frames are dropped
+
+# Headless processing
+HEADLESS_IN_FLIGHT = 4  # Gaze detection requests in flight at once when processing files
+HEADLESS_PROGRESS_INTERVAL = 5  # seconds between progress reports
+BATCH_WORKERS = None  # Processes used by batch_process.py (None for one per CPU core)
+BATCH_IN_FLIGHT_PER_WORKER = 2  # Gaze detection requests in flight per batch process
+
+# WebSocket gaze server (server/gaze_ws_server.py)
+WS_SERVER_HOST = "127.0.0.1"
+WS_SERVER_PORT = 8765
+WS_INFERENCE_WORKERS = 8  # Requests to the inference server at once, over all sessions
+WS_MAX_SESSIONS = 200  # Connections refused beyond this number of sessions
+WS_MAX_FPS = 30  # Frames per second accepted from each session, extra frames are dropped
+WS_RATE_BURST = 5  # Frames a session may send at once above its rate
+WS_MAX_FRAME_AGE_MS = 250  # Frames waiting longer than this for inference are dropped as stale
+WS_MAX_FRAME_BYTES = 1 << 20  # Largest accepted frame message
+
+# Metrics
+METRICS_JSON_PATH = None  # File rewritten once per second with a JSON snapshot of the metrics (None to disable)
+METRICS_HTTP_PORT = None  # Serve Prometheus metrics on http://127.0.0.1:<port>/metrics (None to disable)
+SHOW_STATS_HUD = False  # Draw frame rate and stage latencies on the displayed frames
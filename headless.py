@@ -0,0 +1,228 @@
+""" Headless processing of recorded video into gaze tracks, without any window or key polling.
+
+Frames are read from a video file, a directory of images or a recorded session, sent to the gaze
+detection server with several requests in flight, and turned into gaze points with the stored
+calibration matrix and the chosen filter. Results are streamed to a JSON lines file, one record
+per frame, in frame order.
+
+Run from the repository root:
+    python headless.py recording.mp4 --matrix ~/.eye_tracking_game/profiles/default__webcam0.json \\
+        --output gazes.jsonl --filter kalman --in-flight 8
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import config as cfg
+from utils.coordinate_transform import calculate_gaze_point_displacements, calculate_gaze_point, transform_coordinates
+from utils.filters import GAZE_FILTERS, create_filter
+from utils.gaze_detection import GazeClient
+from utils.video import flip_frame
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def frame_source(path, fps=30.0):
+    """
+    Yield the frames of a video file, a directory of images or a recorded session.
+
+    Args:
+    path (str): The video file, image directory or session directory.
+    fps (float): Frame rate used for the timestamps of image directories.
+
+    Yields:
+    tuple: (index, timestamp in seconds, frame).
+    """
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json")):
+        from utils.session import SessionReader
+
+        session = SessionReader(path)
+        start = session.timestamps[0] if len(session) else 0.0
+        for index in range(len(session)):
+            yield index, float(session.timestamps[index] - start), session.frame(index)
+        return
+
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is None:
+                logging.warning(f"Skipping unreadable image {name}")
+                continue
+            yield index, index / fps, frame
+        return
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise Exception(f"Could not open video file {path}")
+    try:
+        index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield index, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def load_transformation_matrix(path):
+    """
+    Load a calibration matrix from a calibration profile (JSON) or a NumPy file.
+
+    Returns:
+    numpy.ndarray: The 3x3 transformation matrix.
+    """
+    if path.endswith(".npy"):
+        matrix = np.load(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        matrix = data["transformation_matrix"] if isinstance(data, dict) else data
+    return np.asarray(matrix, dtype=np.float64).reshape(3, 3)
+
+
+def detect_in_flight(frames, client, in_flight):
+    """
+    Send frames for detection with up to in_flight requests at once, yielding results in frame order.
+
+    Args:
+    frames (iterable): (index, timestamp, frame) tuples.
+    client (GazeClient): The client, with a connection pool of at least in_flight connections.
+    in_flight (int): Maximum number of pending requests.
+
+    Yields:
+    tuple: (index, timestamp, frame_shape, gazes, error) where error is None or the raised exception.
+    """
+    def detect(frame):
+        # A failed frame is reported with the results, so one error does not stop the whole file
+        try:
+            return client.detect_gazes(frame), None
+        except Exception as e:
+            return [], e
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="headless") as executor:
+        for index, timestamp, frame in frames:
+            if len(pending) >= in_flight:
+                yield pending_result(pending.popleft())
+            pending.append((index, timestamp, frame.shape, executor.submit(detect, frame)))
+        while pending:
+            yield pending_result(pending.popleft())
+
+
+def pending_result(entry):
+    index, timestamp, frame_shape, future = entry
+    gazes, error = future.result()
+    return index, timestamp, frame_shape, gazes, error
+
+
+def gaze_record(index, timestamp, frame_shape, gazes, transformation_matrix, gaze_filter):
+    """
+    Turn the detection result of a frame into an output record, updating the filter.
+    """
+    record = {"frame": index, "timestamp": timestamp, "face": bool(gazes), "raw": None, "gaze": None}
+    if not gazes:
+        return record
+
+    gaze = gazes[0]
+    image_width, image_height = frame_shape[:2]
+    dx, dy = calculate_gaze_point_displacements(gaze)
+    gaze_x, gaze_y = calculate_gaze_point(dx, dy, image_width, image_height)
+    gaze_x, gaze_y = transform_coordinates(gaze_x, gaze_y, transformation_matrix, image_width, image_height)
+    filtered_x, filtered_y = gaze_filter.update((gaze_x, gaze_y))
+
+    record.update({
+        "raw": [float(gaze_x), float(gaze_y)],
+        "gaze": [float(filtered_x), float(filtered_y)],
+        "yaw": gaze.yaw,
+        "pitch": gaze.pitch,
+    })
+    return record
+
+
+def run(source, transformation_matrix, output_path, filter_name=cfg.GAZE_FILTER, in_flight=cfg.HEADLESS_IN_FLIGHT,
+        flip=True, url=cfg.GAZE_DETECTION_URL, fps=30.0, max_frames=None):
+    """
+    Process a video, image directory or session into a JSON lines gaze track.
+
+    Args:
+    source (str): The video file, image directory or session directory.
+    transformation_matrix (numpy.ndarray): The calibration matrix.
+    output_path (str): The JSON lines output file.
+    filter_name (str): One of GAZE_FILTERS.
+    in_flight (int): Maximum number of pending detection requests.
+    flip (bool): Mirror the frames like the live video loop does, the calibration is made on mirrored frames.
+    url (str): The gaze detection endpoint.
+    fps (float): Frame rate used for the timestamps of image directories.
+    max_frames (int): Stop after this many frames, or None for all of them.
+
+    Returns:
+    dict: Summary with the number of frames, frames with a face, errors, elapsed time and frames per second.
+    """
+    gaze_filter = create_filter(filter_name)
+    frames = frame_source(source, fps)
+    if flip:
+        frames = ((index, timestamp, flip_frame(frame)) for index, timestamp, frame in frames)
+    if max_frames is not None:
+        frames = itertools.islice(frames, max_frames)
+
+    summary = {"frames": 0, "faces": 0, "errors": 0}
+    start = time.perf_counter()
+    last_report = start
+    # Region tracking follows a single stream in order, it does not work with requests in flight,
+    # and offline processing keeps every frame at full quality
+    with GazeClient(url=url, pool_size=in_flight, roi_tracking=False, adaptive_quality=False) as client, \
+            open(output_path, "w", encoding="utf-8") as output:
+        for index, timestamp, frame_shape, gazes, error in detect_in_flight(frames, client, in_flight):
+            if error is not None:
+                summary["errors"] += 1
+                logging.warning(f"Gaze detection failed on frame {index}: {error}")
+
+            record = gaze_record(index, timestamp, frame_shape, gazes, transformation_matrix, gaze_filter)
+            output.write(json.dumps(record) + "\n")
+            summary["frames"] += 1
+            summary["faces"] += record["face"]
+
+            now = time.perf_counter()
+            if now - last_report >= cfg.HEADLESS_PROGRESS_INTERVAL:
+                last_report = now
+                logging.info(f"{summary['frames']} frames, {summary['frames'] / (now - start):.1f} frames/s")
+
+    summary["elapsed"] = time.perf_counter() - start
+    summary["fps"] = summary["frames"] / summary["elapsed"] if summary["elapsed"] > 0 else 0.0
+    logging.info(f"Processed {summary['frames']} frames in {summary['elapsed']:.1f} s ({summary['fps']:.1f} frames/s), "
+                 f"{summary['faces']} with a face, {summary['errors']} errors")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Video file, directory of images or recorded session directory")
+    parser.add_argument("--matrix", required=True, help="Calibration profile (.json) or transformation matrix (.npy)")
+    parser.add_argument("--output", default="gazes.jsonl", help="JSON lines output file")
+    parser.add_argument("--filter", choices=GAZE_FILTERS, default=cfg.GAZE_FILTER, help="Gaze filter")
+    parser.add_argument("--in-flight", type=int, default=cfg.HEADLESS_IN_FLIGHT, help="Requests in flight at once")
+    parser.add_argument("--url", default=cfg.GAZE_DETECTION_URL, help="Gaze detection endpoint")
+    parser.add_argument("--no-flip", action="store_true", help="Do not mirror the frames")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate of image directories")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many frames")
+    args = parser.parse_args()
+
+    # The gaze detection module configures logging at import, only the level is raised here
+    logging.getLogger().setLevel(logging.INFO)
+    summary = run(args.source, load_transformation_matrix(args.matrix), args.output, args.filter, args.in_flight,
+                  not args.no_flip, args.url, args.fps, args.max_frames)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
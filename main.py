@@ -1,40 +1,174 @@
 """ Main """
 
-import cv2
+# Imported first, so the startup breakdown includes the other imports
+from utils.startup import StartupTimer, FirstGazeProbe
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config as cfg
 from config import WIDTH_OF_PLAYGROUND, HEIGHT_OF_PLAYGROUND
-from calibration.align_face import AlignFace
-from calibration.calibrate_points import CalibrateGazeMapping
-from calibration.check_accuracy import CheckGazeAccuracy
-from eye_tracking_game import EyeTrackingGame
 
-def main():
-    """Main function to run the eye tracking game."""
-    cap = cv2.VideoCapture(0)
+# OpenCV, NumPy, requests and the project modules that use them are imported inside the functions,
+# so the camera, the inference server warm-up and the imports can proceed at the same time.
 
-    # Check if the webcam is opened correctly
-    if not cap.isOpened():
-        raise Exception("Could not open video device")
+def open_capture():
+    """Open the webcam, or the recorded session to replay if one is configured."""
+    import cv2
 
+    if cfg.REPLAY_SESSION_DIR:
+        from utils.gaze_detection import set_default_client
+        from utils.session import SessionReader, ReplayCapture, ReplayGazeSource
+
+        session = SessionReader(cfg.REPLAY_SESSION_DIR)
+        if cfg.REPLAY_GAZES:
+            set_default_client(ReplayGazeSource(session))
+        return ReplayCapture(session, speed=cfg.REPLAY_SPEED)
+
+    cap = cv2.VideoCapture(cfg.WEBCAM_INDEX)
     # Set frame size
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH_OF_PLAYGROUND)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT_OF_PLAYGROUND)
+    return cap
+
+def warm_up_gaze_server(timer):
+    """Check that the inference server is up and let it load the model before the first frame."""
+    from utils.gaze_detection import get_default_client
+
+    client = get_default_client()
+    with timer.phase("health check"):
+        info = client.health_check()
+    if info is None:
+        return None
+    with timer.phase("inference warm-up"):
+        return client.warmup((HEIGHT_OF_PLAYGROUND, WIDTH_OF_PLAYGROUND, 3))
 
-    # step 1: check and align face position 
-    aligner = AlignFace(cap)
-    aligner.run()
+def camera_name():
+    """Identifier of the camera in the calibration profiles."""
+    if cfg.REPLAY_SESSION_DIR:
+        return f"replay-{os.path.basename(os.path.normpath(cfg.REPLAY_SESSION_DIR))}"
+    return f"webcam{cfg.WEBCAM_INDEX}"
 
-    # step 2: calibrate gaze mapping with points on screen
+def load_or_calibrate(cap):
+    """
+    Reuse the stored calibration profile if a quick validation shows it is still accurate,
+    otherwise run the full calibration and accuracy check and store the new profile.
+
+    Returns:
+        The transformation matrix for the gaze mapping.
+    """
+    import cv2
+    from calibration.calibrate_points import CalibrateGazeMapping
+    from calibration.check_accuracy import CheckGazeAccuracy, validate_calibration
+    from calibration.profiles import CalibrationProfile, load_profile, save_profile
+
+    resolution = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    camera = camera_name()
+
+    profile = None
+    if cfg.USE_CALIBRATION_PROFILES:
+        profile = load_profile(cfg.PROFILE_USER, camera, resolution)
+
+    if profile is not None:
+        validation_point = (WIDTH_OF_PLAYGROUND // 2, HEIGHT_OF_PLAYGROUND // 2)
+        drift = validate_calibration(cap, profile.transformation_matrix, validation_point)
+        if drift is not None and drift <= cfg.CALIBRATION_MAX_DRIFT:
+            logging.info(f"Using the calibration profile of {profile.user} (drift: {drift:.1f} px)")
+            profile.validated_at = time.time()
+            profile.last_drift = drift
+            save_profile(profile)
+            return profile.transformation_matrix
+        logging.info(f"Calibration drift over {cfg.CALIBRATION_MAX_DRIFT} px, recalibrating")
+
+    # calibrate gaze mapping with points on screen
     calibrator = CalibrateGazeMapping(cap)
     transformation_matrix = calibrator.perform_calibration()
+    if transformation_matrix is None:
+        # findHomography gives no matrix for degenerate points, e.g. the same gaze at every corner
+        raise Exception("Calibration failed: no gaze mapping fits the calibration points, please recalibrate")
 
-    # step 3: check calibration accuracy
+    # check calibration accuracy
     target_points = [(100, 100), (WIDTH_OF_PLAYGROUND - 100, HEIGHT_OF_PLAYGROUND - 100)]
     accuracy_checker = CheckGazeAccuracy(cap, transformation_matrix, target_points)
-    accuracy_checker.run()
+    accuracy = accuracy_checker.run()
+
+    if cfg.USE_CALIBRATION_PROFILES:
+        save_profile(CalibrationProfile(cfg.PROFILE_USER, camera, transformation_matrix, calibrator.src_points,
+                                        accuracy, resolution))
+    return transformation_matrix
+
+def main():
+    """Main function to run the eye tracking game."""
+    timer = StartupTimer()
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as executor:
+        camera = executor.submit(timer.timed, "open camera", open_capture)
+        warm_up = None
+        if not (cfg.REPLAY_SESSION_DIR and cfg.REPLAY_GAZES):
+            warm_up = executor.submit(timer.timed, "gaze server", warm_up_gaze_server, timer)
+
+        with timer.phase("imports"):
+            import cv2
+            from calibration.align_face import AlignFace
+            from eye_tracking_game import EyeTrackingGame
+            from utils.gaze_detection import get_default_client, set_default_client
+            from utils.metrics import registry, start_http_exporter
+
+        cap = camera.result()
+        if warm_up is not None and warm_up.result() is None:
+            logging.warning("The gaze server is not ready, the first frames may be slow")
+
+    # Check if the webcam is opened correctly
+    if not cap.isOpened():
+        raise Exception("Could not open video device")
+
+    if cfg.METRICS_HTTP_PORT:
+        start_http_exporter(registry, port=cfg.METRICS_HTTP_PORT)
+
+    in_flight_source = None
+    if cfg.ASYNC_GAZE_CLIENT and not (cfg.REPLAY_SESSION_DIR and cfg.REPLAY_GAZES):
+        from utils.async_gaze_client import InFlightGazeSource
+
+        # Wrapped before the recorder, so the session stores the gazes the game actually used
+        in_flight_source = InFlightGazeSource(get_default_client())
+        set_default_client(in_flight_source)
+
+    recorder = None
+    if cfg.RECORD_SESSION_DIR:
+        from utils.session import SessionRecorder
+
+        recorder = SessionRecorder(cfg.RECORD_SESSION_DIR)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap = recorder.wrap_capture(cap)
+        set_default_client(recorder.wrap_gaze_source(get_default_client()))
+
+    # Report the startup breakdown once the first gaze is detected, then stop probing
+    gaze_source = get_default_client()
+
+    def on_first_gaze():
+        set_default_client(gaze_source)
+        timer.report()
+
+    set_default_client(FirstGazeProbe(timer, gaze_source, on_first_gaze))
+
+    try:
+        # step 1: check and align face position
+        aligner = AlignFace(cap)
+        aligner.run()
+
+        # steps 2 and 3: calibrate gaze mapping and check its accuracy, unless the stored profile is still accurate
+        transformation_matrix = load_or_calibrate(cap)
 
-    # step 4: detect and track eyes with filtering
-    eyes_tracker = EyeTrackingGame(cap, transformation_matrix)
-    eyes_tracker.run()
+        # step 4: detect and track eyes with filtering
+        eyes_tracker = EyeTrackingGame(cap, transformation_matrix)
+        eyes_tracker.run()
+    finally:
+        if in_flight_source is not None:
+            in_flight_source.close()
+        if recorder is not None:
+            recorder.close(fps=fps)
+        if cfg.METRICS_JSON_PATH:
+            registry.write_json(cfg.METRICS_JSON_PATH)
 
 
 if __name__ == "__main__":
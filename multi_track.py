@@ -0,0 +1,157 @@
+""" Track the gaze of several people on several cameras at once.
+
+Every camera is read in its own thread and its frames are sent to the gaze detection server over
+one shared client. Each face gets a stable ID, its own filter and, with --users, its own stored
+calibration profile: face IDs are given in order of appearance from left to right, and the n-th
+face uses the profile of the n-th user for that camera.
+
+Run from the repository root:
+    python multi_track.py --cameras 0 1 --users alice bob --filter kalman
+"""
+
+import argparse
+import json
+import logging
+import cv2
+import config as cfg
+from calibration.profiles import load_profile
+from utils.face_tracker import FaceTracker
+from utils.filters import GAZE_FILTERS
+from utils.gaze_detection import GazeClient
+from utils.multi_camera import CameraStream, multi_camera_loop
+from utils.visualization import draw_face_square, draw_gaze_point
+
+
+def open_camera(source):
+    """
+    Open a webcam by index, or a video file.
+
+    Returns:
+    tuple: (camera name, capture).
+    """
+    if source.isdigit():
+        cap = cv2.VideoCapture(int(source))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, cfg.WIDTH_OF_PLAYGROUND)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, cfg.HEIGHT_OF_PLAYGROUND)
+        name = f"webcam{source}"
+    else:
+        cap = cv2.VideoCapture(source)
+        name = source
+    if not cap.isOpened():
+        raise Exception(f"Could not open video device {source}")
+    return name, cap
+
+
+def face_calibrations(users, camera, cap):
+    """
+    Load the calibration profile of each user for a camera.
+
+    Returns:
+    dict: Transformation matrix by face ID, for the users with a usable profile.
+    """
+    resolution = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    calibrations = {}
+    for face_id, user in enumerate(users):
+        profile = load_profile(user, camera, resolution)
+        if profile is None:
+            logging.warning(f"No calibration profile of {user} for {camera}, face {face_id} is not calibrated")
+            continue
+        calibrations[face_id] = profile.transformation_matrix
+    return calibrations
+
+
+def draw_faces(frame, faces):
+    """
+    Draw the box, ID and gaze point of the faces detected in the frame.
+    """
+    for face in faces:
+        if not face.visible:
+            continue
+        draw_face_square(frame, face.gaze)
+        box = face.gaze.face
+        label_origin = (int(box.x - box.width / 2), int(box.y - box.height / 2) - 10)
+        cv2.putText(frame, str(face.face_id), label_origin, cv2.FONT_HERSHEY_SIMPLEX, 1.0, cfg.FACE_SQUARE_COLOR, 2)
+        if face.point is not None:
+            draw_gaze_point(frame, tuple(map(int, face.point)))
+    return frame
+
+
+def run(sources, users=(), filter_name=cfg.GAZE_FILTER, url=cfg.GAZE_DETECTION_URL,
+        in_flight=cfg.MULTI_CAMERA_IN_FLIGHT, display=True, output_path=None, max_frames=None):
+    """
+    Track the faces of every camera until "q" is pressed or the video files end.
+
+    Args:
+    sources (list): Webcam indices or video files.
+    users (list): User of the calibration profile of each face ID.
+    filter_name (str): One of GAZE_FILTERS.
+    url (str): The gaze detection endpoint.
+    in_flight (int): Maximum number of pending detection requests per camera.
+    display (bool): Show the cameras side by side.
+    output_path (str): JSON lines file of the gaze point of every face in every frame, or None.
+    max_frames (int): Stop after this many processed frames over all cameras, or None.
+
+    Returns:
+    dict: Number of processed frames per camera.
+    """
+    # Cameras are told apart by name, the same source twice would share a tracker
+    normalized = [str(int(source)) if source.isdigit() else source for source in sources]
+    if len(set(normalized)) != len(normalized):
+        raise ValueError(f"Each camera or video file can be given only once: {' '.join(sources)}")
+
+    streams, trackers = [], {}
+    for source in sources:
+        name, cap = open_camera(source)
+        # Every frame of a video file is processed, webcams only send their latest frame
+        streams.append(CameraStream(name, cap, live=source.isdigit()))
+        trackers[name] = FaceTracker(calibrations=face_calibrations(users, name, cap), filter_name=filter_name)
+
+    output = open(output_path, "w", encoding="utf-8") if output_path else None
+    frame_indices = dict.fromkeys(trackers, 0)
+
+    def on_result(stream, frame, gazes):
+        faces = trackers[stream.name].update(gazes, frame.shape)
+        if output is not None:
+            for face in faces:
+                if face.visible and face.point is not None:
+                    output.write(json.dumps({"camera": stream.name, "frame": frame_indices[stream.name],
+                                             "face_id": face.face_id,
+                                             "gaze": [float(face.point[0]), float(face.point[1])]}) + "\n")
+        frame_indices[stream.name] += 1
+        return draw_faces(frame, faces) if display else frame
+
+    # Region tracking and skipped frames follow a single stream, they do not work with a shared client
+    client = GazeClient(url=url, pool_size=max(len(streams) * in_flight, cfg.GAZE_CONNECTION_POOL_SIZE),
+                        roi_tracking=False, adaptive_quality=False)
+    try:
+        return multi_camera_loop(streams, client, on_result, display_name="Eye Tracking - Multi Camera",
+                                 in_flight=in_flight, display=display, max_frames=max_frames)
+    finally:
+        client.close()
+        for stream in streams:
+            stream.cap.release()
+        if output is not None:
+            output.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", nargs="+", default=[str(index) for index in cfg.MULTI_CAMERA_INDICES],
+                        help="Webcam indices or video files")
+    parser.add_argument("--users", nargs="*", default=[], help="User of the calibration profile of each face ID")
+    parser.add_argument("--filter", choices=GAZE_FILTERS, default=cfg.GAZE_FILTER, help="Gaze filter of each face")
+    parser.add_argument("--url", default=cfg.GAZE_DETECTION_URL, help="Gaze detection endpoint")
+    parser.add_argument("--in-flight", type=int, default=cfg.MULTI_CAMERA_IN_FLIGHT,
+                        help="Requests in flight per camera")
+    parser.add_argument("--output", help="JSON lines file of the gaze points of every face")
+    parser.add_argument("--no-display", action="store_true", help="Do not open a window")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many frames over all cameras")
+    args = parser.parse_args()
+
+    processed = run(args.cameras, args.users, args.filter, args.url, args.in_flight, not args.no_display, args.output,
+                    args.max_frames)
+    print(json.dumps(processed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+""" WebSocket gaze server, for playing in a browser: each connection streams webcam frames and gets gaze points back.
+
+Every connection is a session with its own calibration, homography and Kalman filter. The
+browser sends JPEG frames as binary messages and JSON control messages as text:
+
+    {"type": "calibration_start", "width": 1920, "height": 1080}    forget the previous calibration
+    {"type": "calibration_point", "x": 0, "y": 0}                   the user now looks at this screen point
+    {"type": "calibration_finish"}                                  fit the homography on the collected samples
+    {"type": "reset"}                                               back to uncalibrated gaze points
+
+and gets one JSON text message per processed frame:
+
+    {"type": "gaze", "frame": 12, "x": 310, "y": 188, "face": true, "calibrated": true, "latency_ms": 41.5}
+
+The width and height of calibration_start are the size of the screen the calibration points
+are on, calibrated gaze points are kept inside it. Without them, the screen is assumed to end
+as far from the last calibration point as the first one is from the top left corner.
+Uncalibrated gaze points are in camera frame coordinates.
+
+Frames are numbered in the order they arrive, from 0. Frames over the rate limit of the
+session are dropped, and a frame still waiting for inference when a newer one arrives is
+replaced by it, so a slow server never builds a backlog. Frames are only sent for inference
+when a worker is free, and the ones that waited longer than WS_MAX_FRAME_AGE_MS by then are
+dropped as stale. Dropped frames get no reply.
+
+All sessions run on one event loop; the blocking inference requests go to a fixed pool of
+threads shared by all sessions, with pooled keep-alive connections to the inference server.
+
+Run from the repository root:
+    python -m server.gaze_ws_server --port 8765 --url http://127.0.0.1:9001/gaze/gaze_detection
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import websockets
+import config as cfg
+from calibration.calibrate_points import fit_gaze_mapping, raw_gaze_point, robust_mean
+from utils.face_tracker import FaceTracker
+from utils.gaze_detection import GazeClient
+from utils.jpeg import jpeg_size
+from utils.metrics import registry
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing rate events per second on average, with bursts of up to burst events.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Return True if an event is allowed now, and count it.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class GazeSession:
+    """
+    State of one browser connection.
+
+    Attributes:
+        session_id (int): Number of the connection, for the logs.
+        tracker (FaceTracker): Filter and calibration of the gaze of the player, the first face of the frames.
+        rate_limit (TokenBucket): Limits the frames accepted from the browser.
+        frames_received (int): Frames received, including the dropped ones.
+        frames_processed (int): Frames sent for gaze detection.
+        frames_dropped (int): Frames dropped by the rate limit, replaced by a newer frame or stale.
+        pending (tuple): (frame number, arrival time, JPEG image) of the next frame to process, or None.
+        calibration_targets (list): Screen points of the calibration in progress.
+        calibration_samples (list): Raw gaze points collected for each calibration target.
+        screen_size (tuple): (width, height) of the screen of the calibration, or None.
+    """
+
+    def __init__(self, session_id, max_fps=cfg.WS_MAX_FPS, burst=cfg.WS_RATE_BURST):
+        self.session_id = session_id
+        self.tracker = FaceTracker(max_faces=1)
+        self.rate_limit = TokenBucket(max_fps, burst)
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.pending = None
+        self.frame_ready = asyncio.Event()
+        self.calibration_targets = []
+        self.calibration_samples = []
+        self.screen_size = None
+        self._point_start = None
+
+    @property
+    def calibrated(self):
+        return self.tracker.transformation_matrix is not None
+
+    @property
+    def calibrating(self):
+        return self._point_start is not None
+
+    def start_calibration(self, screen_size=None):
+        """
+        Forget the previous calibration and start a new one on a screen of screen_size (width, height).
+        """
+        if screen_size is not None and min(screen_size) <= 0:
+            raise ValueError(f"Invalid screen size: {screen_size}")
+        self.calibration_targets = []
+        self.calibration_samples = []
+        self._point_start = None
+        self.reset()
+        self.screen_size = screen_size
+
+    def add_calibration_point(self, x, y):
+        """
+        Start collecting the samples of a new calibration point.
+        """
+        self.calibration_targets.append((float(x), float(y)))
+        self.calibration_samples.append([])
+        self._point_start = time.monotonic()
+
+    def add_calibration_sample(self, point):
+        # Samples of the first moments are skipped, while the eyes move to the point
+        if time.monotonic() - self._point_start >= cfg.CALIBRATION_SETTLE_TIME:
+            self.calibration_samples[-1].append(point)
+
+    def finish_calibration(self):
+        """
+        Fit the homography from the raw gaze points to the screen on the points with samples.
+
+        Returns:
+        dict: Number of points used and indices of the points rejected by RANSAC.
+        """
+        self._point_start = None
+        indices = [index for index, samples in enumerate(self.calibration_samples) if samples]
+        if len(indices) < 4:
+            raise ValueError("Not enough calibration points with a detected gaze")
+
+        src_points = np.array([robust_mean(self.calibration_samples[index])[0] for index in indices], dtype=np.float32)
+        dst_points = np.array([self.calibration_targets[index] for index in indices], dtype=np.float32)
+        transformation_matrix, inliers = fit_gaze_mapping(src_points, dst_points)
+        if self.screen_size is None:
+            # The calibration points are assumed to have the same margin on both sides of the screen
+            targets = np.array(self.calibration_targets)
+            self.screen_size = tuple(int(np.ceil(max(low + high, high + 1)))
+                                     for low, high in zip(targets.min(axis=0), targets.max(axis=0)))
+        # The filter state is in uncalibrated coordinates, it starts over
+        self.tracker.reset()
+        self.tracker.transformation_matrix = transformation_matrix
+        return {"points": len(indices), "rejected": [index for index, kept in zip(indices, inliers) if not kept],
+                "screen": list(self.screen_size)}
+
+    def reset(self):
+        self.tracker.reset()
+        self.tracker.transformation_matrix = None
+        self.screen_size = None
+
+
+class GazeWebSocketServer:
+    """
+    Serves gaze sessions over WebSocket, see the module documentation for the protocol.
+
+    Attributes:
+        client (GazeClient): Shared client of the inference server.
+        max_sessions (int): Connections refused beyond this number of sessions.
+        max_fps (float): Frames per second accepted from each session.
+        burst (int): Frames a session may send at once above its rate.
+        max_frame_age_ms (float): Frames waiting longer than this for inference are dropped.
+        sessions (dict): The open sessions by ID.
+    """
+
+    def __init__(self, client, workers=cfg.WS_INFERENCE_WORKERS, max_sessions=cfg.WS_MAX_SESSIONS,
+                 max_fps=cfg.WS_MAX_FPS, burst=cfg.WS_RATE_BURST, max_frame_age_ms=cfg.WS_MAX_FRAME_AGE_MS):
+        self.client = client
+        self.max_sessions = max_sessions
+        self.max_fps = max_fps
+        self.burst = burst
+        self.max_frame_age_ms = max_frame_age_ms
+        self.sessions = {}
+        # Shared by all sessions, so the number of threads does not grow with the connections
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ws-inference")
+        self._workers = asyncio.Semaphore(workers)
+        self._session_ids = itertools.count()
+        self._sessions_gauge = registry.gauge("ws_sessions", help_text="Open WebSocket sessions")
+        self._latency = registry.histogram("ws_frame_latency_ms",
+                                           help_text="Time from the arrival of a frame to its gaze point")
+        self._rate_limited = registry.counter("ws_rate_limited_frames_total",
+                                              help_text="Frames dropped by the per-session rate limit")
+        self._stale = registry.counter("ws_stale_frames_total",
+                                       help_text="Frames dropped because a newer frame arrived or they waited too long")
+
+    async def handle(self, websocket):
+        """
+        Serve one connection until it is closed.
+        """
+        if len(self.sessions) >= self.max_sessions:
+            await websocket.close(1013, "Too many sessions")
+            return
+
+        session = GazeSession(next(self._session_ids), self.max_fps, self.burst)
+        self.sessions[session.session_id] = session
+        self._sessions_gauge.set(len(self.sessions))
+        logging.info(f"Session {session.session_id} opened ({len(self.sessions)} open)")
+        processor = asyncio.create_task(self._process_frames(session, websocket))
+        try:
+            async for message in websocket:
+                if isinstance(message, bytes):
+                    self._receive_frame(session, message)
+                else:
+                    await self._handle_control(session, websocket, message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            processor.cancel()
+            del self.sessions[session.session_id]
+            self._sessions_gauge.set(len(self.sessions))
+            logging.info(f"Session {session.session_id} closed after {session.frames_received} frames "
+                         f"({session.frames_processed} processed, {session.frames_dropped} dropped)")
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _receive_frame(self, session, image):
+        frame_number = session.frames_received
+        session.frames_received += 1
+        if not session.rate_limit.take():
+            session.frames_dropped += 1
+            self._rate_limited.inc()
+            return
+        if session.pending is not None:
+            # Only the newest frame is worth processing
+            session.frames_dropped += 1
+            self._stale.inc()
+        session.pending = (frame_number, time.monotonic(), image)
+        session.frame_ready.set()
+
+    async def _process_frames(self, session, websocket):
+        loop = asyncio.get_running_loop()
+        while True:
+            await session.frame_ready.wait()
+            # Frames wait for a worker here rather than in the executor queue, where newer frames could not
+            # replace them, and the age is checked once a worker is free
+            async with self._workers:
+                session.frame_ready.clear()
+                frame_number, arrival_time, image = session.pending
+                session.pending = None
+
+                if (time.monotonic() - arrival_time) * 1000 > self.max_frame_age_ms:
+                    session.frames_dropped += 1
+                    self._stale.inc()
+                    continue
+
+                image_size = jpeg_size(image)
+                if image_size is None:
+                    reply = {"type": "error", "frame": frame_number, "message": "Not a JPEG image"}
+                else:
+                    session.frames_processed += 1
+                    try:
+                        gazes = await loop.run_in_executor(self._executor, self.client.detect_encoded, image)
+                        reply = self._gaze_message(session, frame_number, arrival_time, gazes, image_size)
+                    except Exception as e:
+                        logging.warning(f"Gaze detection failed for session {session.session_id}: {e}")
+                        reply = {"type": "error", "frame": frame_number, "message": "Gaze detection failed"}
+            await self._send(websocket, reply)
+
+    def _gaze_message(self, session, frame_number, arrival_time, gazes, image_size):
+        width, height = image_size
+        frame_shape = (height, width)
+        if session.calibrating and gazes:
+            session.add_calibration_sample(raw_gaze_point(gazes[0], frame_shape))
+
+        # The camera frame only gives the raw gaze points, the calibrated ones are on the browser screen
+        faces = session.tracker.update(gazes, frame_shape, session.screen_size)
+        latency_ms = (time.monotonic() - arrival_time) * 1000
+        self._latency.observe(latency_ms)
+        message = {"type": "gaze", "frame": frame_number, "face": bool(faces and faces[0].visible),
+                   "calibrated": session.calibrated, "latency_ms": round(latency_ms, 1)}
+        if faces and faces[0].point is not None:
+            message["x"], message["y"] = int(faces[0].point[0]), int(faces[0].point[1])
+        return message
+
+    async def _handle_control(self, session, websocket, message):
+        try:
+            command = json.loads(message)
+            kind = command["type"]
+            if kind == "calibration_start":
+                screen_size = (int(command["width"]), int(command["height"])) if "width" in command else None
+                session.start_calibration(screen_size)
+                reply = {"type": "calibration_started"}
+            elif kind == "calibration_point":
+                session.add_calibration_point(command["x"], command["y"])
+                reply = {"type": "calibration_point", "index": len(session.calibration_targets) - 1}
+            elif kind == "calibration_finish":
+                reply = {"type": "calibrated", **session.finish_calibration()}
+                logging.info(f"Session {session.session_id} calibrated on {reply['points']} points")
+            elif kind == "reset":
+                session.reset()
+                reply = {"type": "reset"}
+            else:
+                reply = {"type": "error", "message": f"Unknown message type: {kind}"}
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {"type": "error", "message": f"Invalid control message: {e}"}
+        await self._send(websocket, reply)
+
+    @staticmethod
+    async def _send(websocket, document):
+        await websocket.send(json.dumps(document))
+
+
+async def serve(host=cfg.WS_SERVER_HOST, port=cfg.WS_SERVER_PORT, url=cfg.GAZE_DETECTION_URL,
+                workers=cfg.WS_INFERENCE_WORKERS, stop=None, **kwargs):
+    """
+    Run the WebSocket server until the stop future is done, or forever.
+
+    Args:
+    host (str): Interface to listen on.
+    port (int): Port to listen on.
+    url (str): The gaze detection endpoint.
+    workers (int): Requests to the inference server at once.
+    stop (asyncio.Future): Stops the server when done, or None.
+    kwargs: Other GazeWebSocketServer settings.
+    """
+    client = GazeClient(url=url, pool_size=workers, roi_tracking=False, adaptive_quality=False)
+    gaze_server = GazeWebSocketServer(client, workers, **kwargs)
+    try:
+        async with websockets.serve(gaze_server.handle, host, port, max_size=cfg.WS_MAX_FRAME_BYTES):
+            logging.info(f"Gaze WebSocket server listening on ws://{host}:{port}")
+            await (stop if stop is not None else asyncio.get_running_loop().create_future())
+    finally:
+        gaze_server.close()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=cfg.WS_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=cfg.WS_SERVER_PORT)
+    parser.add_argument("--url", default=cfg.GAZE_DETECTION_URL, help="Gaze detection endpoint")
+    parser.add_argument("--workers", type=int, default=cfg.WS_INFERENCE_WORKERS,
+                        help="Requests to the inference server at once")
+    parser.add_argument("--max-sessions", type=int, default=cfg.WS_MAX_SESSIONS)
+    parser.add_argument("--max-fps", type=float, default=cfg.WS_MAX_FPS, help="Frames per second accepted per session")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.url, args.workers, max_sessions=args.max_sessions,
+                          max_fps=args.max_fps))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+""" Stand-in for the Roboflow gaze detection server, to benchmark and load-test the client side without a GPU.
+
+It answers POST /gaze/gaze_detection with the same response shape as the inference container
+([{"predictions": [{"face": {...}, "yaw": ..., "pitch": ...}], "time": ...}]), accepting both the
+base64 JSON body and a raw JPEG body, and GET /info as a health check.
+
+Run from the repository root:
+    python -m server.stub_gaze_server --port 9001 --latency-ms 40 --jitter-ms 10 --distribution normal
+"""
+
+import argparse
+import base64
+import binascii
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.jpeg import jpeg_size
+
+DEFAULT_IMAGE_SIZE = (640, 480)
+FACE_SIZE = 200  # pixels
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal")
+
+
+class LatencyModel:
+    """
+    Draw simulated inference latencies from a distribution.
+
+    Attributes:
+        distribution (str): One of LATENCY_DISTRIBUTIONS.
+        mean_s (float): Mean latency in seconds.
+        jitter_s (float): Spread of the latency in seconds (half-width for uniform, standard deviation otherwise).
+    """
+
+    def __init__(self, distribution="constant", mean_ms=30.0, jitter_ms=0.0, rng=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean_s = mean_ms / 1000
+        self.jitter_s = jitter_ms / 1000
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        if self.distribution == "uniform":
+            latency = self.rng.uniform(self.mean_s - self.jitter_s, self.mean_s + self.jitter_s)
+        elif self.distribution == "normal":
+            latency = self.rng.gauss(self.mean_s, self.jitter_s)
+        elif self.distribution == "lognormal" and self.mean_s > 0 and self.jitter_s > 0:
+            # Parameters of the underlying normal distribution matching the requested mean and deviation
+            sigma2 = math.log(1 + (self.jitter_s / self.mean_s) ** 2)
+            latency = self.rng.lognormvariate(math.log(self.mean_s) - sigma2 / 2, math.sqrt(sigma2))
+        else:
+            latency = self.mean_s
+        return max(0.0, latency)
+
+
+class SyntheticGazes:
+    """
+    Generate predictions with faces spread around the center of the image and slowly drifting yaw and pitch.
+    """
+
+    def __init__(self, faces=1, no_face_rate=0.0, rng=None):
+        self.faces = faces
+        self.no_face_rate = no_face_rate
+        self.rng = rng or random.Random()
+        self.start_time = time.time()
+
+    def predictions(self, image_size):
+        if self.rng.random() < self.no_face_rate:
+            return []
+
+        width, height = image_size
+        elapsed = time.time() - self.start_time
+        # A fixed face size, so cropped uploads get the same face as the full frame
+        face_size = min(FACE_SIZE / math.sqrt(max(1, self.faces)), 0.8 * min(width, height))
+        predictions = []
+        for i in range(self.faces):
+            # Spread additional faces horizontally across the image
+            x = width * (i + 1) / (self.faces + 1)
+            y = height / 2
+            predictions.append(gaze_prediction(x, y, face_size, yaw=0.3 * math.sin(elapsed + i),
+                                               pitch=0.2 * math.sin(0.7 * elapsed + i)))
+        return predictions
+
+
+def gaze_prediction(x, y, face_size, yaw, pitch):
+    """
+    Build one prediction in the format returned by the inference server.
+    """
+    half = face_size / 2
+    landmarks = [{"x": x - half / 2, "y": y - half / 3}, {"x": x + half / 2, "y": y - half / 3},
+                 {"x": x, "y": y}, {"x": x, "y": y + half / 2},
+                 {"x": x - half, "y": y}, {"x": x + half, "y": y}]
+    return {
+        "face": {
+            "x": x, "y": y, "width": face_size, "height": face_size,
+            "confidence": 0.9, "class": "face", "class_confidence": None, "class_id": 0, "tracker_id": None,
+            "landmarks": landmarks,
+        },
+        "yaw": yaw,
+        "pitch": pitch,
+    }
+
+
+def load_recorded_responses(path):
+    """
+    Load recorded predictions, one JSON document per line.
+
+    Each line can be a full server response ([{"predictions": [...]}]), a single image result
+    ({"predictions": [...]}) or a bare list of predictions.
+
+    Returns:
+    list: One list of predictions per recorded frame.
+    """
+    recorded = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            document = json.loads(line)
+            if isinstance(document, list) and document and isinstance(document[0], dict) and "predictions" in document[0]:
+                document = document[0]
+            if isinstance(document, dict):
+                document = document.get("predictions", [])
+            recorded.append(document)
+    return recorded
+
+
+class StubGazeServer(ThreadingHTTPServer):
+    """
+    HTTP server answering gaze detection requests with synthetic or recorded predictions.
+
+    Attributes:
+        latency (LatencyModel): Simulated inference latency.
+        error_rate (float): Fraction of requests answered with an HTTP 500.
+        json_only (bool): Reject raw image bodies like servers that only accept JSON.
+        requests_served (int): Number of answered detection requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency, gazes, error_rate=0.0, concurrency=1, json_only=False, replay=None,
+                 rng=None):
+        super().__init__(address, StubGazeRequestHandler)
+        self.latency = latency
+        self.gazes = gazes
+        self.error_rate = error_rate
+        self.json_only = json_only
+        self.rng = rng or random.Random()
+        self.requests_served = 0
+        # Models on a single GPU process a limited number of images at once
+        self.workers = threading.BoundedSemaphore(concurrency)
+        self._replay = itertools.cycle(replay) if replay else None
+        self._lock = threading.Lock()
+
+    def next_predictions(self, image_size):
+        with self._lock:
+            self.requests_served += 1
+            if self._replay is not None:
+                return json.loads(json.dumps(next(self._replay)))
+            return self.gazes.predictions(image_size)
+
+    def should_fail(self):
+        with self._lock:
+            return self.rng.random() < self.error_rate
+
+
+class StubGazeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without this the client waits for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/info":
+            self.send_json(200, {"name": "Stub gaze detection server", "version": "stub"})
+        else:
+            self.send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.split("?")[0] != "/gaze/gaze_detection":
+            self.send_json(404, {"message": "Not found"})
+            return
+
+        image = self.read_image(body)
+        if image is None:
+            return
+
+        start = time.perf_counter()
+        with self.server.workers:
+            time.sleep(self.server.latency.sample())
+        if self.server.should_fail():
+            self.send_json(500, {"message": "Simulated inference error"})
+            return
+
+        image_size = jpeg_size(image) or DEFAULT_IMAGE_SIZE
+        predictions = self.server.next_predictions(image_size)
+        self.send_json(200, [{"predictions": predictions, "time": time.perf_counter() - start}])
+
+    def read_image(self, body):
+        """
+        Return the encoded image sent in the request, or None after answering with an error.
+        """
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("image/") or content_type == "application/octet-stream":
+            if self.server.json_only:
+                self.send_json(415, {"message": "Only JSON requests are supported"})
+                return None
+            return body
+
+        try:
+            payload = json.loads(body)
+            return base64.b64decode(payload["image"]["value"])
+        except (ValueError, KeyError, TypeError, binascii.Error):
+            self.send_json(422, {"message": "Invalid request body"})
+            return None
+
+    def send_json(self, status, document):
+        encoded = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def create_server(host="127.0.0.1", port=9001, distribution="constant", latency_ms=30.0, jitter_ms=0.0,
+                  error_rate=0.0, faces=1, no_face_rate=0.0, concurrency=1, json_only=False, replay_path=None,
+                  seed=None):
+    """
+    Create a stub server with the given behaviour. Use port 0 to pick a free port.
+
+    Returns:
+    StubGazeServer: The server, not yet serving.
+    """
+    rng = random.Random(seed)
+    replay = load_recorded_responses(replay_path) if replay_path else None
+    return StubGazeServer((host, port), LatencyModel(distribution, latency_ms, jitter_ms, rng),
+                          SyntheticGazes(faces, no_face_rate, rng), error_rate=error_rate, concurrency=concurrency,
+                          json_only=json_only, replay=replay, rng=rng)
+
+
+def start_in_background(**kwargs):
+    """
+    Create a stub server and serve it from a daemon thread.
+
+    Returns:
+    tuple: (server, url) where url is the gaze detection endpoint. Call server.shutdown() to stop it.
+    """
+    kwargs.setdefault("port", 0)
+    server = create_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="stub-gaze-server", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/gaze/gaze_detection"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="constant",
+                        help="Distribution of the simulated inference latency")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Mean inference latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Spread of the inference latency")
+    parser.add_argument("--concurrency", type=int, default=1, help="Images processed at the same time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--faces", type=int, default=1, help="Faces returned per image")
+    parser.add_argument("--no-face-rate", type=float, default=0.0, help="Fraction of images without faces")
+    parser.add_argument("--json-only", action="store_true", help="Reject raw image bodies with HTTP 415")
+    parser.add_argument("--replay", help="JSON lines file of recorded predictions to serve in a loop")
+    parser.add_argument("--seed", type=int, help="Seed for repeatable latencies, errors and faces")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(args.host, args.port, args.distribution, args.latency_ms, args.jitter_ms, args.error_rate,
+                           args.faces, args.no_face_rate, args.concurrency, args.json_only, args.replay, args.seed)
+    logging.info(f"Stub gaze server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import threading
+import time
+import numpy as np
+import pytest
+from utils.async_gaze_client import InFlightGazeSource
+
+
+class SlowSource:
+    def detect_gazes(self, frame):
+        time.sleep(0.05)
+        return []
+
+
+@pytest.mark.parametrize("latest_wins", [False, True])
+def test_close_returns_with_more_frames_in_flight_than_buffered_results(latest_wins):
+    source = InFlightGazeSource(SlowSource(), in_flight=6, max_results=2, latest_wins=latest_wins)
+    for _ in range(6):
+        source.detect_gazes(np.zeros((4, 4, 3), dtype=np.uint8))
+
+    closing = threading.Thread(target=source.close, daemon=True)
+    closing.start()
+    closing.join(timeout=5)
+    assert not closing.is_alive()
@@ -0,0 +1,53 @@
+import time
+import pytest
+from server.gaze_ws_server import GazeSession, GazeWebSocketServer
+from utils.gaze_record import FaceBox, GazeRecord
+
+CAMERA_SIZE = (640, 480)
+# Raw gaze points of a 640x480 camera frame and the points of a 1920x1080 screen they were looked at
+RAW_POINTS = [(140, 220), (340, 220), (140, 420), (340, 420), (240, 320)]
+SCREEN_POINTS = [(100, 100), (1820, 100), (100, 980), (1820, 980), (960, 540)]
+
+
+def calibrated_session(screen_size):
+    session = GazeSession(0)
+    session.start_calibration(screen_size)
+    for raw_point, screen_point in zip(RAW_POINTS, SCREEN_POINTS):
+        session.add_calibration_point(*screen_point)
+        session.calibration_samples[-1].extend([raw_point] * 5)
+    session.finish_calibration()
+    return session
+
+
+def gaze_point(session, yaw, pitch):
+    server = GazeWebSocketServer(client=None, workers=1)
+    try:
+        gazes = [GazeRecord(yaw, pitch, FaceBox(320, 240, 150, 150))]
+        message = server._gaze_message(session, 0, time.monotonic(), gazes, CAMERA_SIZE)
+    finally:
+        server.close()
+    return message["x"], message["y"]
+
+
+@pytest.mark.parametrize("screen_size", [(1920, 1080), None])
+def test_calibrated_points_are_on_the_browser_screen(screen_size):
+    session = calibrated_session(screen_size)
+    assert session.screen_size == (1920, 1080)
+
+    # Looking straight ahead is the raw point of the center calibration point
+    x, y = gaze_point(session, 0.0, 0.0)
+    assert abs(x - 960) <= 2 and abs(y - 540) <= 2
+
+    # Towards the bottom right corner, outside the camera frame but inside the screen
+    x, y = gaze_point(calibrated_session(screen_size), -0.3, -0.3)
+    assert CAMERA_SIZE[0] < x < 1920 and CAMERA_SIZE[1] < y < 1080
+
+
+def test_calibrated_points_are_clamped_to_the_screen():
+    x, y = gaze_point(calibrated_session((1280, 720)), -0.3, -0.3)
+    assert (x, y) == (1279, 719)
+
+
+def test_invalid_screen_size_is_rejected():
+    with pytest.raises(ValueError):
+        GazeSession(0).start_calibration((0, 1080))
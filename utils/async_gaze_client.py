@@ -0,0 +1,260 @@
+""" This module contains an asyncio gaze client keeping several frames at the inference server at once. """
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config as cfg
+from utils.metrics import registry
+
+
+class GazeResult:
+    """
+    Detection result of one submitted frame.
+
+    Attributes:
+        sequence (int): Submission order of the frame, starting at 0.
+        timestamp (float): Capture time of the frame.
+        gazes (list): The detected gazes, empty if the request failed.
+        error (Exception): The exception raised by the request, or None.
+        latency (float): Time from submission to result, in seconds.
+    """
+
+    __slots__ = ("sequence", "timestamp", "gazes", "error", "latency")
+
+    def __init__(self, sequence, timestamp, gazes, error=None, latency=0.0):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.gazes = gazes
+        self.error = error
+        self.latency = latency
+
+
+class AsyncGazeClient:
+    """
+    asyncio front end of a gaze source keeping up to in_flight frames at the server at once.
+
+    Every submitted frame gets a sequence number. Requests run concurrently on the pooled HTTP
+    connections of the wrapped source and may complete out of order; a reorder buffer delivers
+    them in submission order. With latest_wins, a completed result is delivered as soon as it is
+    the newest one, and older results still pending are dropped when they arrive, so a slow
+    response never delays fresher ones.
+
+    A slot is taken when a frame is submitted and given back when its result leaves the reorder
+    buffer, so at most in_flight frames are pending or reordering. The delivered results wait
+    in a queue of max_results entries; when it is full the oldest result is dropped with
+    latest_wins, otherwise delivery (and so submit) waits for the consumer. Neither buffer can
+    grow without bound. Without latest_wins, a consumer submitting and reading from the same
+    task should read the ready results before each submit. Results not read by the time the
+    client is closed are discarded.
+
+    The methods must be called from the event loop the client is used in.
+
+    Attributes:
+        source: The wrapped gaze source, any object with detect_gazes(frame).
+        in_flight (int): Maximum number of frames pending at once.
+        latest_wins (bool): Deliver the newest result right away and drop older pending ones.
+    """
+
+    def __init__(self, source, in_flight=cfg.GAZE_IN_FLIGHT, max_results=cfg.GAZE_MAX_BUFFERED_RESULTS,
+                 latest_wins=cfg.GAZE_LATEST_WINS):
+        self.source = source
+        self.in_flight = in_flight
+        self.latest_wins = latest_wins
+        # The wrapped source is blocking, its requests run on as many threads as there are slots
+        self._executor = ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="async-gaze")
+        self._slots = asyncio.Semaphore(in_flight)
+        self._delivery_lock = asyncio.Lock()
+        self._outstanding = 0
+        self._results = asyncio.Queue(maxsize=max_results)
+        self._tasks = set()
+        self._reorder_buffer = {}
+        self._next_sequence = 0
+        self._next_delivery = 0
+        self._closing = False
+        self._stale = registry.counter("gaze_stale_results_total",
+                                       help_text="Results dropped because a newer frame completed first")
+
+    async def submit(self, frame, timestamp=None):
+        """
+        Send a frame for detection, waiting for a free slot if in_flight frames are pending.
+
+        Args:
+        frame (numpy.ndarray): The frame, which must not be modified until its result is delivered.
+        timestamp (float): Capture time of the frame, defaults to now.
+
+        Returns:
+        int: The sequence number of the frame.
+        """
+        await self._slots.acquire()
+        self._outstanding += 1
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        timestamp = time.time() if timestamp is None else timestamp
+        task = asyncio.get_running_loop().create_task(self._detect(sequence, timestamp, frame))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return sequence
+
+    async def get(self):
+        """
+        Wait for the next result in submission order.
+
+        Returns:
+        GazeResult: The result.
+        """
+        return await self._results.get()
+
+    def get_nowait(self):
+        """
+        Return the next result if one is ready, otherwise None.
+        """
+        try:
+            return self._results.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    @property
+    def pending(self):
+        """
+        Number of frames submitted whose result has not been delivered or dropped yet.
+        """
+        return self._outstanding
+
+    async def drain(self):
+        """
+        Wait until every submitted frame has a result delivered or dropped.
+        """
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    async def close(self):
+        """
+        Wait for the frames still at the server and discard the results that were not read.
+        """
+        self._closing = True
+        # Emptying the queue wakes a delivery waiting for room, the later ones see the client closing
+        self._discard_results()
+        await self.drain()
+        self._discard_results()
+        self._reorder_buffer.clear()
+        self._executor.shutdown(wait=False)
+
+    def _discard_results(self):
+        while not self._results.empty():
+            self._results.get_nowait()
+
+    async def _detect(self, sequence, timestamp, frame):
+        start = time.perf_counter()
+        try:
+            gazes = await asyncio.get_running_loop().run_in_executor(self._executor, self.source.detect_gazes, frame)
+            result = GazeResult(sequence, timestamp, gazes, latency=time.perf_counter() - start)
+        except Exception as e:
+            result = GazeResult(sequence, timestamp, [], e, time.perf_counter() - start)
+        await self._complete(result)
+
+    async def _complete(self, result):
+        # Deliveries wait in turn, so results waiting for room in the queue keep their order
+        async with self._delivery_lock:
+            if result.sequence < self._next_delivery:
+                # A newer frame was already delivered, this result is stale
+                self._stale.inc()
+                self._release()
+                return
+
+            if self.latest_wins:
+                # Older frames still pending are dropped when they arrive
+                self._next_delivery = result.sequence + 1
+                await self._deliver(result)
+                self._release()
+                return
+
+            self._reorder_buffer[result.sequence] = result
+            while self._next_delivery in self._reorder_buffer:
+                ready = self._reorder_buffer.pop(self._next_delivery)
+                self._next_delivery += 1
+                await self._deliver(ready)
+                self._release()
+
+    def _release(self):
+        self._outstanding -= 1
+        self._slots.release()
+
+    async def _deliver(self, result):
+        if self._closing:
+            return
+        if self.latest_wins and self._results.full():
+            self._results.get_nowait()
+            self._stale.inc()
+        await self._results.put(result)
+
+
+class InFlightGazeSource:
+    """
+    Adapter giving video loop consumers the throughput of AsyncGazeClient through detect_gazes(frame).
+
+    The client runs on an event loop in a background thread. detect_gazes submits the frame
+    and returns the gazes of the newest result delivered so far, so the returned gazes lag the
+    frame by about one round trip while up to in_flight frames are at the server. It only blocks
+    when all slots are taken.
+
+    Attributes:
+        latest (GazeResult): The newest delivered result, or None.
+    """
+
+    def __init__(self, source, in_flight=cfg.GAZE_IN_FLIGHT, max_results=cfg.GAZE_MAX_BUFFERED_RESULTS,
+                 latest_wins=cfg.GAZE_LATEST_WINS):
+        self.source = source
+        self.latest = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-gaze-loop", daemon=True)
+        self._thread.start()
+        self.client = self._call(self._create_client(source, in_flight, max_results, latest_wins))
+
+    def detect_gazes(self, frame, timestamp=None):
+        """
+        Submit the frame and return the gazes of the newest result.
+
+        Args:
+        frame (numpy.ndarray): The frame, kept until its result is delivered.
+        timestamp (float): Capture time of the frame, defaults to now.
+
+        Returns:
+        list: The gazes of the newest delivered result, empty until the first one arrives.
+        """
+        # The caller may draw on the frame while it is at the server
+        latest = self._call(self._exchange(frame.copy(), timestamp))
+        if latest is not None:
+            if latest.error is not None:
+                logging.warning(f"Gaze detection failed on frame {latest.sequence}: {latest.error}")
+            self.latest = latest
+        return self.latest.gazes if self.latest is not None else []
+
+    def close(self):
+        self._call(self.client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    @staticmethod
+    async def _create_client(source, in_flight, max_results, latest_wins):
+        # The semaphore and queue of the client belong to the loop they are created in
+        return AsyncGazeClient(source, in_flight, max_results, latest_wins)
+
+    async def _exchange(self, frame, timestamp):
+        # Results are read before submitting too, a full result queue would otherwise hold every slot
+        latest = self._newest_result(None)
+        await self.client.submit(frame, timestamp)
+        return self._newest_result(latest)
+
+    def _newest_result(self, latest):
+        while (result := self.client.get_nowait()) is not None:
+            latest = result
+        return latest
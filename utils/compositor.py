@@ -0,0 +1,90 @@
+""" This module contains a compositor that renders the game screen from cached layers. """
+
+import numpy as np
+import config as cfg
+from utils.visualization import draw_gaze_point, draw_targets, show_timer
+
+
+class GameCompositor:
+    """
+    Render the game screen from a cached static layer and a few reused output buffers.
+
+    The white background with the targets is drawn once and only redrawn when the targets change
+    (every frame for moving targets). Every frame it is copied into the next output buffer and only
+    the dynamic parts, the gaze dot and the timer, are drawn on top of it. Output buffers are
+    rotated rather than reallocated; with the pipelined video loop a frame can wait in the queue
+    while the next one is rendered, so there is one buffer per queued frame plus the ones being
+    rendered and displayed.
+
+    Attributes:
+        frame_shape (tuple): Shape of the rendered frames.
+        background_color (tuple): BGR color of the background.
+        static_renders (int): Number of times the static layer was redrawn.
+    """
+
+    def __init__(self, frame_shape, background_color=(255, 255, 255), buffer_count=cfg.PIPELINE_QUEUE_SIZE + 2):
+        self.background_color = background_color
+        self.buffer_count = buffer_count
+        self.static_renders = 0
+        self._targets = np.empty((0, 2), dtype=np.int64)
+        self._target_radius = cfg.TARGET_RADIUS
+        self._allocate(frame_shape)
+
+    def set_targets(self, target_positions, radius=cfg.TARGET_RADIUS):
+        """
+        Set the targets drawn on the static layer, invalidating it only if they changed.
+
+        Args:
+        target_positions (numpy.ndarray): (n, 2) array or list of (x, y) target positions.
+        radius (int): The radius of the targets.
+        """
+        targets = np.asarray(target_positions, dtype=np.int64).reshape(-1, 2)
+        if radius != self._target_radius or not np.array_equal(targets, self._targets):
+            self._targets = targets.copy()
+            self._target_radius = radius
+            self._static_layer = None
+
+    def render(self, frame_shape, gaze_point=None, timer_text=None):
+        """
+        Render a frame of the game.
+
+        Args:
+        frame_shape (tuple): Shape of the camera frame, the layers are rebuilt if it changes.
+        gaze_point (tuple): The (x, y) position of the gaze dot, or None to draw no dot.
+        timer_text (str): The timer text, or None to draw no timer.
+
+        Returns:
+        numpy.ndarray: The rendered frame. It is overwritten buffer_count frames later.
+        """
+        if frame_shape != self.frame_shape:
+            self._allocate(frame_shape)
+
+        frame = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+
+        np.copyto(frame, self.static_layer())
+        if gaze_point is not None:
+            draw_gaze_point(frame, gaze_point)
+        if timer_text:
+            show_timer(frame, timer_text)
+        return frame
+
+    def static_layer(self):
+        """
+        Return the background with the targets, redrawing it if it was invalidated.
+        """
+        if self._static_layer is None:
+            layer = self._background.copy()
+            draw_targets(layer, self._targets, self._target_radius)
+            self._static_layer = layer
+            self.static_renders += 1
+        return self._static_layer
+
+    def _allocate(self, frame_shape):
+        self.frame_shape = tuple(frame_shape)
+        self._static_layer = None
+        # Filling a frame with a color tuple is slow, copying a filled frame is not
+        self._background = np.empty(self.frame_shape, dtype=np.uint8)
+        self._background[:] = self.background_color
+        self._buffers = [np.empty(self.frame_shape, dtype=np.uint8) for _ in range(self.buffer_count)]
+        self._next_buffer = 0
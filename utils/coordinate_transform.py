@@ -26,18 +26,18 @@ def calculate_gaze_point_displacements(gaze):
     Calculate the gaze point displacements based on yaw and pitch.
 
     Args:
-    gaze (dict): Gaze data containing yaw, pitch, and face information.
+    gaze (GazeRecord): Gaze data containing yaw, pitch, and face information.
 
     Returns:
     tuple: (dx, dy) displacements of the gaze point.
     """
-    length_per_pixel = HEIGHT_OF_HUMAN_FACE / gaze["face"]["height"]
+    length_per_pixel = HEIGHT_OF_HUMAN_FACE / gaze.face.height
 
-    dx = -DISTANCE_TO_OBJECT * np.tan(gaze['yaw']) / length_per_pixel
+    dx = -DISTANCE_TO_OBJECT * np.tan(gaze.yaw) / length_per_pixel
     dx = dx if not np.isnan(dx) else 100000000
 
-    yaw_cos = np.clip(gaze['yaw'], -1, 1)
-    dy = -DISTANCE_TO_OBJECT * np.arccos(yaw_cos) * np.tan(gaze['pitch']) / length_per_pixel
+    yaw_cos = np.clip(gaze.yaw, -1, 1)
+    dy = -DISTANCE_TO_OBJECT * np.arccos(yaw_cos) * np.tan(gaze.pitch) / length_per_pixel
     dy = dy if not np.isnan(dy) else 100000000
 
     return dx, dy
@@ -67,3 +67,94 @@ def transform_coordinates(gaze_x_raw, gaze_y_raw, transformation_matrix, image_w
     adjusted_y = max(0, min(adjusted_y, image_height - 1))
 
     return int(adjusted_x), int(adjusted_y)
+
+# Displacement used in place of NaN, far outside the frame so the transformed point is clamped to a border
+NAN_DISPLACEMENT = 100000000
+
+def calculate_gaze_point_displacements_batch(yaw, pitch, face_height):
+    """
+    Calculate the gaze point displacements of many gazes at once.
+
+    The results match calculate_gaze_point_displacements for each gaze, including NaN
+    displacements being replaced by NAN_DISPLACEMENT.
+
+    Args:
+    yaw (numpy.ndarray): (N,) yaw angles in radians.
+    pitch (numpy.ndarray): (N,) pitch angles in radians.
+    face_height (numpy.ndarray): (N,) heights of the face boxes in pixels.
+
+    Returns:
+    tuple: (dx, dy) arrays of (N,) displacements.
+    """
+    yaw = np.asarray(yaw, dtype=np.float64)
+    pitch = np.asarray(pitch, dtype=np.float64)
+    length_per_pixel = HEIGHT_OF_HUMAN_FACE / np.asarray(face_height, dtype=np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = -DISTANCE_TO_OBJECT * np.tan(yaw) / length_per_pixel
+        dy = -DISTANCE_TO_OBJECT * np.arccos(np.clip(yaw, -1, 1)) * np.tan(pitch) / length_per_pixel
+    dx[np.isnan(dx)] = NAN_DISPLACEMENT
+    dy[np.isnan(dy)] = NAN_DISPLACEMENT
+    return dx, dy
+
+def calculate_gaze_point_batch(dx, dy, image_width, image_height):
+    """
+    Calculate the gaze point coordinates of many displacements at once.
+
+    Args:
+    dx (numpy.ndarray): (N,) x displacements.
+    dy (numpy.ndarray): (N,) y displacements.
+    image_width (int): Width of the image.
+    image_height (int): Height of the image.
+
+    Returns:
+    numpy.ndarray: (N, 2) gaze point coordinates on the image.
+    """
+    return np.column_stack((image_width / 2 + np.asarray(dx, dtype=np.float64),
+                            image_height / 2 + np.asarray(dy, dtype=np.float64)))
+
+def transform_coordinates_batch(points, transformation_matrix, image_width, image_height):
+    """
+    Transform many raw gaze points with the calibration transformation matrix at once.
+
+    The results match transform_coordinates for each point: the points go through
+    cv2.perspectiveTransform in float32, are clamped to the frame, and truncated to integers.
+
+    Args:
+    points (numpy.ndarray): (N, 2) raw gaze point coordinates.
+    transformation_matrix (numpy.ndarray): 3x3 transformation matrix from calibration.
+    image_width (int): Width of the image.
+    image_height (int): Height of the image.
+
+    Returns:
+    numpy.ndarray: (N, 2) integer transformed coordinates.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    if len(points) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    adjusted = cv2.perspectiveTransform(points, transformation_matrix).reshape(-1, 2)
+
+    # Like the max/min clamping of transform_coordinates, NaN ends up at 0
+    adjusted = np.nan_to_num(adjusted, nan=0.0)
+    np.clip(adjusted[:, 0], 0, image_width - 1, out=adjusted[:, 0])
+    np.clip(adjusted[:, 1], 0, image_height - 1, out=adjusted[:, 1])
+    return adjusted.astype(np.int64)
+
+def calculate_screen_points_batch(yaw, pitch, face_height, transformation_matrix, image_width, image_height):
+    """
+    Turn arrays of gaze angles into calibrated, clamped screen coordinates in one call.
+
+    Args:
+    yaw (numpy.ndarray): (N,) yaw angles in radians.
+    pitch (numpy.ndarray): (N,) pitch angles in radians.
+    face_height (numpy.ndarray): (N,) heights of the face boxes in pixels.
+    transformation_matrix (numpy.ndarray): 3x3 transformation matrix from calibration.
+    image_width (int): Width of the image.
+    image_height (int): Height of the image.
+
+    Returns:
+    numpy.ndarray: (N, 2) integer screen coordinates.
+    """
+    dx, dy = calculate_gaze_point_displacements_batch(yaw, pitch, face_height)
+    points = calculate_gaze_point_batch(dx, dy, image_width, image_height)
+    return transform_coordinates_batch(points, transformation_matrix, image_width, image_height)
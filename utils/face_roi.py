@@ -0,0 +1,107 @@
+""" This module contains helpers to send only the face region of a frame for gaze detection. """
+
+import config as cfg
+
+
+def face_crop_box(face, frame_shape, scale=cfg.FACE_ROI_SCALE, min_size=cfg.FACE_ROI_MIN_SIZE):
+    """
+    Calculate an enlarged square box around a detected face, clipped to the frame.
+
+    Args:
+    face (FaceBox): Face information with center x, y, width and height.
+    frame_shape (tuple): Shape of the full frame.
+    scale (float): Size of the box relative to the largest side of the face.
+    min_size (int): Minimum side of the box in pixels.
+
+    Returns:
+    tuple: (x_min, y_min, x_max, y_max) pixel coordinates of the box.
+    """
+    image_height, image_width = frame_shape[:2]
+    half_size = max(max(face.width, face.height) * scale, min_size) / 2
+
+    x_min = max(0, int(face.x - half_size))
+    y_min = max(0, int(face.y - half_size))
+    x_max = min(image_width, int(face.x + half_size))
+    y_max = min(image_height, int(face.y + half_size))
+    return x_min, y_min, x_max, y_max
+
+
+def offset_gaze(gaze, offset_x, offset_y):
+    """
+    Move the face and landmark coordinates of a gaze detected in a crop to full-frame coordinates.
+
+    Args:
+    gaze (GazeRecord): Gaze data detected in the crop, updated in place.
+    offset_x (int): x-coordinate of the crop in the full frame.
+    offset_y (int): y-coordinate of the crop in the full frame.
+
+    Returns:
+    GazeRecord: The updated gaze data.
+    """
+    face = gaze.face
+    face.x += offset_x
+    face.y += offset_y
+    if face.landmarks is not None:
+        face.landmarks += (offset_x, offset_y)
+    return gaze
+
+
+class FaceRoiTracker:
+    """
+    Crop each frame to the region around the last detected face.
+
+    When the face is lost, or every refresh_interval frames, the full frame is sent again
+    to re-acquire it.
+
+    Attributes:
+        scale (float): Size of the crop relative to the last face box.
+        min_size (int): Minimum side of the crop in pixels.
+        refresh_interval (int): Frames between full-frame detections, 0 to disable.
+        last_face (FaceBox): The last detected face in full-frame coordinates, or None.
+    """
+
+    def __init__(self, scale=cfg.FACE_ROI_SCALE, min_size=cfg.FACE_ROI_MIN_SIZE,
+                 refresh_interval=cfg.FACE_ROI_REFRESH_INTERVAL):
+        self.scale = scale
+        self.min_size = min_size
+        self.refresh_interval = refresh_interval
+        self.last_face = None
+        self.frames_since_full_frame = 0
+
+    def crop(self, frame):
+        """
+        Return the part of the frame to send for gaze detection.
+
+        Args:
+        frame (numpy.ndarray): The full frame.
+
+        Returns:
+        tuple: (region, (offset_x, offset_y)) where region is a view into the frame.
+        """
+        refresh_due = 0 < self.refresh_interval <= self.frames_since_full_frame
+        if self.last_face is None or refresh_due:
+            self.frames_since_full_frame = 0
+            return frame, (0, 0)
+
+        self.frames_since_full_frame += 1
+        x_min, y_min, x_max, y_max = face_crop_box(self.last_face, frame.shape, self.scale, self.min_size)
+        return frame[y_min:y_max, x_min:x_max], (x_min, y_min)
+
+    def update(self, gazes, offset):
+        """
+        Map the gazes detected in the cropped region back to the full frame and remember the face.
+
+        Args:
+        gazes (list): Gazes detected in the region returned by crop.
+        offset (tuple): (offset_x, offset_y) returned by crop.
+
+        Returns:
+        list: The gazes in full-frame coordinates.
+        """
+        offset_x, offset_y = offset
+        if offset_x or offset_y:
+            for gaze in gazes:
+                offset_gaze(gaze, offset_x, offset_y)
+
+        self.last_face = gazes[0].face if gazes else None
+        return gazes
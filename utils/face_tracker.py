@@ -0,0 +1,185 @@
+""" This module tracks several faces across frames, with a stable ID, filter and calibration per face. """
+
+import numpy as np
+import config as cfg
+from utils.coordinate_transform import (calculate_gaze_point_batch, calculate_gaze_point_displacements_batch,
+                                        transform_coordinates_batch)
+from utils.filters import create_filter
+
+
+class TrackedFace:
+    """
+    One face followed across frames.
+
+    Attributes:
+        face_id (int): Stable ID, assigned in order of appearance.
+        gaze (GazeRecord): The last gaze data matched to the face.
+        center (numpy.ndarray): Center (x, y) of the last face box.
+        size (float): Height of the last face box.
+        gaze_filter: The filter of the gaze points of this face, created on the first measurement.
+        point (tuple): The last filtered (x, y) gaze point, or None.
+        missed (int): Consecutive frames the face was not detected.
+    """
+
+    def __init__(self, face_id, gaze):
+        self.face_id = face_id
+        self.gaze = gaze
+        self.center = np.array([gaze.face.x, gaze.face.y], dtype=np.float64)
+        self.size = float(gaze.face.height)
+        self.gaze_filter = None
+        self.point = None
+        self.missed = 0
+
+    @property
+    def visible(self):
+        return self.missed == 0
+
+
+class FaceTracker:
+    """
+    Assign stable IDs to the faces returned by the gaze detection, and smooth the gaze of each
+    face with its own filter and calibration matrix.
+
+    Detections are matched to the tracked faces by the distance between the face centers,
+    relative to the face height: all pairs are sorted by distance once and matched greedily,
+    which is exact enough for the handful of faces a camera sees. A face that is not detected
+    keeps its ID for max_missed frames, with its filter advanced by predict().
+
+    Attributes:
+        transformation_matrix (numpy.ndarray): Calibration of the faces without their own, or None
+            for uncalibrated image coordinates.
+        calibrations (dict): Calibration matrix by face ID.
+        filter_name (str): One of GAZE_FILTERS, for the filter of each face.
+        max_faces (int): Maximum number of faces tracked at once.
+        max_distance (float): Largest center distance, relative to the face height, to match a detection to a face.
+        max_missed (int): Frames a face may go undetected before it is dropped.
+        faces (list): The tracked faces, by ID.
+    """
+
+    def __init__(self, transformation_matrix=None, calibrations=None, filter_name=cfg.GAZE_FILTER,
+                 max_faces=cfg.MAX_TRACKED_FACES, max_distance=cfg.FACE_TRACK_MAX_DISTANCE,
+                 max_missed=cfg.FACE_TRACK_MAX_MISSED):
+        self.transformation_matrix = transformation_matrix
+        self.calibrations = dict(calibrations or {})
+        self.filter_name = filter_name
+        self.max_faces = max_faces
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.faces = []
+        self._next_id = 0
+
+    def set_calibration(self, face_id, transformation_matrix):
+        self.calibrations[face_id] = transformation_matrix
+
+    def update(self, gazes, frame_shape, screen_size=None):
+        """
+        Match the detected gazes to the tracked faces and update their filtered gaze points.
+
+        Args:
+        gazes (list): The gazes returned by the gaze detection for one frame.
+        frame_shape (tuple): Shape of the frame.
+        screen_size (tuple): (width, height) the calibrated gaze points are clamped to, or None for the frame.
+
+        Returns:
+        list: The tracked faces, detected in this frame or not, by ID.
+        """
+        matches, unmatched = self._match(gazes)
+
+        for face, gaze in matches:
+            face.gaze = gaze
+            face.center[:] = (gaze.face.x, gaze.face.y)
+            face.size = float(gaze.face.height)
+            face.missed = 0
+
+        # New faces get their IDs from left to right, so people side by side are numbered in a repeatable order
+        for gaze in sorted(unmatched, key=lambda gaze: gaze.face.x):
+            if len(self.faces) >= self.max_faces:
+                break
+            face = TrackedFace(self._next_id, gaze)
+            self._next_id += 1
+            self.faces.append(face)
+            matches.append((face, gaze))
+
+        points = self.gaze_points([face for face, _ in matches], [gaze for _, gaze in matches], frame_shape,
+                                  screen_size)
+        matched_faces = set()
+        for (face, _), point in zip(matches, points):
+            matched_faces.add(face.face_id)
+            face.point = self._filter(face, (int(point[0]), int(point[1])))
+
+        for face in self.faces:
+            if face.face_id not in matched_faces:
+                face.missed += 1
+                if face.gaze_filter is not None:
+                    face.point = face.gaze_filter.predict()
+
+        self.faces = [face for face in self.faces if face.missed <= self.max_missed]
+        return self.faces
+
+    def gaze_points(self, faces, gazes, frame_shape, screen_size=None):
+        """
+        Return the calibrated gaze points of the gazes of a frame, each with the calibration of its face.
+
+        The raw points of all faces are computed in one vectorized call, then transformed once
+        per distinct calibration matrix. Calibrated points are clamped to screen_size when it is
+        given, for a screen of another size than the frame; uncalibrated points to the frame.
+
+        Returns:
+        numpy.ndarray: (N, 2) integer gaze points.
+        """
+        image_width, image_height = frame_shape[:2]
+        dx, dy = calculate_gaze_point_displacements_batch([gaze.yaw for gaze in gazes], [gaze.pitch for gaze in gazes],
+                                                          [gaze.face.height for gaze in gazes])
+        raw_points = calculate_gaze_point_batch(dx, dy, image_width, image_height)
+
+        points = np.empty((len(gazes), 2), dtype=np.int64)
+        matrices = [self.calibrations.get(face.face_id, self.transformation_matrix) for face in faces]
+        for matrix in {id(matrix): matrix for matrix in matrices}.values():
+            rows = [index for index, other in enumerate(matrices) if other is matrix]
+            if matrix is None:
+                # Without calibration the raw points are only clamped to the frame
+                points[rows] = transform_coordinates_batch(raw_points[rows], np.eye(3), image_width, image_height)
+            else:
+                width, height = screen_size if screen_size is not None else (image_width, image_height)
+                points[rows] = transform_coordinates_batch(raw_points[rows], matrix, width, height)
+        return points
+
+    def reset(self):
+        self.faces = []
+        self._next_id = 0
+
+    def _filter(self, face, point):
+        if face.gaze_filter is None:
+            # The Kalman filter of a new face starts at its first gaze point instead of the playground center
+            face.gaze_filter = create_filter(self.filter_name, initial_point=point)
+        return face.gaze_filter.update(point)
+
+    def _match(self, gazes):
+        """
+        Pair detections with tracked faces, closest pairs first.
+
+        Returns:
+        tuple: (list of (face, gaze) pairs, list of unmatched gazes).
+        """
+        if not self.faces or not gazes:
+            return [], list(gazes)
+
+        centers = np.array([(gaze.face.x, gaze.face.y) for gaze in gazes], dtype=np.float64)
+        tracked_centers = np.array([face.center for face in self.faces])
+        sizes = np.array([max(face.size, 1.0) for face in self.faces])
+        distances = np.linalg.norm(tracked_centers[:, None, :] - centers[None, :, :], axis=2) / sizes[:, None]
+
+        matches = []
+        used_faces, used_gazes = set(), set()
+        for flat_index in np.argsort(distances, axis=None):
+            face_index, gaze_index = divmod(int(flat_index), len(gazes))
+            if distances[face_index, gaze_index] > self.max_distance:
+                break
+            if face_index in used_faces or gaze_index in used_gazes:
+                continue
+            used_faces.add(face_index)
+            used_gazes.add(gaze_index)
+            matches.append((self.faces[face_index], gazes[gaze_index]))
+
+        unmatched = [gaze for index, gaze in enumerate(gazes) if index not in used_gazes]
+        return matches, unmatched
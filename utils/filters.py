@@ -1,9 +1,7 @@
 """ This module containe some filters to smooth gaze point coordinates. """
+import bisect
 import numpy as np
-import cv2
-import logging
-
-logging.basicConfig(level=logging.DEBUG)
+import config as cfg
 
 def apply_moving_average_filter(gaze_history, new_point, window_size):
     """
@@ -51,19 +49,21 @@ def apply_median_filter(gaze_history, new_point, window_size):
     return filtered_x, filtered_y
 
 def adaptive_weighted_moving_average(gaze_history, new_point, max_window_size=10):
+    """
+    Apply a weighted moving average, where more recent points have higher weights.
+
+    Args:
+    gaze_history (list): List of previous gaze points.
+    new_point (tuple): New gaze point (x, y) to be added.
+    max_window_size (int): Size of the window.
+
+    Returns:
+    tuple: (filtered_x, filtered_y) smoothed gaze point coordinates.
+    """
     gaze_history.append(new_point)
     if len(gaze_history) > max_window_size:
         gaze_history.pop(0)
 
-    # Calculate the speed of movement
-    if len(gaze_history) > 1:
-        speed = np.linalg.norm(np.array(gaze_history[-1]) - np.array(gaze_history[-2]))
-    else:
-        speed = 0
-
-    # Adjust window size based on speed
-    adaptive_window_size = max(2, int(max_window_size * (1 - speed / 100)))
-
     # Calculate weights (more recent points have higher weights)
     weights = np.linspace(0.5, 1.0, len(gaze_history))
     weights /= weights.sum()
@@ -77,33 +77,523 @@ def adaptive_weighted_moving_average(gaze_history, new_point, max_window_size=10
 
     return filtered_x, filtered_y
 
+def apply_moving_average_filter_batch(points, window_size):
+    """
+    Apply the moving average filter to a whole track of gaze points at once.
+
+    The output matches calling apply_moving_average_filter on each point in order, starting
+    from an empty history.
+
+    Args:
+    points (numpy.ndarray): (N, 2) array of gaze points.
+    window_size (int): Size of the moving average window.
+
+    Returns:
+    numpy.ndarray: (N, 2) integer array of smoothed gaze point coordinates.
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    counts = np.minimum(np.arange(1, len(points) + 1), window_size)[:, None]
+
+    if np.issubdtype(points.dtype, np.integer):
+        # Integer sums are exact, so window sums can come from a cumulative sum
+        cumulative = np.zeros((len(points) + 1, 2), dtype=np.int64)
+        np.cumsum(points, axis=0, out=cumulative[1:])
+        starts = np.maximum(np.arange(1, len(points) + 1) - window_size, 0)
+        sums = cumulative[1:] - cumulative[starts]
+    else:
+        # Float sums depend on the order of the additions, add the window from oldest to newest like sum()
+        windows = _sliding_windows(points, window_size, pad_value=0)
+        sums = windows[:, 0].copy()
+        for k in range(1, window_size):
+            sums += windows[:, k]
+
+    return _truncate(sums / counts)
+
+
+def apply_median_filter_batch(points, window_size):
+    """
+    Apply the median filter to a whole track of gaze points at once.
+
+    The output matches calling apply_median_filter on each point in order, starting from an
+    empty history.
+
+    Args:
+    points (numpy.ndarray): (N, 2) array of gaze points.
+    window_size (int): Size of the median filter window.
+
+    Returns:
+    numpy.ndarray: (N, 2) integer array of smoothed gaze point coordinates.
+    """
+    points = np.asarray(points)
+    filtered = np.empty((len(points), 2), dtype=np.float64)
+
+    # The first points have a shorter history
+    warmup = min(window_size - 1, len(points))
+    for i in range(warmup):
+        filtered[i] = np.median(points[:i + 1], axis=0)
+
+    if len(points) >= window_size:
+        windows = np.lib.stride_tricks.sliding_window_view(points, window_size, axis=0)
+        filtered[warmup:] = np.median(windows, axis=-1)
+
+    return _truncate(filtered)
+
+
+def adaptive_weighted_moving_average_batch(points, max_window_size=10):
+    """
+    Apply the adaptive weighted moving average to a whole track of gaze points at once.
+
+    The output matches calling adaptive_weighted_moving_average on each point in order,
+    starting from an empty history.
+
+    Args:
+    points (numpy.ndarray): (N, 2) array of gaze points.
+    max_window_size (int): Size of the window.
+
+    Returns:
+    numpy.ndarray: (N, 2) integer array of smoothed gaze point coordinates.
+    """
+    points = np.asarray(points)
+    filtered = np.empty((len(points), 2), dtype=np.float64)
+
+    warmup = min(max_window_size - 1, len(points))
+    for i in range(warmup):
+        weights = _recency_weights(i + 1)
+        for axis in range(2):
+            filtered[i, axis] = np.average(points[:i + 1, axis], weights=weights)
+
+    if len(points) >= max_window_size:
+        weights = _recency_weights(max_window_size)
+        scale = weights.sum()
+        for axis in range(2):
+            # Same operations as np.average, applied to every window at once
+            windows = np.lib.stride_tricks.sliding_window_view(np.ascontiguousarray(points[:, axis]), max_window_size)
+            filtered[warmup:, axis] = np.multiply(windows, weights, dtype=np.float64).sum(axis=1) / scale
+
+    return _truncate(filtered)
+
+
+def _recency_weights(length):
+    """
+    Weights of the adaptive weighted moving average, more recent points have higher weights.
+    """
+    weights = np.linspace(0.5, 1.0, length)
+    weights /= weights.sum()
+    return weights
+
+
+def _sliding_windows(points, window_size, pad_value):
+    """
+    Return (N, window_size, 2) windows ending at every point, padding the start of the track.
+    """
+    padded = np.concatenate([np.full((window_size - 1, 2), pad_value, dtype=points.dtype), points])
+    return np.lib.stride_tricks.sliding_window_view(padded, window_size, axis=0).transpose(0, 2, 1)
+
+
+def _truncate(values):
+    """
+    Convert to integers like int() does, rounding towards zero.
+    """
+    return np.trunc(values).astype(np.int64)
+
+
+class GazeFilter:
+    """
+    Base class of the stateful gaze point filters.
+
+    Filters keep their history in preallocated NumPy ring buffers, so updates in the steady state
+    take constant time and do not allocate arrays.
+
+    Attributes:
+        last_point (tuple): The last filtered (x, y) point, or None before the first update.
+    """
+
+    def __init__(self):
+        self.last_point = None
+
+    def update(self, point):
+        """
+        Add a new gaze point.
+
+        Args:
+        point (tuple): New gaze point (x, y).
+
+        Returns:
+        tuple: (filtered_x, filtered_y) smoothed gaze point coordinates.
+        """
+        raise NotImplementedError
+
+    def predict(self):
+        """
+        Return the filtered point for a frame without a new measurement.
+        """
+        return self.last_point
+
+    def reset(self):
+        self.last_point = None
+
+
+class NoFilter(GazeFilter):
+    """
+    Pass the gaze points through unchanged.
+    """
+
+    def update(self, point):
+        self.last_point = (int(point[0]), int(point[1]))
+        return self.last_point
+
+
+class RingBufferFilter(GazeFilter):
+    """
+    Base class of the filters working on the last window_size points.
+    """
+
+    def __init__(self, window_size):
+        super().__init__()
+        self.window_size = window_size
+        self._buffer = np.zeros((window_size, 2), dtype=np.float64)
+        self._head = 0
+        self._count = 0
+
+    def _push(self, point):
+        """
+        Store the point in place of the oldest one.
+
+        Returns:
+        numpy.ndarray: The slot that was overwritten, before the update, or None if the buffer was not full.
+        """
+        slot = self._buffer[self._head]
+        self._head = (self._head + 1) % self.window_size
+        if self._count < self.window_size:
+            self._count += 1
+            slot[0] = point[0]
+            slot[1] = point[1]
+            return None
+        return slot
+
+    def reset(self):
+        super().reset()
+        self._head = 0
+        self._count = 0
+
+
+class MovingAverageFilter(RingBufferFilter):
+    """
+    Moving average over the last window_size points, kept as a running sum.
+    """
+
+    # Recompute the running sum from the buffer this often, so float rounding errors do not accumulate
+    RESUM_INTERVAL = 1024
+
+    def __init__(self, window_size=cfg.GAZE_HISTORY_WINDOW_SIZE):
+        super().__init__(window_size)
+        self._sum = np.zeros(2, dtype=np.float64)
+        self._updates = 0
+
+    def update(self, point):
+        oldest = self._push(point)
+        if oldest is None:
+            self._sum[0] += point[0]
+            self._sum[1] += point[1]
+        else:
+            self._sum[0] += point[0] - oldest[0]
+            self._sum[1] += point[1] - oldest[1]
+            oldest[0] = point[0]
+            oldest[1] = point[1]
+
+        self._updates += 1
+        if self._updates % self.RESUM_INTERVAL == 0:
+            self._buffer[:self._count].sum(axis=0, out=self._sum)
+
+        self.last_point = (int(self._sum[0] / self._count), int(self._sum[1] / self._count))
+        return self.last_point
+
+    def reset(self):
+        super().reset()
+        self._sum[:] = 0
+
+
+class MedianFilter(RingBufferFilter):
+    """
+    Median over the last window_size points.
+
+    Next to the ring buffer, the values of each axis are kept sorted in a list of window_size
+    preallocated slots. An update moves the slot of the oldest value to where the new value
+    belongs, shifting the values in between: O(window_size) moves, which for the small windows
+    used here is cheaper than a heap, and no container is allocated after construction. The
+    result is the same as apply_median_filter.
+    """
+
+    def __init__(self, window_size=cfg.GAZE_HISTORY_WINDOW_SIZE):
+        super().__init__(window_size)
+        self._sorted = ([0.0] * window_size, [0.0] * window_size)
+
+    def update(self, point):
+        oldest = self._push(point)
+        count = self._count
+        for axis in range(2):
+            values = self._sorted[axis]
+            value = float(point[axis])
+            # The free slot is the oldest value, or the end of the values while the buffer fills up
+            position = count - 1 if oldest is None else bisect.bisect_left(values, oldest[axis], 0, count)
+            while position > 0 and values[position - 1] > value:
+                values[position] = values[position - 1]
+                position -= 1
+            while position < count - 1 and values[position + 1] < value:
+                values[position] = values[position + 1]
+                position += 1
+            values[position] = value
+        if oldest is not None:
+            oldest[0] = point[0]
+            oldest[1] = point[1]
+
+        x_values, y_values = self._sorted
+        middle = count // 2
+        if count % 2:
+            self.last_point = (int(x_values[middle]), int(y_values[middle]))
+        else:
+            self.last_point = (int((x_values[middle - 1] + x_values[middle]) / 2),
+                               int((y_values[middle - 1] + y_values[middle]) / 2))
+        return self.last_point
+
+
+class AdaptiveWeightedMovingAverageFilter(RingBufferFilter):
+    """
+    Weighted moving average over the last max_window_size points, more recent points have higher weights.
+
+    The points are written twice into a buffer of 2 * max_window_size columns, so the window is
+    always a contiguous slice in chronological order. The weighted sum then runs the same NumPy
+    operations on the same values as adaptive_weighted_moving_average, and the result is the
+    same, while the weights and the products buffer are computed and allocated only once.
+    """
+
+    def __init__(self, max_window_size=cfg.ADAPTIVE_FILTER_WINDOW_SIZE):
+        super().__init__(max_window_size)
+        self._partial_weights = [_recency_weights(length) for length in range(1, max_window_size + 1)]
+        self._scales = [weights.sum() for weights in self._partial_weights]
+        # Row 0 holds the x values, row 1 the y values
+        self._history = np.zeros((2, 2 * max_window_size), dtype=np.float64)
+        self._products = np.zeros((2, max_window_size), dtype=np.float64)
+        self._result = np.zeros(2, dtype=np.float64)
+
+    def update(self, point):
+        head = self._head
+        self._head = (head + 1) % self.window_size
+        self._count = min(self._count + 1, self.window_size)
+        history = self._history
+        history[0, head] = history[0, head + self.window_size] = point[0]
+        history[1, head] = history[1, head + self.window_size] = point[1]
+
+        count = self._count
+        # Once the buffer is full the oldest point is the one after the newest
+        start = self._head if count == self.window_size else 0
+        products = self._products[:, :count]
+        np.multiply(history[:, start:start + count], self._partial_weights[count - 1], out=products)
+        np.add.reduce(products, axis=1, out=self._result)
+        self._result /= self._scales[count - 1]
+
+        self.last_point = (int(self._result[0]), int(self._result[1]))
+        return self.last_point
+
+
 PROCESS_NOISE = 1e-3
 MEASUREMENT_NOISE = 0.3
+TIME_STEP = 0.5  # Velocity units per frame of the constant velocity model
+
+
+def _kalman_model(process_noise, measurement_noise):
+    """
+    Return the transition matrix and the noise covariances of the constant velocity model.
+    """
+    transition = np.array([[1, 0, TIME_STEP, 0],
+                           [0, 1, 0, TIME_STEP],
+                           [0, 0, 1, 0],
+                           [0, 0, 0, 1]], dtype=np.float64)
+    process_cov = np.eye(4) * process_noise
+    measurement_cov = np.eye(2) * measurement_noise
+    return transition, process_cov, measurement_cov
+
+
+class KalmanFilter(GazeFilter):
+    """
+    Constant velocity Kalman filter on the gaze point, with state (x, y, vx, vy).
+
+    Only the position is measured, so the Kalman gain only needs the inverse of a 2x2 matrix,
+    computed in closed form. All intermediate results go to preallocated arrays.
+
+    Attributes:
+        state (numpy.ndarray): The current state estimate (x, y, vx, vy).
+        covariance (numpy.ndarray): The 4x4 covariance of the state estimate.
+    """
 
-class KalmanFilter:
     def __init__(self, initial_state, process_noise=PROCESS_NOISE, measurement_noise=MEASUREMENT_NOISE):
-        self.kf = cv2.KalmanFilter(4, 2)
-        self.kf.measurementMatrix = np.array([[1, 0, 0, 0],
-                                              [0, 1, 0, 0]], np.float32)
-        self.kf.transitionMatrix = np.array([[1, 0, 0.5, 0],
-                                             [0, 1, 0, 0.5],
-                                             [0, 0, 1, 0],
-                                             [0, 0, 0, 1]], np.float32)
-        self.kf.processNoiseCov = np.eye(4, dtype=np.float32) * process_noise
-        self.kf.measurementNoiseCov = np.eye(2, dtype=np.float32) * measurement_noise
-
-        # Initialize state
-        self.kf.statePost = np.array([[initial_state[0]],
-                                      [initial_state[1]],
-                                      [0],
-                                      [0]], dtype=np.float32)
+        super().__init__()
+        self._transition, self._process_cov, _ = _kalman_model(process_noise, measurement_noise)
+        self._transition_t = np.ascontiguousarray(self._transition.T)
+        self._measurement_noise = measurement_noise
+
+        self.state = np.array([initial_state[0], initial_state[1], 0, 0], dtype=np.float64)
+        self.covariance = np.zeros((4, 4), dtype=np.float64)
+
+        self._temp = np.empty((4, 4), dtype=np.float64)
+        self._gain = np.empty((4, 2), dtype=np.float64)
+        self._innovation_cov_inv = np.empty((2, 2), dtype=np.float64)
+        self._innovation = np.empty(2, dtype=np.float64)
+        self._correction = np.empty(4, dtype=np.float64)
+
+    def predict(self):
+        """
+        Advance the filter by one step without a measurement.
+
+        Returns:
+        tuple: The predicted (x, y) position.
+        """
+        state = self.state
+        state[0] += TIME_STEP * state[2]
+        state[1] += TIME_STEP * state[3]
+
+        # P = F P F^T + Q
+        np.dot(self._transition, self.covariance, out=self._temp)
+        np.dot(self._temp, self._transition_t, out=self.covariance)
+        self.covariance += self._process_cov
+
+        self.last_point = (state[0], state[1])
+        return self.last_point
 
     def update(self, measurement):
-        measurement = np.array([[measurement[0]], [measurement[1]]], dtype=np.float32)
-        predicted = self.kf.predict()
-        updated = self.kf.correct(measurement)
-        logging.debug(measurement[:2].flatten())
-        logging.debug(predicted[:2].flatten())
-        logging.debug(updated[:2].flatten())
-        return updated[:2].flatten()
-    
\ No newline at end of file
+        """
+        Predict the next state and correct it with a measured gaze point.
+
+        Args:
+        measurement (tuple): The measured (x, y) gaze point.
+
+        Returns:
+        tuple: The filtered (x, y) position.
+        """
+        self.predict()
+        state, covariance = self.state, self.covariance
+
+        # S^-1 with S = H P H^T + R
+        s00 = covariance[0, 0] + self._measurement_noise
+        s01 = covariance[0, 1]
+        s10 = covariance[1, 0]
+        s11 = covariance[1, 1] + self._measurement_noise
+        det = s00 * s11 - s01 * s10
+        inverse = self._innovation_cov_inv
+        inverse[0, 0] = s11 / det
+        inverse[0, 1] = -s01 / det
+        inverse[1, 0] = -s10 / det
+        inverse[1, 1] = s00 / det
+
+        # K = P H^T S^-1
+        np.dot(covariance[:, :2], inverse, out=self._gain)
+
+        # x = x + K (z - H x)
+        self._innovation[0] = measurement[0] - state[0]
+        self._innovation[1] = measurement[1] - state[1]
+        np.dot(self._gain, self._innovation, out=self._correction)
+        state += self._correction
+
+        # P = P - K H P
+        np.dot(self._gain, covariance[:2, :], out=self._temp)
+        covariance -= self._temp
+
+        self.last_point = (state[0], state[1])
+        return self.last_point
+
+
+def kalman_filter_batch(points, initial_state=None, process_noise=PROCESS_NOISE, measurement_noise=MEASUREMENT_NOISE,
+                        smooth=False):
+    """
+    Run the Kalman filter over a whole track of gaze points, optionally followed by Rauch-Tung-Striebel smoothing.
+
+    The covariances and gains do not depend on the measurements, so they are computed once and
+    reused after they have converged; only the state recursion runs per point.
+
+    Args:
+    points (numpy.ndarray): (N, 2) array of measured gaze points.
+    initial_state (tuple): Initial (x, y) position, defaults to the first point.
+    process_noise (float): Process noise of the model.
+    measurement_noise (float): Measurement noise of the model.
+    smooth (bool): Also use the later points to estimate each position (offline only).
+
+    Returns:
+    numpy.ndarray: (N, 2) array of filtered (or smoothed) positions.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    if count == 0:
+        return np.empty((0, 2), dtype=np.float64)
+
+    transition, process_cov, measurement_cov = _kalman_model(process_noise, measurement_noise)
+    gains, filtered_covs, predicted_covs = _kalman_covariances(transition, process_cov, measurement_cov, count)
+    converged = len(gains) - 1
+
+    initial_state = points[0] if initial_state is None else initial_state
+    state = np.array([initial_state[0], initial_state[1], 0, 0], dtype=np.float64)
+    states = np.empty((count, 4), dtype=np.float64)
+    for k in range(count):
+        state = transition @ state
+        state += gains[min(k, converged)] @ (points[k] - state[:2])
+        states[k] = state
+
+    if smooth and count > 1:
+        # Gains of the backward pass: C_k = P_k F^T (P_k+1|k)^-1
+        smoother_gains = filtered_covs @ transition.T @ np.linalg.inv(predicted_covs)
+        predicted_next = states @ transition.T
+        for k in range(count - 2, -1, -1):
+            states[k] += smoother_gains[min(k, converged)] @ (states[k + 1] - predicted_next[k])
+
+    return states[:, :2].copy()
+
+
+def _kalman_covariances(transition, process_cov, measurement_cov, count, tolerance=1e-12):
+    """
+    Iterate the covariance recursion of the Kalman filter until the gain converges.
+
+    Returns:
+    tuple: (gains, filtered_covs, predicted_covs) arrays, where entry k holds the gain and the
+        filtered covariance of step k and the predicted covariance of step k + 1. The last entry
+        is the steady state, used for all later steps.
+    """
+    covariance = np.zeros((4, 4), dtype=np.float64)
+    gains, filtered_covs, predicted_covs = [], [], []
+    for _ in range(count):
+        covariance = transition @ covariance @ transition.T + process_cov
+        gain = covariance[:, :2] @ np.linalg.inv(covariance[:2, :2] + measurement_cov)
+        covariance = covariance - gain @ covariance[:2, :]
+        gains.append(gain)
+        filtered_covs.append(covariance)
+        predicted_covs.append(transition @ covariance @ transition.T + process_cov)
+        if len(gains) > 1 and np.abs(gains[-1] - gains[-2]).max() < tolerance:
+            break
+    return np.array(gains), np.array(filtered_covs), np.array(predicted_covs)
+
+
+GAZE_FILTERS = ("none", "moving_average", "median", "adaptive", "kalman")
+
+
+def create_filter(name=cfg.GAZE_FILTER, initial_point=(cfg.WIDTH_OF_PLAYGROUND // 2, cfg.HEIGHT_OF_PLAYGROUND // 2)):
+    """
+    Create a gaze point filter by name.
+
+    Args:
+    name (str): One of GAZE_FILTERS.
+    initial_point (tuple): Initial (x, y) state of the Kalman filter.
+
+    Returns:
+    The filter, with update(point) and predict() methods.
+    """
+    if name == "none":
+        return NoFilter()
+    if name == "moving_average":
+        return MovingAverageFilter(cfg.GAZE_HISTORY_WINDOW_SIZE)
+    if name == "median":
+        return MedianFilter(cfg.GAZE_HISTORY_WINDOW_SIZE)
+    if name == "adaptive":
+        return AdaptiveWeightedMovingAverageFilter(cfg.ADAPTIVE_FILTER_WINDOW_SIZE)
+    if name == "kalman":
+        return KalmanFilter(initial_point)
+    raise ValueError(f"Unknown gaze filter: {name}")
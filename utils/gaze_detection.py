@@ -1,47 +1,330 @@
 """ This module contains functions for detecting gazes in a given frame using the Roboflow API. """
 
 import base64
+import json
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
 import cv2
 import numpy as np
-import requests
 import logging
+import config as cfg
 from config import API_KEY, GAZE_DETECTION_URL
+from utils.face_roi import FaceRoiTracker
+from utils.gaze_record import parse_predictions
+from utils.quality_controller import QualityController, scale_gaze
+from utils.metrics import registry
 
 logging.basicConfig(level=logging.WARNING)
 
-def detect_gazes(frame: np.ndarray):
+
+class GazeClient:
     """
-    Detect gazes in the given frame using the Roboflow API.
+    Long-lived client for the gaze detection endpoint.
 
-    Args:
-    frame (numpy.ndarray): The input frame to detect gazes in.
+    The client keeps a keep-alive HTTP session with a connection pool, so consecutive frames reuse
+    the same TCP connection, and builds the JSON body around the base64 image with pre-encoded
+    byte fragments instead of serializing a dictionary for every frame.
 
-    Returns:
-    list: A list of detected gazes, where each gaze is a dictionary containing gaze information.
+    With the "binary" transport the JPEG bytes are sent as the raw request body, handed over to the
+    HTTP connection as a memoryview of the cv2.imencode buffer. Servers that only accept JSON reject
+    it, in which case the client falls back to the base64 JSON body for the rest of the session.
+
+    With face region tracking enabled, only an enlarged box around the last detected face is sent
+    and the returned face and landmark coordinates are mapped back to the full frame. Tracking keeps
+    state between frames, so such a client should be fed frames of a single stream in order.
+
+    With adaptive quality, a QualityController lowers the resolution, JPEG quality and detection
+    rate of the frames while the measured latency is over target. Face and landmark coordinates
+    are scaled back to the frame given to detect_gazes, so the calibration mapping is unaffected;
+    skipped frames return a copy of the last detected gazes.
+
+    Responses are decoded straight into GazeRecord objects, without the face landmarks unless
+    keep_landmarks is set.
+
+    Attributes:
+        url (str): The gaze detection endpoint.
+        timeout (float): Timeout of a single request, in seconds.
+        transport (str): "json" or "binary".
+        jpeg_quality (int): Quality of the encoded JPEG frames (0-100).
+        grayscale (bool): Whether frames are converted to grayscale before encoding.
+        roi_tracker (FaceRoiTracker): Crops frames around the last face, or None to send full frames.
+        quality_controller (QualityController): Adapts the frames to the latency target, or None.
+        keep_landmarks (bool): Whether the face landmarks are kept in the records.
+        session (requests.Session): The pooled HTTP session.
     """
-    # Encode the frame as a JPEG image
-    _, img_encode = cv2.imencode(".jpg", frame)
 
-    # Convert the encoded image to base64
-    img_base64 = base64.b64encode(img_encode).decode("utf-8")
+    # Status codes meaning the server does not understand a raw image body
+    BINARY_REJECTED_STATUS_CODES = (400, 404, 405, 415, 422)
+
+    def __init__(self, url=GAZE_DETECTION_URL, api_key=API_KEY, pool_size=cfg.GAZE_CONNECTION_POOL_SIZE,
+                 timeout=cfg.GAZE_REQUEST_TIMEOUT, transport=cfg.GAZE_TRANSPORT, jpeg_quality=cfg.JPEG_QUALITY,
+                 grayscale=cfg.GAZE_GRAYSCALE, roi_tracking=cfg.FACE_ROI_TRACKING,
+                 keep_landmarks=cfg.GAZE_KEEP_LANDMARKS, adaptive_quality=cfg.ADAPTIVE_QUALITY):
+        if transport not in ("json", "binary"):
+            raise ValueError(f"Unknown gaze transport: {transport}")
+
+        self.url = url
+        self.timeout = timeout
+        self.transport = transport
+        self.jpeg_quality = jpeg_quality
+        self.grayscale = grayscale
+        self.roi_tracker = FaceRoiTracker() if roi_tracking else None
+        self.keep_landmarks = keep_landmarks
+        self.quality_controller = QualityController() if adaptive_quality else None
+        self._last_gazes = []
+
+        # requests is a large import, it is deferred until the first client is created
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._request_exception = requests.RequestException
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Connection": "keep-alive",
+        })
+
+        # The payload only changes in the image value, so the rest of it is encoded once
+        self._json_prefix = f'{{"api_key": {json.dumps(api_key)}, "image": {{"type": "base64", "value": "'.encode()
+        self._json_suffix = b'"}}'
+
+        # Without a JSON body the api_key travels in the query string
+        self._binary_url = f"{url}?{urlencode({'api_key': api_key})}" if api_key is not None else url
+        self._binary_headers = {"Content-Type": "image/jpeg"}
+
+        self._latency = registry.histogram("gaze_inference_latency_ms",
+                                           help_text="Encoding, upload and inference time of a frame")
+        self._http_errors = registry.counter("gaze_http_errors_total",
+                                             help_text="Failed gaze detection requests")
+        self._no_face_frames = registry.counter("gaze_no_face_frames_total",
+                                                help_text="Frames where no face was detected")
+
+    def detect_gazes(self, frame: np.ndarray):
+        """
+        Detect gazes in the given frame.
 
-    # Prepare the request payload
-    payload = {
-        "api_key": API_KEY,
-        "image": {"type": "base64", "value": img_base64},
-    }
+        Args:
+        frame (numpy.ndarray): The input frame to detect gazes in.
 
-    # Send the request to the Roboflow API
-    response = requests.post(GAZE_DETECTION_URL, json=payload, timeout=10)
+        Returns:
+        list: A list of detected gazes, as GazeRecord objects.
+        """
+        if self.quality_controller is None:
+            return self._detect_region(frame)
 
-    # print response time
-    logging.debug(f"Response time: {response.elapsed.total_seconds()}")
+        if self.quality_controller.skip_frame():
+            return [gaze.copy() for gaze in self._last_gazes]
+        self._last_gazes = self._detect_region(frame)
+        return self._last_gazes
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Extract the predictions from the response
-        predictions = response.json()[0]["predictions"]
+    def _detect_region(self, frame):
+        if self.roi_tracker is None:
+            return self._detect(frame)
+
+        region, offset = self.roi_tracker.crop(frame)
+        return self.roi_tracker.update(self._detect(region), offset)
+
+    def _detect(self, frame):
+        jpeg_quality = self.jpeg_quality
+        scale_x = scale_y = 1.0
+        if self.quality_controller is not None:
+            level = self.quality_controller.level
+            jpeg_quality = min(jpeg_quality, level.jpeg_quality)
+            if level.scale < 1.0:
+                image_height, image_width = frame.shape[:2]
+                frame = cv2.resize(frame, (max(1, round(image_width * level.scale)),
+                                           max(1, round(image_height * level.scale))), interpolation=cv2.INTER_AREA)
+                scale_x, scale_y = image_width / frame.shape[1], image_height / frame.shape[0]
+
+        start = time.perf_counter()
+        response = self._send(self.request, frame, jpeg_quality)
+        latency_ms = (time.perf_counter() - start) * 1000
+        predictions = self._parse_response(response, latency_ms)
+
+        if self.quality_controller is not None and response.status_code == 200:
+            self.quality_controller.observe(latency_ms)
+            if scale_x != 1.0 or scale_y != 1.0:
+                for gaze in predictions:
+                    scale_gaze(gaze, scale_x, scale_y)
         return predictions
 
-    logging.error(f"Error in gaze detection: {response.status_code} - {response.text}")
-    return []
+    def detect_encoded(self, image):
+        """
+        Detect gazes in an image that is already JPEG encoded, such as a frame sent by a browser.
+
+        The image is forwarded as is, without region tracking or adaptive quality.
+
+        Args:
+        image (bytes): The JPEG image.
+
+        Returns:
+        list: A list of detected gazes, as GazeRecord objects.
+        """
+        start = time.perf_counter()
+        response = self._send(self.post_image, image)
+        return self._parse_response(response, (time.perf_counter() - start) * 1000)
+
+    def _send(self, send, *args):
+        try:
+            return send(*args)
+        except self._request_exception:
+            self._http_errors.inc()
+            raise
+
+    def _parse_response(self, response, latency_ms):
+        self._latency.observe(latency_ms)
+        logging.debug(f"Response time: {response.elapsed.total_seconds()}")
+
+        if response.status_code == 200:
+            predictions = parse_predictions(response.content, self.keep_landmarks)
+            if not predictions:
+                self._no_face_frames.inc()
+            return predictions
+
+        self._http_errors.inc()
+        logging.error(f"Error in gaze detection: {response.status_code} - {response.text}")
+        return []
+
+    def encode_frame(self, frame: np.ndarray, jpeg_quality=None):
+        """
+        Encode the frame as a JPEG image with the client settings.
+
+        Args:
+        frame (numpy.ndarray): The input frame.
+        jpeg_quality (int): Quality of this frame, defaults to the client setting.
+
+        Returns:
+        numpy.ndarray: The buffer returned by cv2.imencode.
+        """
+        if self.grayscale and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        jpeg_quality = self.jpeg_quality if jpeg_quality is None else jpeg_quality
+        _, img_encode = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        return img_encode
+
+    def request(self, frame: np.ndarray, jpeg_quality=None):
+        """
+        Encode the frame and send it to the gaze detection endpoint.
+
+        Args:
+        frame (numpy.ndarray): The input frame.
+        jpeg_quality (int): Quality of this frame, defaults to the client setting.
+
+        Returns:
+        requests.Response: The raw response of the server.
+        """
+        return self.post_image(self.encode_frame(frame, jpeg_quality))
+
+    def post_image(self, img_encode):
+        """
+        Send an encoded image to the gaze detection endpoint with the client transport.
+
+        Args:
+        img_encode (bytes or numpy.ndarray): The JPEG image.
+
+        Returns:
+        requests.Response: The raw response of the server.
+        """
+        if self.transport == "binary":
+            response = self.session.post(self._binary_url, data=memoryview(img_encode).cast("B"),
+                                         headers=self._binary_headers, timeout=self.timeout)
+            if response.status_code not in self.BINARY_REJECTED_STATUS_CODES:
+                return response
+            logging.warning(f"Gaze server rejected the binary upload ({response.status_code}), falling back to JSON")
+            self.transport = "json"
+
+        body = self._json_prefix + base64.b64encode(img_encode) + self._json_suffix
+        return self.session.post(self.url, data=body, timeout=self.timeout)
+
+    def warmup(self, frame_shape=(cfg.HEIGHT_OF_PLAYGROUND, cfg.WIDTH_OF_PLAYGROUND, 3), requests_count=2):
+        """
+        Open the pooled connection and let the server load the model before the first real frame.
+
+        Args:
+        frame_shape (tuple): Shape of the blank frame sent to the server.
+        requests_count (int): Number of warm-up requests to send.
+
+        Returns:
+        float: Duration of the last warm-up request in seconds, or None if the server is unreachable.
+        """
+        frame = np.zeros(frame_shape, dtype=np.uint8)
+        elapsed = None
+        for _ in range(requests_count):
+            try:
+                start = time.perf_counter()
+                self.detect_gazes(frame)
+                elapsed = time.perf_counter() - start
+            except self._request_exception as e:
+                logging.warning(f"Gaze detection warm-up failed: {e}")
+                return None
+        return elapsed
+
+    def health_check(self):
+        """
+        Check that the inference server is up with a GET request to its /info endpoint.
+
+        Returns:
+        dict: The server information, or None if the server is unreachable or unhealthy.
+        """
+        parts = urlsplit(self.url)
+        try:
+            response = self.session.get(f"{parts.scheme}://{parts.netloc}/info", timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (self._request_exception, ValueError) as e:
+            logging.warning(f"Gaze server health check failed: {e}")
+            return None
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """
+    Return the client shared by detect_gazes, creating it on first use.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = GazeClient()
+        return _default_client
+
+
+def set_default_client(client):
+    """
+    Replace the client shared by detect_gazes.
+
+    Args:
+    client: Any object with a detect_gazes(frame) method.
+    """
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+
+
+def detect_gazes(frame: np.ndarray):
+    """
+    Detect gazes in the given frame using the Roboflow API.
+
+    Args:
+    frame (numpy.ndarray): The input frame to detect gazes in.
+
+    Returns:
+    list: A list of detected gazes, as GazeRecord objects.
+    """
+    return get_default_client().detect_gazes(frame)
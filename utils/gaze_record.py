@@ -0,0 +1,201 @@
+""" This module contains compact records of the gaze predictions returned by the inference server. """
+
+import json
+import numpy as np
+import config as cfg
+
+try:
+    # Optional, several times faster than the standard library decoder
+    import orjson
+except ImportError:
+    orjson = None
+
+# One gaze as a row of a NumPy structured array, 28 bytes instead of a nested dictionary
+GAZE_DTYPE = np.dtype([("yaw", "f4"), ("pitch", "f4"), ("x", "f4"), ("y", "f4"), ("width", "f4"), ("height", "f4"),
+                       ("confidence", "f4")])
+
+# A gaze of a recorded or processed stream, with the frame it was detected in
+GAZE_SAMPLE_DTYPE = np.dtype([("frame", "i8"), ("timestamp", "f8")] + GAZE_DTYPE.descr)
+
+
+class FaceBox:
+    """
+    Face box of a gaze prediction, with its center, size and detection confidence.
+
+    Fields can also be read with face["x"], like the JSON dictionary the record is decoded from.
+
+    Attributes:
+        x (float): Center x-coordinate.
+        y (float): Center y-coordinate.
+        width (float): Width of the box.
+        height (float): Height of the box.
+        confidence (float): Detection confidence, or None.
+        landmarks (numpy.ndarray): (n, 2) float32 landmark coordinates, or None when they were not kept.
+    """
+
+    __slots__ = ("x", "y", "width", "height", "confidence", "landmarks")
+
+    def __init__(self, x, y, width, height, confidence=None, landmarks=None):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.confidence = confidence
+        self.landmarks = landmarks
+
+    @classmethod
+    def from_dict(cls, face, keep_landmarks=cfg.GAZE_KEEP_LANDMARKS):
+        landmarks = None
+        if keep_landmarks and face.get("landmarks"):
+            landmarks = np.array([(landmark["x"], landmark["y"]) for landmark in face["landmarks"]], dtype=np.float32)
+        return cls(face["x"], face["y"], face["width"], face["height"], face.get("confidence"), landmarks)
+
+    def to_dict(self):
+        face = {"x": self.x, "y": self.y, "width": self.width, "height": self.height, "confidence": self.confidence}
+        if self.landmarks is not None:
+            face["landmarks"] = [{"x": float(x), "y": float(y)} for x, y in self.landmarks]
+        return face
+
+    def copy(self):
+        landmarks = self.landmarks.copy() if self.landmarks is not None else None
+        return FaceBox(self.x, self.y, self.width, self.height, self.confidence, landmarks)
+
+    def __getitem__(self, key):
+        return _get_field(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __repr__(self):
+        return f"FaceBox(x={self.x}, y={self.y}, width={self.width}, height={self.height})"
+
+
+class GazeRecord:
+    """
+    One gaze prediction: the gaze angles and the face box they were estimated on.
+
+    Fields can also be read with gaze["yaw"] or gaze["face"]["x"], like the JSON dictionary
+    the record is decoded from.
+
+    Attributes:
+        yaw (float): Yaw angle in radians.
+        pitch (float): Pitch angle in radians.
+        face (FaceBox): The face box.
+    """
+
+    __slots__ = ("yaw", "pitch", "face")
+
+    def __init__(self, yaw, pitch, face):
+        self.yaw = yaw
+        self.pitch = pitch
+        self.face = face
+
+    @classmethod
+    def from_prediction(cls, prediction, keep_landmarks=cfg.GAZE_KEEP_LANDMARKS):
+        """
+        Build a record from a prediction of the server response, keeping only the used fields.
+        """
+        return cls(prediction["yaw"], prediction["pitch"], FaceBox.from_dict(prediction["face"], keep_landmarks))
+
+    def to_dict(self):
+        """
+        Return the prediction as a dictionary in the server format, for JSON serialization.
+        """
+        return {"face": self.face.to_dict(), "yaw": self.yaw, "pitch": self.pitch}
+
+    def copy(self):
+        return GazeRecord(self.yaw, self.pitch, self.face.copy())
+
+    def __getitem__(self, key):
+        return _get_field(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __repr__(self):
+        return f"GazeRecord(yaw={self.yaw}, pitch={self.pitch}, face={self.face!r})"
+
+
+def _get_field(record, key):
+    if key not in record.__slots__:
+        raise KeyError(key)
+    return getattr(record, key)
+
+
+def decode_json(content):
+    """
+    Decode a JSON document from bytes or str, with orjson if it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def parse_predictions(content, keep_landmarks=cfg.GAZE_KEEP_LANDMARKS):
+    """
+    Decode a gaze detection response body straight into records.
+
+    Args:
+    content (bytes): The response body, a list with one result per image.
+    keep_landmarks (bool): Keep the face landmarks, which are dropped by default since nothing draws them.
+
+    Returns:
+    list: The GazeRecord of each detected face.
+    """
+    return [GazeRecord.from_prediction(prediction, keep_landmarks)
+            for prediction in decode_json(content)[0]["predictions"]]
+
+
+def records_to_array(records):
+    """
+    Pack gaze records into a structured array of GAZE_DTYPE rows.
+
+    Returns:
+    numpy.ndarray: One row per record.
+    """
+    array = np.empty(len(records), dtype=GAZE_DTYPE)
+    if records:
+        # Confidence may be missing, it is stored as NaN
+        array[:] = [(record.yaw, record.pitch, record.face.x, record.face.y, record.face.width, record.face.height,
+                     np.nan if record.face.confidence is None else record.face.confidence) for record in records]
+    return array
+
+
+class GazeSampleBuffer:
+    """
+    Growable structured array of GAZE_SAMPLE_DTYPE rows, for long sessions.
+
+    At 44 bytes per sample, a million samples take 44 MB, where the decoded JSON dictionaries
+    would take well over a gigabyte. The capacity doubles when full, so appending is amortized
+    constant time.
+    """
+
+    def __init__(self, capacity=1024):
+        self._samples = np.empty(capacity, dtype=GAZE_SAMPLE_DTYPE)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, frame, timestamp, record):
+        """
+        Add the gaze of a frame.
+
+        Args:
+        frame (int): Index of the frame.
+        timestamp (float): Time of the frame in seconds.
+        record (GazeRecord): The gaze.
+        """
+        if self._count == len(self._samples):
+            self._samples = np.resize(self._samples, 2 * len(self._samples))
+        face = record.face
+        self._samples[self._count] = (frame, timestamp, record.yaw, record.pitch, face.x, face.y, face.width,
+                                      face.height, np.nan if face.confidence is None else face.confidence)
+        self._count += 1
+
+    @property
+    def samples(self):
+        """
+        The samples appended so far, as a view of the buffer.
+        """
+        return self._samples[:self._count]
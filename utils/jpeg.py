@@ -0,0 +1,32 @@
+""" This module contains helpers for JPEG images that do not need to decode them. """
+
+
+def jpeg_size(data):
+    """
+    Read the width and height of a JPEG image from its frame header, without decoding it.
+
+    Args:
+    data (bytes): The encoded image.
+
+    Returns:
+    tuple: (width, height), or None if the data is not a JPEG image.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    index = 2
+    while index + 9 < len(data):
+        if data[index] != 0xFF:
+            index += 1
+            continue
+        marker = data[index + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            index += 1 if marker == 0xFF else 2
+            continue
+        segment_length = int.from_bytes(data[index + 2:index + 4], "big")
+        # Start of frame markers (SOF0-SOF15, except DHT, JPG and DAC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[index + 5:index + 7], "big")
+            width = int.from_bytes(data[index + 7:index + 9], "big")
+            return width, height
+        index += 2 + segment_length
+    return None
@@ -0,0 +1,227 @@
+""" This module contains a lightweight metrics registry with counters, gauges and fixed-bucket histograms. """
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the latency buckets in milliseconds
+LATENCY_BUCKETS_MS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Counter:
+    """
+    A monotonically increasing count.
+    """
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """
+    A value that can go up and down, such as the current frame rate.
+    """
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+    Count observations into fixed buckets, so recording a value takes constant time and memory.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the buckets, an implicit last bucket collects larger values.
+        counts (list): Number of observations per bucket (not cumulative).
+        total (float): Sum of all observations.
+        count (int): Number of observations.
+    """
+
+    def __init__(self, name, buckets=LATENCY_BUCKETS_MS, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation inside the bucket that contains it.
+
+        Returns:
+        float: The estimated value, or None without observations.
+        """
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if count == 0:
+            return None
+
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                # Values above the last bound are reported as the last bound
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of a session and exports them as a JSON snapshot or Prometheus text.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text=help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get_or_create(Gauge, name, help_text=help_text)
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS_MS, help_text=""):
+        return self._get_or_create(Histogram, name, buckets=buckets, help_text=help_text)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Observe the duration of the with block, in milliseconds, in the named histogram.
+        """
+        histogram = self.histogram(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe((time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        """
+        Return the current values of all metrics as a JSON serializable dictionary.
+        """
+        snapshot = {"timestamp": time.time(), "counters": {}, "gauges": {}, "histograms": {}}
+        for name, metric in self._items():
+            if isinstance(metric, Counter):
+                snapshot["counters"][name] = metric.value
+            elif isinstance(metric, Gauge):
+                snapshot["gauges"][name] = metric.value
+            else:
+                snapshot["histograms"][name] = {
+                    "buckets": list(metric.buckets),
+                    "counts": list(metric.counts),
+                    "sum": metric.total,
+                    "count": metric.count,
+                    "p50": metric.quantile(0.5),
+                    "p95": metric.quantile(0.95),
+                    "p99": metric.quantile(0.99),
+                }
+        return snapshot
+
+    def write_json(self, path):
+        """
+        Write a snapshot to a JSON file, replacing it atomically.
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temporary_path, path)
+
+    def to_prometheus(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, metric in self._items():
+            if metric.help_text:
+                lines.append(f"# HELP {name} {metric.help_text}")
+            if isinstance(metric, Counter):
+                lines += [f"# TYPE {name} counter", f"{name} {metric.value}"]
+            elif isinstance(metric, Gauge):
+                lines += [f"# TYPE {name} gauge", f"{name} {metric.value}"]
+            else:
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(metric.buckets, metric.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {metric.count}')
+                lines += [f"{name}_sum {metric.total}", f"{name}_count {metric.count}"]
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(self, metric_type, name, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, metric_type(name, **kwargs))
+        if not isinstance(metric, metric_type):
+            raise TypeError(f"Metric {name} is a {type(metric).__name__}, not a {metric_type.__name__}")
+        return metric
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._metrics.items())
+
+
+# Registry shared by the video loop, the gaze client and the game
+registry = MetricsRegistry()
+
+
+def start_http_exporter(metrics_registry=registry, port=9100, host="127.0.0.1"):
+    """
+    Serve the metrics on http://host:port/metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+    Returns:
+    ThreadingHTTPServer: The server, call shutdown() to stop it.
+    """
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                body, content_type = metrics_registry.to_prometheus().encode(), "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                body, content_type = json.dumps(metrics_registry.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
@@ -0,0 +1,109 @@
+""" This module contains a motion gate to skip gaze detection on frames where the face barely moved. """
+
+import time
+import cv2
+import logging
+import config as cfg
+from utils.face_roi import face_crop_box
+from utils.metrics import registry
+
+
+class MotionGate:
+    """
+    Decide whether a frame differs enough from the last inferred frame to run gaze detection.
+
+    The face region of the frame is downsampled to a small grayscale patch and compared with the
+    patch of the last frame sent for detection. Frames scoring below the threshold can be skipped,
+    up to max_skipped_frames in a row; the caller is expected to advance its filter with a
+    prediction instead.
+
+    Attributes:
+        enabled (bool): Whether frames can be skipped at all.
+        threshold (float): Mean absolute difference (0-255) below which a frame is skipped.
+        max_skipped_frames (int): Maximum number of consecutive skipped frames.
+        size (int): Side of the downsampled patch in pixels.
+        inferred_frames (int): Number of frames sent for detection.
+        skipped_frames (int): Number of frames skipped.
+        last_score (float): Difference score of the last evaluated frame.
+    """
+
+    def __init__(self, enabled=cfg.MOTION_GATE_ENABLED, threshold=cfg.MOTION_GATE_THRESHOLD,
+                 max_skipped_frames=cfg.MOTION_GATE_MAX_SKIPPED_FRAMES, size=cfg.MOTION_GATE_SIZE):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_skipped_frames = max_skipped_frames
+        self.size = size
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+        self.last_score = None
+
+        self._face = None
+        self._reference = None
+        self._skipped_in_a_row = 0
+        self._report_start_time = time.time()
+        self._skipped_counter = registry.counter("motion_gate_skipped_frames_total",
+                                                 help_text="Frames skipped by the motion gate")
+        self._inferred_counter = registry.counter("motion_gate_inferred_frames_total",
+                                                  help_text="Frames sent for gaze detection")
+
+    @property
+    def skip_ratio(self):
+        total = self.inferred_frames + self.skipped_frames
+        return self.skipped_frames / total if total else 0.0
+
+    def should_infer(self, frame):
+        """
+        Check whether gaze detection should run on this frame.
+
+        Args:
+        frame (numpy.ndarray): The current frame.
+
+        Returns:
+        bool: False if the frame can be skipped.
+        """
+        if not self.enabled or self._reference is None or self._skipped_in_a_row >= self.max_skipped_frames:
+            return True
+
+        self.last_score = cv2.norm(self._sample(frame), self._reference, cv2.NORM_L1) / (self.size * self.size)
+        if self.last_score >= self.threshold:
+            return True
+
+        self._skipped_in_a_row += 1
+        self.skipped_frames += 1
+        self._skipped_counter.inc()
+        self._report_if_due()
+        return False
+
+    def update(self, frame, gazes):
+        """
+        Remember the frame that was sent for detection and its result.
+
+        Args:
+        frame (numpy.ndarray): The frame sent for detection.
+        gazes (list): The detected gazes. Without a face no frame is skipped until one is found.
+        """
+        self.inferred_frames += 1
+        self._inferred_counter.inc()
+        self._skipped_in_a_row = 0
+        self._report_if_due()
+        if not self.enabled:
+            return
+
+        self._face = gazes[0].face if gazes else None
+        self._reference = self._sample(frame) if self._face is not None else None
+
+    def _sample(self, frame):
+        """
+        Downsample the face region of the frame to a small grayscale patch.
+        """
+        x_min, y_min, x_max, y_max = face_crop_box(self._face, frame.shape, scale=1.0, min_size=self.size)
+        patch = cv2.resize(frame[y_min:y_max, x_min:x_max], (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 else patch
+
+    def _report_if_due(self):
+        if not self.enabled or time.time() - self._report_start_time < 1:
+            return
+        self._report_start_time = time.time()
+        score = f"{self.last_score:.2f}" if self.last_score is not None else "-"
+        logging.debug(f"Motion gate - inferred: {self.inferred_frames}, skipped: {self.skipped_frames}, "
+                      f"skip ratio: {self.skip_ratio:.2f}, last score: {score}")
@@ -0,0 +1,171 @@
+""" This module drives several cameras at once, sharing one gaze detection client between them. """
+
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import config as cfg
+from utils.metrics import registry
+from utils.video import LatestFrameQueue, flip_frame
+
+
+class CameraStream:
+    """
+    Read frames of one camera in a background thread, keeping only the latest one.
+
+    A video file is read faster than its frames are processed, so for files (live=False) the
+    reader waits for each frame to be taken instead, and every frame is processed.
+
+    Attributes:
+        name (str): Name of the camera, shown on its tile.
+        cap (cv2.VideoCapture): The capture of the camera.
+        live (bool): Whether the source is a webcam, whose stale frames are dropped.
+        frames (LatestFrameQueue): The latest mirrored frame.
+    """
+
+    def __init__(self, name, cap, flip=True, live=True):
+        self.name = name
+        self.cap = cap
+        self.flip = flip
+        self.live = live
+        self.frames = LatestFrameQueue(1, registry.counter("multi_camera_dropped_frames_total",
+                                                           help_text="Frames replaced before being processed"))
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._capture, name=f"capture-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self.frames.close()
+        self._thread.join()
+
+    def _capture(self):
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                self.frames.put(flip_frame(frame) if self.flip else frame, block=not self.live)
+        finally:
+            self.frames.close()
+
+
+def multi_camera_loop(streams, client, on_result, display_name="Multi Camera", in_flight=cfg.MULTI_CAMERA_IN_FLIGHT,
+                      display=True, max_frames=None):
+    """
+    Detect gazes on the frames of several cameras at once and show the results side by side.
+
+    Each camera has up to in_flight requests pending on a shared thread pool and client, so a
+    slow response for one camera does not hold back the others; results of a camera are handled
+    in frame order. Capture, inference and display all overlap.
+
+    Args:
+    streams (list): The CameraStream of each camera.
+    client (GazeClient): The shared client, with a connection pool of at least len(streams) * in_flight connections
+        and no face region tracking.
+    on_result (callable): on_result(stream, frame, gazes) returns the frame to show for the camera.
+    display_name (str): The name of the display window.
+    in_flight (int): Maximum number of pending requests per camera.
+    display (bool): Show the tiled frames and stop on "q", otherwise only process them.
+    max_frames (int): Stop after this many processed frames over all cameras, or None.
+
+    Returns:
+    dict: Number of processed frames per camera name.
+    """
+    def detect(frame):
+        try:
+            return client.detect_gazes(frame)
+        except Exception as e:
+            logging.warning(f"Gaze detection failed: {e}")
+            return []
+
+    pending = {stream.name: collections.deque() for stream in streams}
+    views = {stream.name: None for stream in streams}
+    processed = dict.fromkeys(views, 0)
+    closed = dict.fromkeys(views, False)
+    fps = registry.gauge("multi_camera_fps", help_text="Processed frames per second over all cameras")
+    window_start, window_frames = time.perf_counter(), 0
+
+    for stream in streams:
+        stream.start()
+    try:
+        with ThreadPoolExecutor(max_workers=len(streams) * in_flight, thread_name_prefix="multi-camera") as executor:
+            while True:
+                updated = False
+                for stream in streams:
+                    # Read before draining the queue, so a closed stream has no frame left behind
+                    closed[stream.name] = stream.frames.closed
+                    requests = pending[stream.name]
+                    while requests and requests[0][1].done():
+                        frame, future = requests.popleft()
+                        views[stream.name] = on_result(stream, frame, future.result())
+                        processed[stream.name] += 1
+                        window_frames += 1
+                        updated = True
+                    # Frames are taken after the results, so a freed slot is refilled before the end check
+                    while len(requests) < in_flight:
+                        frame = stream.frames.get(timeout=0)
+                        if frame is None:
+                            break
+                        requests.append((frame, executor.submit(detect, frame)))
+
+                if display:
+                    if updated:
+                        cv2.imshow(display_name, tile_frames([(name, view) for name, view in views.items()
+                                                              if view is not None]))
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+                elif not updated:
+                    time.sleep(0.001)
+
+                now = time.perf_counter()
+                if now - window_start >= 1:
+                    fps.set(window_frames / (now - window_start))
+                    logging.debug(f"Multi camera FPS: {window_frames / (now - window_start):.2f}")
+                    window_start, window_frames = now, 0
+
+                if max_frames is not None and sum(processed.values()) >= max_frames:
+                    break
+                if all(closed[stream.name] and not pending[stream.name] for stream in streams):
+                    break
+    finally:
+        for stream in streams:
+            stream.stop()
+        if display:
+            cv2.destroyAllWindows()
+
+    return processed
+
+
+def tile_frames(named_frames, columns=None):
+    """
+    Arrange frames in a grid, scaled to the size of the first one, with their name in the corner.
+
+    Args:
+    named_frames (list): (name, frame) pairs.
+    columns (int): Frames per row, by default the smallest square grid.
+
+    Returns:
+    numpy.ndarray: The tiled image.
+    """
+    if not named_frames:
+        return np.zeros((cfg.HEIGHT_OF_PLAYGROUND, cfg.WIDTH_OF_PLAYGROUND, 3), dtype=np.uint8)
+    if len(named_frames) == 1:
+        return named_frames[0][1]
+
+    columns = columns or int(np.ceil(np.sqrt(len(named_frames))))
+    rows = -(-len(named_frames) // columns)
+    height, width = named_frames[0][1].shape[:2]
+    mosaic = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for index, (name, frame) in enumerate(named_frames):
+        row, column = divmod(index, columns)
+        tile = mosaic[row * height:(row + 1) * height, column * width:(column + 1) * width]
+        tile[:] = frame if frame.shape[:2] == (height, width) else cv2.resize(frame, (width, height))
+        cv2.putText(tile, name, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    return mosaic
@@ -0,0 +1,175 @@
+""" This module contains a controller trading image quality for inference latency. """
+
+import logging
+import threading
+import numpy as np
+import config as cfg
+from utils.metrics import registry
+
+
+class QualityLevel:
+    """
+    One rung of the quality ladder.
+
+    Attributes:
+        scale (float): Downscale factor of the frames sent for detection, 1.0 for full resolution.
+        jpeg_quality (int): JPEG quality of the frames sent for detection.
+        frame_skip (int): Frames skipped between two detections.
+    """
+
+    __slots__ = ("scale", "jpeg_quality", "frame_skip")
+
+    def __init__(self, scale, jpeg_quality, frame_skip=0):
+        if not 0 < scale <= 1:
+            raise ValueError(f"Downscale factor must be in (0, 1]: {scale}")
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        self.frame_skip = frame_skip
+
+    def __repr__(self):
+        return f"scale {self.scale:g}, JPEG quality {self.jpeg_quality}, skip {self.frame_skip}"
+
+
+def scale_gaze(gaze, scale_x, scale_y):
+    """
+    Move the face and landmark coordinates of a gaze detected in a resized frame to the original frame.
+
+    The gaze angles do not depend on the image size, so together with the face box in original
+    coordinates the calibrated gaze point is the same as on a full resolution frame.
+
+    Args:
+    gaze (GazeRecord): Gaze data detected in the resized frame, updated in place.
+    scale_x (float): Original width divided by the resized width.
+    scale_y (float): Original height divided by the resized height.
+
+    Returns:
+    GazeRecord: The updated gaze data.
+    """
+    face = gaze.face
+    face.x *= scale_x
+    face.y *= scale_y
+    face.width *= scale_x
+    face.height *= scale_y
+    if face.landmarks is not None:
+        face.landmarks *= (scale_x, scale_y)
+    return gaze
+
+
+class QualityController:
+    """
+    Closed loop controller keeping the median inference latency under a target.
+
+    The ladder goes from the best quality to the cheapest. After every window of latency
+    samples, the controller moves one level down when the median is over the target, and one
+    level up when it is under upgrade_margin times the target. The gap between the two
+    thresholds avoids flapping between neighbouring levels; when an upgrade has to be undone
+    right away, the next upgrade waits twice as many windows (up to 8). Samples are collected
+    again after every change, so each decision is made on latencies measured at the current level.
+
+    Every change is logged with the latency that caused it. The methods are thread safe, so
+    one controller can be shared by requests running concurrently.
+
+    Attributes:
+        ladder (list): The QualityLevel of each level, best quality first.
+        target_ms (float): Target median latency in milliseconds.
+        window (int): Latency samples per decision.
+        upgrade_margin (float): Fraction of the target the median must be under to go up a level.
+        index (int): Current level in the ladder.
+        skipped_frames (int): Frames skipped so far.
+    """
+
+    def __init__(self, ladder=cfg.QUALITY_LADDER, target_ms=cfg.QUALITY_TARGET_LATENCY_MS, window=cfg.QUALITY_WINDOW,
+                 upgrade_margin=cfg.QUALITY_UPGRADE_MARGIN):
+        if not ladder:
+            raise ValueError("The quality ladder needs at least one level")
+        self.ladder = [level if isinstance(level, QualityLevel) else QualityLevel(*level) for level in ladder]
+        self.target_ms = target_ms
+        self.window = window
+        self.upgrade_margin = upgrade_margin
+        self.index = 0
+        self.skipped_frames = 0
+
+        self._samples = []
+        self._frames_since_detection = 0
+        self._upgrade_windows = 1
+        self._good_windows = 0
+        self._last_change = None
+        self._lock = threading.Lock()
+        self._level_gauge = registry.gauge("gaze_quality_level", help_text="Current level of the quality ladder")
+        self._skipped_counter = registry.counter("gaze_quality_skipped_frames_total",
+                                                 help_text="Frames skipped by the quality controller")
+        self._level_gauge.set(self.index)
+
+    @property
+    def level(self):
+        return self.ladder[self.index]
+
+    def skip_frame(self):
+        """
+        Check whether the current frame should be skipped to lower the detection rate.
+
+        Returns:
+        bool: True if the frame should not be sent for detection.
+        """
+        with self._lock:
+            if self._frames_since_detection < self.level.frame_skip:
+                self._frames_since_detection += 1
+                self.skipped_frames += 1
+                self._skipped_counter.inc()
+                return True
+            self._frames_since_detection = 0
+            return False
+
+    def observe(self, latency_ms):
+        """
+        Add the latency of a detection request and adjust the level once the window is full.
+
+        Args:
+        latency_ms (float): Encoding, upload, inference and parsing time of the request.
+
+        Returns:
+        QualityLevel: The level to use for the next frames.
+        """
+        with self._lock:
+            self._samples.append(latency_ms)
+            if len(self._samples) >= self.window:
+                median = float(np.median(self._samples))
+                self._samples.clear()
+                self._decide(median)
+            return self.level
+
+    def _decide(self, median):
+        # Only the window right after an upgrade tells whether it held
+        last_change, self._last_change = self._last_change, None
+        if median > self.target_ms:
+            self._good_windows = 0
+            if self.index == len(self.ladder) - 1:
+                logging.warning(f"Median gaze latency {median:.0f} ms over the {self.target_ms} ms target "
+                                f"at the lowest quality ({self.level})")
+                return
+            if last_change == "up":
+                # The upgrade did not hold, wait longer before trying it again
+                self._upgrade_windows = min(2 * self._upgrade_windows, 8)
+            self._change(self.index + 1, "down", f"median latency {median:.0f} ms over the {self.target_ms} ms target")
+            return
+
+        if last_change == "up":
+            self._upgrade_windows = 1
+        if median < self.upgrade_margin * self.target_ms and self.index > 0:
+            self._good_windows += 1
+            if self._good_windows >= self._upgrade_windows:
+                self._good_windows = 0
+                self._change(self.index - 1, "up", f"median latency {median:.0f} ms under "
+                                                   f"{self.upgrade_margin:g} x the {self.target_ms} ms target")
+                return
+        else:
+            self._good_windows = 0
+        logging.debug(f"Median gaze latency {median:.0f} ms, keeping quality level {self.index} ({self.level})")
+
+    def _change(self, index, direction, reason):
+        previous = self.level
+        self.index = index
+        self._last_change = direction
+        self._frames_since_detection = 0
+        self._level_gauge.set(index)
+        logging.info(f"Gaze quality {direction} to level {index} ({self.level}, was {previous}): {reason}")
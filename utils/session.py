@@ -0,0 +1,409 @@
+""" This module contains a recorder and a replay engine for webcam sessions. """
+
+import hashlib
+import json
+import os
+import threading
+import time
+import cv2
+import numpy as np
+import config as cfg
+from utils.gaze_record import GazeRecord, GazeSampleBuffer
+
+META_FILE = "meta.json"
+INDEX_FILE = "index.npy"
+GAZES_FILE = "gazes.jsonl"
+CHUNK_FILE = "frames_{:05d}.bin"
+
+INDEX_DTYPE = np.dtype([("timestamp", "f8"), ("chunk", "u4"), ("slot", "u4"), ("fingerprint", "u8")])
+
+# Frames are compared on every FINGERPRINT_STEP-th pixel in both directions
+FINGERPRINT_STEP = 8
+
+
+def frame_fingerprint(frame, flipped=False):
+    """
+    Compute a cheap fingerprint of a frame from a subsample of its pixels.
+
+    Args:
+    frame (numpy.ndarray): The frame.
+    flipped (bool): Compute the fingerprint of the horizontally flipped frame, without flipping it.
+
+    Returns:
+    int: A 64-bit fingerprint.
+    """
+    sample = frame[::FINGERPRINT_STEP, ::-1][:, ::FINGERPRINT_STEP] if flipped else frame[::FINGERPRINT_STEP, ::FINGERPRINT_STEP]
+    digest = hashlib.blake2b(np.ascontiguousarray(sample).data, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SessionRecorder:
+    """
+    Record frames, capture timestamps and gaze predictions of a session to a directory.
+
+    Frames are written to fixed-size chunk files through memory maps, so any frame can later be
+    read back by index without loading the whole session. The index (timestamp, chunk, slot and
+    fingerprint per frame) and the metadata are written on close, predictions are appended to a
+    JSON lines file as they arrive.
+
+    Attributes:
+        directory (str): The session directory.
+        chunk_frames (int): Number of frames per chunk file.
+        frame_count (int): Number of recorded frames.
+    """
+
+    def __init__(self, directory, chunk_frames=cfg.SESSION_CHUNK_FRAMES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_frames = chunk_frames
+        self.frame_count = 0
+
+        self._lock = threading.Lock()
+        self._frame_shape = None
+        self._frame_dtype = None
+        self._chunk = None
+        self._index = np.empty(chunk_frames, dtype=INDEX_DTYPE)
+        self._recent_fingerprints = {}
+        self._gazes_file = open(os.path.join(directory, GAZES_FILE), "w", encoding="utf-8")
+        self._closed = False
+
+    def record_frame(self, frame, timestamp=None, flipped=True):
+        """
+        Append a frame to the session.
+
+        Args:
+        frame (numpy.ndarray): The captured frame, all frames must have the same shape.
+        timestamp (float): Capture time in seconds, defaults to now.
+        flipped (bool): Whether the frame is flipped before processing (as in video_loop), so
+            predictions recorded for the processed frame can be matched with it.
+
+        Returns:
+        int: The index of the frame in the session.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        fingerprint = frame_fingerprint(frame, flipped=flipped)
+        with self._lock:
+            if self._frame_shape is None:
+                self._frame_shape = frame.shape
+                self._frame_dtype = frame.dtype
+            elif frame.shape != self._frame_shape:
+                raise ValueError(f"Frame shape {frame.shape} differs from the session shape {self._frame_shape}")
+
+            index = self.frame_count
+            chunk, slot = divmod(index, self.chunk_frames)
+            if slot == 0:
+                self._open_chunk(chunk)
+            self._chunk[slot] = frame
+
+            if index == len(self._index):
+                self._index = np.resize(self._index, 2 * len(self._index))
+            self._index[index] = (timestamp, chunk, slot, fingerprint)
+            self.frame_count += 1
+
+            # Only the last frames can still be waiting for their predictions
+            self._recent_fingerprints[fingerprint] = index
+            if len(self._recent_fingerprints) > 4 * cfg.PIPELINE_QUEUE_SIZE + 16:
+                del self._recent_fingerprints[next(iter(self._recent_fingerprints))]
+            return index
+
+    def record_gazes(self, frame, predictions, timestamp=None):
+        """
+        Append the raw predictions returned for a processed frame.
+
+        Args:
+        frame (numpy.ndarray): The frame that was sent for detection.
+        predictions (list): The GazeRecord predictions, written in the server format.
+        timestamp (float): Time the predictions were received, defaults to now.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        fingerprint = frame_fingerprint(frame)
+        with self._lock:
+            frame_index = self._recent_fingerprints.get(fingerprint)
+            line = json.dumps({"frame": frame_index, "fingerprint": fingerprint, "timestamp": timestamp,
+                               "predictions": [prediction.to_dict() for prediction in predictions]})
+            self._gazes_file.write(line + "\n")
+
+    def wrap_capture(self, cap):
+        """
+        Return a capture object recording every frame read from cap.
+        """
+        return RecordingCapture(cap, self)
+
+    def wrap_gaze_source(self, source):
+        """
+        Return a gaze source recording the predictions returned by source.
+        """
+        return RecordingGazeSource(source, self)
+
+    def _open_chunk(self, chunk):
+        if self._chunk is not None:
+            self._chunk.flush()
+        path = os.path.join(self.directory, CHUNK_FILE.format(chunk))
+        self._chunk = np.memmap(path, dtype=self._frame_dtype, mode="w+", shape=(self.chunk_frames, *self._frame_shape))
+
+    def close(self, fps=None):
+        """
+        Flush the frames and write the index and the metadata of the session.
+
+        Args:
+        fps (float): Nominal frame rate of the capture device, stored in the metadata.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._gazes_file.close()
+            if self._chunk is not None:
+                self._chunk.flush()
+                last_chunk = (self.frame_count - 1) // self.chunk_frames
+                used_slots = self.frame_count - last_chunk * self.chunk_frames
+                frame_bytes = int(np.prod(self._frame_shape)) * self._frame_dtype.itemsize
+                self._chunk = None
+                # The last chunk file is only partially used
+                os.truncate(os.path.join(self.directory, CHUNK_FILE.format(last_chunk)), used_slots * frame_bytes)
+
+            np.save(os.path.join(self.directory, INDEX_FILE), self._index[:self.frame_count])
+            meta = {
+                "frame_count": self.frame_count,
+                "frame_shape": list(self._frame_shape) if self._frame_shape else None,
+                "frame_dtype": self._frame_dtype.str if self._frame_dtype else None,
+                "chunk_frames": self.chunk_frames,
+                "fps": fps,
+            }
+            with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordingCapture:
+    """
+    Wrap a cv2.VideoCapture and record every frame it reads.
+    """
+
+    def __init__(self, cap, recorder):
+        self.cap = cap
+        self.recorder = recorder
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if ret:
+            self.recorder.record_frame(frame)
+        return ret, frame
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+class RecordingGazeSource:
+    """
+    Wrap a gaze source (any object with detect_gazes) and record the predictions it returns.
+    """
+
+    def __init__(self, source, recorder):
+        self.source = source
+        self.recorder = recorder
+
+    def detect_gazes(self, frame):
+        predictions = self.source.detect_gazes(frame)
+        self.recorder.record_gazes(frame, predictions)
+        return predictions
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+
+class SessionReader:
+    """
+    Random access to a recorded session.
+
+    Attributes:
+        directory (str): The session directory.
+        frame_shape (tuple): Shape of every frame.
+        timestamps (numpy.ndarray): Capture time of every frame.
+        fps (float): Nominal frame rate of the capture device, if known.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.frame_shape = tuple(meta["frame_shape"] or ())
+        self.frame_dtype = np.dtype(meta["frame_dtype"] or "u1")
+        self.chunk_frames = meta["chunk_frames"]
+        self.fps = meta.get("fps")
+
+        self.index = np.load(os.path.join(directory, INDEX_FILE))
+        self.timestamps = self.index["timestamp"]
+        self._chunks = {}
+        self._predictions = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, index):
+        """
+        Return a read-only view of the frame at the given index.
+        """
+        entry = self.index[index]
+        return self._chunk(int(entry["chunk"]))[int(entry["slot"])]
+
+    def index_at_time(self, timestamp):
+        """
+        Return the index of the last frame captured at or before the given time.
+        """
+        return max(0, int(np.searchsorted(self.timestamps, timestamp, side="right")) - 1)
+
+    def predictions(self):
+        """
+        Return the recorded predictions as a dictionary mapping frame indices to lists of GazeRecord.
+        """
+        if self._predictions is None:
+            self._predictions = {}
+            for record in self._gaze_lines():
+                if record["frame"] is not None:
+                    self._predictions[record["frame"]] = [GazeRecord.from_prediction(prediction)
+                                                          for prediction in record["predictions"]]
+        return self._predictions
+
+    def gaze_samples(self):
+        """
+        Return every recorded gaze as rows of a structured array, compact enough for long sessions.
+
+        Returns:
+        numpy.ndarray: GAZE_SAMPLE_DTYPE rows with the frame index (-1 if unknown) and the time
+            the predictions were received, one row per detected face.
+        """
+        buffer = GazeSampleBuffer()
+        for record in self._gaze_lines():
+            frame_index = record["frame"] if record["frame"] is not None else -1
+            for prediction in record["predictions"]:
+                buffer.append(frame_index, record["timestamp"], GazeRecord.from_prediction(prediction, False))
+        return buffer.samples
+
+    def _gaze_lines(self):
+        path = os.path.join(self.directory, GAZES_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _chunk(self, chunk):
+        if chunk not in self._chunks:
+            path = os.path.join(self.directory, CHUNK_FILE.format(chunk))
+            frames = os.path.getsize(path) // (int(np.prod(self.frame_shape)) * self.frame_dtype.itemsize)
+            self._chunks[chunk] = np.memmap(path, dtype=self.frame_dtype, mode="r", shape=(frames, *self.frame_shape))
+        return self._chunks[chunk]
+
+
+class ReplayCapture:
+    """
+    A drop-in replacement for cv2.VideoCapture reading the frames of a recorded session.
+
+    Attributes:
+        session (SessionReader): The recorded session.
+        speed (float): Playback speed relative to the recording, None to read as fast as possible.
+        position (int): Index of the next frame to read.
+    """
+
+    def __init__(self, session, speed=None, loop=False):
+        self.session = session
+        self.speed = speed
+        self.loop = loop
+        self.position = 0
+        self._start_time = None
+        self._start_timestamp = None
+
+    def isOpened(self):
+        return len(self.session) > 0
+
+    def read(self):
+        if self.position >= len(self.session):
+            if not self.loop:
+                return False, None
+            self.seek(0)
+
+        if self.speed:
+            self._wait_for_frame()
+        frame = np.array(self.session.frame(self.position))
+        self.position += 1
+        return True, frame
+
+    def seek(self, position):
+        self.position = min(max(0, int(position)), len(self.session))
+        self._start_time = None
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.session))
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.session.fps or 0)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.session.frame_shape[0])
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.session.frame_shape[1])
+        return 0.0
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.seek(value)
+            return True
+        # The recorded frames cannot be resized
+        return False
+
+    def release(self):
+        self.position = len(self.session)
+
+    def _wait_for_frame(self):
+        timestamp = self.session.timestamps[self.position]
+        if self._start_time is None:
+            self._start_time = time.time()
+            self._start_timestamp = timestamp
+        delay = (timestamp - self._start_timestamp) / self.speed - (time.time() - self._start_time)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplayGazeSource:
+    """
+    A gaze source returning the predictions recorded for the frames of a session.
+
+    Frames are matched through their fingerprint, so the source also works when frames are dropped
+    or processed out of order. Frames without recorded predictions (for example skipped by the
+    motion gate while recording) get the predictions of the closest earlier frame, or are sent
+    to the fallback source if one is given.
+    """
+
+    def __init__(self, session, fallback=None):
+        self.session = session
+        self.fallback = fallback
+        self._frame_by_fingerprint = {int(fingerprint): i for i, fingerprint in enumerate(session.index["fingerprint"])}
+        self._predictions = session.predictions()
+        self._frames_with_predictions = np.array(sorted(self._predictions), dtype=np.int64)
+
+    def detect_gazes(self, frame):
+        frame_index = self._frame_by_fingerprint.get(frame_fingerprint(frame))
+        if frame_index is not None and frame_index in self._predictions:
+            return _copy_predictions(self._predictions[frame_index])
+
+        if self.fallback is not None:
+            return self.fallback.detect_gazes(frame)
+
+        if frame_index is None or len(self._frames_with_predictions) == 0:
+            return []
+        position = np.searchsorted(self._frames_with_predictions, frame_index, side="right") - 1
+        if position < 0:
+            return []
+        return _copy_predictions(self._predictions[int(self._frames_with_predictions[position])])
+
+
+def _copy_predictions(predictions):
+    # Consumers can update predictions in place (face region tracking does), keep the recorded ones intact
+    return [prediction.copy() for prediction in predictions]
@@ -0,0 +1,153 @@
+""" This module contains pre-rendered text sprites, so static text is rasterized once instead of every frame. """
+
+import cv2
+import numpy as np
+
+
+class Sprite:
+    """
+    An anti-aliased alpha mask blended onto frames in a single color.
+
+    Only the bounding box of the mask is touched, blended with cv2.blendLinear using weights
+    computed once, so drawing a sprite costs far less than rasterizing the same shape again.
+
+    Attributes:
+        mask (numpy.ndarray): Coverage of the shape (0-255).
+        anchor (tuple): Position inside the mask that is placed at the drawing origin.
+        color (tuple): BGR color of the shape.
+    """
+
+    def __init__(self, mask, anchor, color):
+        self.mask = mask
+        self.anchor = anchor
+        self.color = color
+
+        self._weights = mask.astype(np.float32) / 255
+        self._inverse_weights = 1 - self._weights
+        self._solid = np.empty(mask.shape + (len(color),), dtype=np.uint8)
+        self._solid[:] = color
+
+    def draw(self, frame, origin):
+        """
+        Blend the sprite onto a frame, in place.
+
+        Args:
+        frame (numpy.ndarray): The image to draw on, with as many channels as the color.
+        origin (tuple): The (x, y) position of the frame where the anchor of the sprite goes.
+
+        Returns:
+        numpy.ndarray: The image with the sprite drawn.
+        """
+        x = origin[0] - self.anchor[0]
+        y = origin[1] - self.anchor[1]
+        mask_height, mask_width = self.mask.shape
+        frame_height, frame_width = frame.shape[:2]
+
+        # Clip the sprite to the frame
+        x_min, y_min = max(x, 0), max(y, 0)
+        x_max, y_max = min(x + mask_width, frame_width), min(y + mask_height, frame_height)
+        if x_min >= x_max or y_min >= y_max:
+            return frame
+
+        sprite = np.s_[y_min - y:y_max - y, x_min - x:x_max - x]
+        region = frame[y_min:y_max, x_min:x_max]
+        region[:] = cv2.blendLinear(region, self._solid[sprite], self._inverse_weights[sprite], self._weights[sprite])
+        return frame
+
+
+class TextSprite(Sprite):
+    """
+    A line of text rasterized once with cv2.putText, drawn at the same origin as cv2.putText would.
+
+    Attributes:
+        text (str): The rendered text.
+        width (int): Width of the text as reported by cv2.getTextSize.
+        height (int): Height of the text above the baseline.
+    """
+
+    def __init__(self, text, font=cv2.FONT_HERSHEY_SIMPLEX, font_scale=0.8, color=(255, 0, 0), thickness=2):
+        (self.width, self.height), baseline = cv2.getTextSize(text, font, font_scale, thickness)
+        self.text = text
+
+        pad = thickness + 1
+        mask = np.zeros((self.height + baseline + 2 * pad, self.width + 2 * pad), dtype=np.uint8)
+        # The origin of the text (bottom left corner) inside the mask
+        anchor = (pad, pad + self.height)
+        cv2.putText(mask, text, anchor, font, font_scale, 255, thickness, cv2.LINE_AA)
+        super().__init__(mask, anchor, color)
+
+
+class GlyphCache:
+    """
+    Draw frequently changing text, like a timer, from one cached sprite per character.
+
+    Glyphs are placed at their advance rounded to the pixel, so the text can be up to half a pixel
+    off the sub-pixel positions used by cv2.putText.
+
+    Attributes:
+        font (int): The cv2 Hershey font.
+        font_scale (float): Scale of the font.
+        color (tuple): BGR color of the text.
+        thickness (int): Thickness of the strokes.
+    """
+
+    def __init__(self, font=cv2.FONT_HERSHEY_SIMPLEX, font_scale=0.8, color=(0, 0, 255), thickness=2):
+        self.font = font
+        self.font_scale = font_scale
+        self.color = color
+        self.thickness = thickness
+        self._glyphs = {}
+        self._last_text = None
+        self._last_sprite = None
+
+    def draw(self, frame, text, origin):
+        """
+        Draw the text, in place. The sprite of the whole text is assembled from the glyphs once and
+        reused for as long as the text does not change.
+
+        Args:
+        frame (numpy.ndarray): The image to draw on.
+        text (str): The text to draw.
+        origin (tuple): The (x, y) position of the bottom left corner of the text, as for cv2.putText.
+
+        Returns:
+        numpy.ndarray: The image with the text drawn.
+        """
+        if text != self._last_text:
+            self._last_sprite = self._assemble(text)
+            self._last_text = text
+        if self._last_sprite is not None:
+            self._last_sprite.draw(frame, origin)
+        return frame
+
+    def _assemble(self, text):
+        glyphs, positions = [], []
+        x = 0.0
+        for char in text:
+            glyph = self._glyphs.get(char)
+            if glyph is None:
+                glyph = self._glyphs[char] = self._render(char)
+            sprite, advance = glyph
+            if sprite is not None:
+                glyphs.append(sprite)
+                positions.append(round(x))
+            x += advance
+        if not glyphs:
+            return None
+
+        # Glyph masks share their height and anchor, only their horizontal position differs
+        anchor = glyphs[0].anchor
+        width = max(position + sprite.mask.shape[1] for sprite, position in zip(glyphs, positions))
+        mask = np.zeros((glyphs[0].mask.shape[0], width), dtype=np.uint8)
+        for sprite, position in zip(glyphs, positions):
+            region = mask[:, position:position + sprite.mask.shape[1]]
+            np.maximum(region, sprite.mask, out=region)
+        return Sprite(mask, anchor, self.color)
+
+    def _render(self, char):
+        # Advances are fractional and getTextSize rounds the width of the whole string, so the
+        # advance is measured on a long run of the character to keep the rounding error small
+        single = cv2.getTextSize(char, self.font, self.font_scale, self.thickness)[0][0]
+        repeated = cv2.getTextSize(char * 65, self.font, self.font_scale, self.thickness)[0][0]
+        sprite = TextSprite(char, self.font, self.font_scale, self.color, self.thickness) if char != " " else None
+        return sprite, (repeated - single) / 64
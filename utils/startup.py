@@ -0,0 +1,101 @@
+""" This module measures the startup phases, to keep the time to the first gaze dot low. """
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from utils.metrics import registry
+
+# Imported first by main, so close to the start of the process
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    Record the phases of the startup, which may overlap, and the time of one-off events.
+
+    Attributes:
+        start (float): perf_counter value all times are relative to.
+        phases (dict): Phase name to (start, end) in seconds.
+        marks (dict): Event name to time in seconds.
+    """
+
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.phases = {}
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the with block as a startup phase.
+        """
+        phase_start = time.perf_counter() - self.start
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = (phase_start, time.perf_counter() - self.start)
+
+    def timed(self, name, func, *args, **kwargs):
+        """
+        Call func as a startup phase, e.g. from an executor.
+        """
+        with self.phase(name):
+            return func(*args, **kwargs)
+
+    def mark(self, name):
+        """
+        Record the first time an event happens, later calls are ignored.
+
+        Returns:
+        float: Time of the event in seconds.
+        """
+        with self._lock:
+            return self.marks.setdefault(name, time.perf_counter() - self.start)
+
+    def report(self):
+        """
+        Log the phases and events in the order they started, and publish them as startup_* gauges
+        of the metrics registry (durations of the phases, times of the events).
+
+        Returns:
+        str: The logged breakdown.
+        """
+        with self._lock:
+            entries = [(start, f"{name}: {start * 1000:.0f}-{end * 1000:.0f} ms ({(end - start) * 1000:.0f} ms)")
+                       for name, (start, end) in self.phases.items()]
+            entries += [(at, f"{name} at {at * 1000:.0f} ms") for name, at in self.marks.items()]
+            gauges = {f"startup_{name}_ms": (end - start) * 1000 for name, (start, end) in self.phases.items()}
+            gauges.update({f"startup_{name}_ms": at * 1000 for name, at in self.marks.items()})
+        breakdown = " | ".join(entry for _, entry in sorted(entries))
+        logging.info(f"Startup breakdown - {breakdown}")
+        for name, value in gauges.items():
+            registry.gauge(name.replace(" ", "_").replace("-", "_")).set(value)
+        return breakdown
+
+
+class FirstGazeProbe:
+    """
+    Gaze source wrapper marking the first processed frame and the first frame with a face.
+
+    Once a face has been seen, on_first_gaze is called, typically to report the startup breakdown
+    and to put the wrapped source back in place so the probe costs nothing afterwards.
+    """
+
+    def __init__(self, timer, source, on_first_gaze=None):
+        self.timer = timer
+        self.source = source
+        self.on_first_gaze = on_first_gaze
+        self._seen_face = False
+
+    def detect_gazes(self, frame):
+        self.timer.mark("first frame")
+        gazes = self.source.detect_gazes(frame)
+        if gazes and not self._seen_face:
+            self._seen_face = True
+            self.timer.mark("first gaze")
+            if self.on_first_gaze is not None:
+                self.on_first_gaze()
+        return gazes
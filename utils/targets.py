@@ -0,0 +1,181 @@
+""" This module contains the target field of the game, with a grid spatial hash for hit testing. """
+
+import numpy as np
+import config as cfg
+
+
+class TargetField:
+    """
+    Targets of the game stored as NumPy arrays, with hit tests through a uniform grid spatial hash.
+
+    The playground is divided into square cells at least as large as the hit radius, so a gaze can
+    only hit targets in its own cell and the eight cells around it. Targets are sorted by cell key
+    (row * columns + column); each of the three rows of neighbouring cells is then a contiguous run
+    of keys, found with two binary searches. The index is rebuilt lazily after targets move or are
+    removed, which is a single argsort.
+
+    Attributes:
+        positions (numpy.ndarray): (n, 2) float array of target centers.
+        velocities (numpy.ndarray): (n, 2) float array of velocities in pixels per second.
+        width (int): Width of the playground.
+        height (int): Height of the playground.
+        radius (int): Drawn radius of the targets.
+        hit_radius (float): Distance from the center at which a gaze hits a target.
+        margin (int): Distance from the borders that moving targets bounce off.
+        cell_size (float): Side of the grid cells.
+    """
+
+    def __init__(self, positions, velocities=None, width=cfg.WIDTH_OF_PLAYGROUND, height=cfg.HEIGHT_OF_PLAYGROUND,
+                 radius=cfg.TARGET_RADIUS, hit_radius=cfg.TARGET_HIT_RADIUS, margin=0, cell_size=None):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self.velocities = (np.zeros_like(self.positions) if velocities is None
+                           else np.asarray(velocities, dtype=np.float64).reshape(-1, 2))
+        self.width = width
+        self.height = height
+        self.radius = radius
+        self.hit_radius = hit_radius
+        self.margin = margin
+        self.cell_size = max(cell_size or hit_radius, hit_radius)
+
+        self._columns = int(np.ceil(width / self.cell_size))
+        self._rows = int(np.ceil(height / self.cell_size))
+        self._order = None
+        self._sorted_keys = None
+
+    @classmethod
+    def random(cls, count, speed=0.0, width=cfg.WIDTH_OF_PLAYGROUND, height=cfg.HEIGHT_OF_PLAYGROUND,
+               margin=cfg.TARGET_MARGIN, rng=None, **kwargs):
+        """
+        Create targets at random positions at least margin pixels from the borders.
+
+        Args:
+        count (int): Number of targets.
+        speed (float): Speed of the targets in pixels per second, in random directions. 0 for static targets.
+        rng (numpy.random.Generator): Random generator, a new one if None.
+
+        Returns:
+        TargetField: The targets.
+        """
+        rng = rng or np.random.default_rng()
+        # Integer positions like the classic game
+        x = rng.integers(margin, width - margin, count, endpoint=True)
+        y = rng.integers(margin, height - margin, count, endpoint=True)
+        angles = rng.uniform(0, 2 * np.pi, count)
+        velocities = speed * np.column_stack((np.cos(angles), np.sin(angles)))
+        return cls(np.column_stack((x, y)), velocities, width=width, height=height, margin=margin, **kwargs)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def is_moving(self):
+        return bool(np.any(self.velocities))
+
+    def step(self, dt):
+        """
+        Move the targets by their velocity over dt seconds, bouncing off the borders.
+
+        Args:
+        dt (float): Elapsed time in seconds.
+        """
+        if len(self) == 0 or not self.is_moving:
+            return
+        self.positions += self.velocities * dt
+
+        lower = np.array([self.margin, self.margin], dtype=np.float64)
+        upper = np.array([self.width - self.margin, self.height - self.margin], dtype=np.float64)
+        outside = (self.positions < lower) | (self.positions > upper)
+        if outside.any():
+            # Mirror the position back inside and reverse the velocity component that crossed the border
+            self.positions = np.where(self.positions < lower, 2 * lower - self.positions, self.positions)
+            self.positions = np.where(self.positions > upper, 2 * upper - self.positions, self.positions)
+            np.clip(self.positions, lower, upper, out=self.positions)
+            self.velocities[outside] *= -1
+        self._order = None
+
+    def hit_test(self, x, y):
+        """
+        Find the targets whose center is closer than the hit radius to a point.
+
+        Args:
+        x (float): X coordinate of the gaze point.
+        y (float): Y coordinate of the gaze point.
+
+        Returns:
+        numpy.ndarray: Indices of the hit targets.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.intp)
+        if self._order is None:
+            self._build_index()
+
+        column = min(max(int(x // self.cell_size), 0), self._columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self._rows - 1)
+        first_column, last_column = max(column - 1, 0), min(column + 1, self._columns - 1)
+        rows = np.arange(max(row - 1, 0), min(row + 1, self._rows - 1) + 1) * self._columns
+        keys_type = self._sorted_keys.dtype
+        starts = np.searchsorted(self._sorted_keys, (rows + first_column).astype(keys_type), side="left")
+        ends = np.searchsorted(self._sorted_keys, (rows + last_column).astype(keys_type), side="right")
+        candidates = [self._order[start:end] for start, end in zip(starts, ends) if start < end]
+        if not candidates:
+            return np.empty(0, dtype=np.intp)
+
+        candidates = np.concatenate(candidates) if len(candidates) > 1 else candidates[0]
+        offsets = self.positions[candidates] - (x, y)
+        hits = candidates[np.einsum("ij,ij->i", offsets, offsets) < self.hit_radius * self.hit_radius]
+        return np.sort(hits)
+
+    def remove(self, indices):
+        """
+        Remove targets by index.
+
+        Args:
+        indices (numpy.ndarray): Indices returned by hit_test.
+        """
+        if len(indices) == 0:
+            return
+        self.positions = np.delete(self.positions, indices, axis=0)
+        self.velocities = np.delete(self.velocities, indices, axis=0)
+        self._order = None
+
+    def pixel_positions(self):
+        """
+        Return the target centers rounded to pixels, as an (n, 2) integer array.
+        """
+        return np.rint(self.positions).astype(np.int32)
+
+    def _cell(self, points):
+        # Points outside of the playground are kept in the border cells, clipping keeps neighbours adjacent
+        cells = np.floor(points / self.cell_size).astype(np.int64)
+        np.clip(cells[:, 0], 0, self._columns - 1, out=cells[:, 0])
+        np.clip(cells[:, 1], 0, self._rows - 1, out=cells[:, 1])
+        return cells
+
+    def _build_index(self):
+        cells = self._cell(self.positions)
+        keys = cells[:, 1] * self._columns + cells[:, 0]
+        if self._rows * self._columns <= np.iinfo(np.uint16).max:
+            # NumPy sorts 16-bit integers with a radix sort when a stable sort is requested
+            keys = keys.astype(np.uint16)
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+
+
+def create_target_field(game_mode=cfg.GAME_MODE, rng=None):
+    """
+    Create the targets of a round of the game.
+
+    Args:
+    game_mode (str): "classic" or "swarm".
+    rng (numpy.random.Generator): Random generator, a new one if None.
+
+    Returns:
+    TargetField: The targets.
+    """
+    if game_mode == "classic":
+        return TargetField.random(cfg.NUMBER_OF_TARGETS, rng=rng)
+    if game_mode == "swarm":
+        return TargetField.random(cfg.SWARM_NUMBER_OF_TARGETS, speed=cfg.SWARM_TARGET_SPEED,
+                                  margin=cfg.SWARM_TARGET_RADIUS, radius=cfg.SWARM_TARGET_RADIUS,
+                                  hit_radius=cfg.SWARM_TARGET_HIT_RADIUS, rng=rng)
+    raise ValueError(f"Unknown game mode: {game_mode}")
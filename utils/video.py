@@ -1,13 +1,24 @@
 """ This module contains utility functions for working with video streams. """
 
+import collections
+import queue
+import threading
 import time
 import cv2
 import logging
-from utils.visualization import add_text_overlay
+import config as cfg
+from utils.metrics import registry
+from utils.visualization import add_text_overlay, draw_stats_hud
 
 logging.basicConfig(level=logging.DEBUG)
 
-def video_loop(cap, frame_processing_func, display_name="Video Loop", extra_text="", destroy_windows=True):
+# Keys pressed in the display stage are forwarded here while a pipelined loop is running,
+# since cv2.waitKey must only be called from the thread that owns the windows.
+_key_events = queue.Queue()
+_pipeline_running = threading.Event()
+
+
+def video_loop(cap, frame_processing_func, display_name="Video Loop", extra_text="", destroy_windows=True, pipelined=None):
     """
     A generic video loop function that can be used across different use cases.
 
@@ -16,26 +27,40 @@ def video_loop(cap, frame_processing_func, display_name="Video Loop", extra_text
         frame_processing_func (callable): A function that takes a frame as input and returns the processed frame and a stop condition.
         display_name (str, optional): The name of the display window. Defaults to "Video Loop".
         destroy_windows (bool, optional): Whether to destroy the display windows at the end of the loop. Defaults to True.
+        pipelined (bool, optional): Run capture, processing and display in separate threads.
+            Defaults to cfg.PIPELINED_VIDEO_LOOP.
 
     Returns:
         None
     """
+    if pipelined is None:
+        pipelined = cfg.PIPELINED_VIDEO_LOOP
+    if pipelined:
+        pipelined_video_loop(cap, frame_processing_func, display_name, extra_text, destroy_windows)
+        return
+
+    metrics = StageMetrics()
     fps_start_time = time.time()
     fps = 0
     frame_count = 0
     stop_condition = False
     while not stop_condition:
+        start = time.perf_counter()
         ret, frame = cap.read()
         if not ret:
             break
 
         frame = flip_frame(frame)
+        captured = time.perf_counter()
 
         processed_frame, stop_condition = frame_processing_func(frame)
+        processed = time.perf_counter()
 
         display_frame(display_name, processed_frame, extra_text)
 
-        if cv2.waitKey(1) & 0xFF == ord("q"):
+        key = cv2.waitKey(1) & 0xFF
+        metrics.observe_frame(start, captured, processed, time.perf_counter())
+        if key == ord("q"):
             break
 
         frame_count += 1
@@ -44,16 +69,283 @@ def video_loop(cap, frame_processing_func, display_name="Video Loop", extra_text
             frame_count = 0
             fps_start_time = time.time()
             logging.debug(f"FPS: {fps:.2f}")
+            metrics.report(fps)
+
+    if destroy_windows:
+        cv2.destroyAllWindows()
+
+
+def pipelined_video_loop(cap, frame_processing_func, display_name="Video Loop", extra_text="", destroy_windows=True):
+    """
+    Video loop with capture, frame processing and display running concurrently.
+
+    The capture and processing stages run in worker threads, the display stage runs in the
+    calling thread (HighGUI is not thread safe). Stages are joined by bounded queues that drop
+    the oldest frame when full, so a slow processing stage always works on the freshest frame
+    instead of falling behind the camera.
+
+    Args:
+        cap (cv2.VideoCapture): The video capture object.
+        frame_processing_func (callable): A function that takes a frame as input and returns the processed frame and a stop condition.
+        display_name (str, optional): The name of the display window. Defaults to "Video Loop".
+        extra_text (str, optional): Text drawn on top of every displayed frame.
+        destroy_windows (bool, optional): Whether to destroy the display windows at the end of the loop. Defaults to True.
+
+    Returns:
+        None
+    """
+    metrics = StageMetrics()
+    captured_frames = LatestFrameQueue(cfg.PIPELINE_QUEUE_SIZE, metrics.dropped_frames)
+    processed_frames = LatestFrameQueue(cfg.PIPELINE_QUEUE_SIZE, metrics.dropped_frames)
+    stop_event = threading.Event()
+    stats = StageStats(("capture", "processing", "display"))
+    errors = []
+
+    def capture_stage():
+        try:
+            while not stop_event.is_set():
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                captured_frames.put(flip_frame(frame))
+                metrics.capture.observe((time.perf_counter() - start) * 1000)
+                stats.tick("capture")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            captured_frames.close()
+
+    def processing_stage():
+        try:
+            while not stop_event.is_set():
+                frame = captured_frames.get(timeout=0.1)
+                if frame is None:
+                    if captured_frames.closed:
+                        break
+                    continue
+                start = time.perf_counter()
+                processed_frame, stop_condition = frame_processing_func(frame)
+                metrics.processing.observe((time.perf_counter() - start) * 1000)
+                processed_frames.put((processed_frame, stop_condition))
+                stats.tick("processing")
+                if stop_condition:
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            processed_frames.close()
+
+    workers = [threading.Thread(target=capture_stage, name="video-capture", daemon=True),
+               threading.Thread(target=processing_stage, name="video-processing", daemon=True)]
+
+    _pipeline_running.set()
+    for worker in workers:
+        worker.start()
+
+    try:
+        while True:
+            item = processed_frames.get(timeout=0.01)
+            if item is None:
+                if processed_frames.closed:
+                    break
+                # Keep the window responsive while the processing stage is busy
+                if _forward_key(cv2.waitKey(1) & 0xFF):
+                    break
+                continue
+
+            processed_frame, stop_condition = item
+            start = time.perf_counter()
+            display_frame(display_name, processed_frame, extra_text)
+            key = cv2.waitKey(1) & 0xFF
+            metrics.render.observe((time.perf_counter() - start) * 1000)
+            metrics.frames.inc()
+            stats.tick("display")
+
+            if _forward_key(key) or stop_condition:
+                break
+
+            if stats.report_if_due(captured_frames.dropped, processed_frames.dropped):
+                metrics.report(stats.throughput["display"])
+    finally:
+        stop_event.set()
+        captured_frames.close()
+        processed_frames.close()
+        for worker in workers:
+            worker.join()
+        _pipeline_running.clear()
+        _drain_key_events()
 
     if destroy_windows:
         cv2.destroyAllWindows()
 
+    if errors:
+        raise errors[0]
+
+
+def poll_key():
+    """
+    Return the last pressed key (masked to 8 bits), or 0xFF if no key was pressed.
+
+    Frame processing functions should use this instead of calling cv2.waitKey directly,
+    so that they keep working when the video loop runs pipelined.
+    """
+    if not _pipeline_running.is_set():
+        return cv2.waitKey(1) & 0xFF
+    try:
+        return _key_events.get_nowait()
+    except queue.Empty:
+        return 0xFF
+
+
+def _forward_key(key):
+    """
+    Forward a key pressed in the display stage to the processing stage.
+
+    Returns:
+        bool: True if the key asks to quit the loop.
+    """
+    if key == ord("q"):
+        return True
+    if key != 0xFF:
+        _key_events.put(key)
+    return False
+
+
+def _drain_key_events():
+    while True:
+        try:
+            _key_events.get_nowait()
+        except queue.Empty:
+            return
+
+
+class LatestFrameQueue:
+    """
+    A bounded queue between two pipeline stages that drops the oldest item when full.
+
+    A producer that must not lose items, such as a video file reader, can put with block=True
+    to wait for room instead.
+
+    Attributes:
+        dropped (int): Number of items dropped because the consumer was too slow.
+        closed (bool): Whether the producer has stopped putting items.
+    """
+
+    def __init__(self, maxsize=1, dropped_counter=None):
+        self._items = collections.deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self._dropped_counter = dropped_counter
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item, block=False):
+        with self._condition:
+            if block:
+                self._condition.wait_for(lambda: len(self._items) < self._items.maxlen or self.closed)
+                if self.closed:
+                    return
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                if self._dropped_counter is not None:
+                    self._dropped_counter.inc()
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Return the oldest item, or None if nothing arrived within the timeout or the queue is closed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self.closed, timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            # Wakes a blocked producer
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class StageStats:
+    """
+    Counts the frames handled by each pipeline stage and logs their throughput once per second.
+    """
+
+    def __init__(self, stage_names):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(stage_names, 0)
+        self._window_start = time.time()
+        self.throughput = dict.fromkeys(stage_names, 0.0)
+
+    def tick(self, stage_name):
+        with self._lock:
+            self._counts[stage_name] += 1
+
+    def report_if_due(self, dropped_captured=0, dropped_processed=0):
+        """
+        Log the throughput of every stage if a second has passed since the last report.
+
+        Returns:
+            bool: Whether the throughput was updated.
+        """
+        elapsed = time.time() - self._window_start
+        if elapsed < 1:
+            return False
+        with self._lock:
+            for stage_name, count in self._counts.items():
+                self.throughput[stage_name] = count / elapsed
+                self._counts[stage_name] = 0
+            self._window_start = time.time()
+        rates = ", ".join(f"{name}: {fps:.2f}" for name, fps in self.throughput.items())
+        logging.debug(f"FPS per stage - {rates} (dropped: {dropped_captured} captured, {dropped_processed} processed)")
+        return True
+
+
+class StageMetrics:
+    """
+    Latency histograms and counters of the video loop stages, kept in the shared metrics registry.
+    """
+
+    def __init__(self):
+        self.capture = registry.histogram("video_capture_latency_ms", help_text="Time to read and flip a frame")
+        self.processing = registry.histogram("video_processing_latency_ms",
+                                             help_text="Time spent in the frame processing function")
+        self.render = registry.histogram("video_render_latency_ms", help_text="Time to display a frame")
+        self.frames = registry.counter("video_frames_total", help_text="Frames displayed")
+        self.dropped_frames = registry.counter("video_dropped_frames_total",
+                                               help_text="Frames dropped between pipeline stages")
+        self.fps = registry.gauge("video_fps", help_text="Displayed frames per second")
+
+    def observe_frame(self, start, captured, processed, displayed):
+        """
+        Record the stage latencies of a frame from perf_counter timestamps.
+        """
+        self.capture.observe((captured - start) * 1000)
+        self.processing.observe((processed - captured) * 1000)
+        self.render.observe((displayed - processed) * 1000)
+        self.frames.inc()
+
+    def report(self, fps):
+        """
+        Update the frame rate and write the JSON snapshot, if configured. Called once per second.
+        """
+        self.fps.set(fps)
+        if cfg.METRICS_JSON_PATH:
+            registry.write_json(cfg.METRICS_JSON_PATH)
+
 
 def display_frame(window_name, frame, text=""):
     """
     Show the frame with the text overlay (if any).
     """
     add_text_overlay(frame, text)
+    if cfg.SHOW_STATS_HUD:
+        draw_stats_hud(frame, registry)
     cv2.imshow(window_name, frame)
 
 
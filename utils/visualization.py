@@ -1,7 +1,10 @@
 """ This is a module for visualizing gaze detection results. """
 
+from functools import lru_cache
 import cv2
+import numpy as np
 import config as cfg
+from utils.sprites import TextSprite, GlyphCache
 
 
 def draw_face_square(frame, gaze):
@@ -10,16 +13,16 @@ def draw_face_square(frame, gaze):
     
     Args:
     frame (numpy.ndarray): The image to draw on.
-    gaze (dict): The gaze data containing face information.
+    gaze (GazeRecord): The gaze data containing face information.
     
     Returns:
     numpy.ndarray: The image with the face square drawn.
     """
-    face = gaze["face"]
-    x_min = int(face["x"] - face["width"] / 2)
-    x_max = int(face["x"] + face["width"] / 2)
-    y_min = int(face["y"] - face["height"] / 2)
-    y_max = int(face["y"] + face["height"] / 2)
+    face = gaze.face
+    x_min = int(face.x - face.width / 2)
+    x_max = int(face.x + face.width / 2)
+    y_min = int(face.y - face.height / 2)
+    y_max = int(face.y + face.height / 2)
     cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), cfg.FACE_SQUARE_COLOR, cfg.FACE_SQUARE_THICKNESS)
     return frame
 
@@ -93,64 +96,85 @@ def draw_calibration_point(frame, point):
     return frame
 
 
+def draw_calibration_progress(frame, point, progress):
+    """
+    Draw a calibration point with a ring filling up as its samples are collected.
+
+    Args:
+    frame (numpy.ndarray): The image to draw on.
+    point (tuple): The (x, y) coordinates of the calibration point.
+    progress (float): Fraction of the samples collected (0-1).
+
+    Returns:
+    numpy.ndarray: The image with the calibration point drawn.
+    """
+    draw_calibration_point(frame, point)
+    if progress > 0:
+        radius = 2 * cfg.CALIBRATION_POINT_RADIUS
+        cv2.ellipse(frame, point, (radius, radius), -90, 0, 360 * progress, cfg.CALIBRATION_POINT_COLOR, 3)
+    return frame
+
+
 def add_text_overlay(frame, text):
+    for sprite, origin in _text_overlay_layout(text, frame.shape[1]):
+        sprite.draw(frame, origin)
+
+
+@lru_cache(maxsize=32)
+def _text_overlay_layout(text, frame_width):
+    """
+    Rasterize the overlay text once per text and frame width.
+
+    Returns:
+    tuple: (sprite, origin) pairs, one per row of text.
+    """
     font = cv2.FONT_HERSHEY_SIMPLEX
     font_scale = 0.8
     thickness = 2
-    text_size, _ = cv2.getTextSize(text, font, font_scale, thickness)
-    text_x = (frame.shape[1] - text_size[0]) // 2
     text_y = 20
     text_color = (255, 0, 0)
 
     # Split the text into two rows if it's too long
     max_text_length = 40
+    rows = [text]
     if len(text) > max_text_length:
         split_index = text.rfind(' ', 0, max_text_length)
         if split_index == -1:
             split_index = max_text_length
-        row1 = text[:split_index]
-        row2 = text[split_index+1:]
-
-        # Draw the first row
-        row1_size, _ = cv2.getTextSize(row1, font, font_scale, thickness)
-        row1_x = (frame.shape[1] - row1_size[0]) // 2
-        row1_y = text_y
-        cv2.putText(frame, row1, (row1_x, row1_y), font, font_scale, text_color, thickness, cv2.LINE_AA)
+        rows = [text[:split_index], text[split_index+1:]]
 
-        # Draw the second row
-        row2_size, _ = cv2.getTextSize(row2, font, font_scale, thickness)
-        row2_x = (frame.shape[1] - row2_size[0]) // 2
-        row2_y = row1_y + row1_size[1] + 10
-        cv2.putText(frame, row2, (row2_x, row2_y), font, font_scale, text_color, thickness, cv2.LINE_AA)
-    else:
-        cv2.putText(frame, text, (text_x, text_y), font, font_scale, text_color, thickness, cv2.LINE_AA)
+    layout = []
+    for row in rows:
+        sprite = TextSprite(row, font, font_scale, text_color, thickness)
+        layout.append((sprite, ((frame_width - sprite.width) // 2, text_y)))
+        text_y += sprite.height + 10
+    return tuple(layout)
 
 
 def show_timer(frame, timer):
     image_height, image_width = frame.shape[:2]
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = 0.8
-    thickness = 2
     text_x = image_width - 160
     text_y = image_height - 20
-    text_color = (0, 0, 255)
 
-    cv2.putText(frame, timer, (text_x, text_y), font, font_scale, text_color, thickness, cv2.LINE_AA)
+    _TIMER_GLYPHS.draw(frame, timer, (text_x, text_y))
 
 
-def draw_target(frame, target_position):
+_TIMER_GLYPHS = GlyphCache(cv2.FONT_HERSHEY_SIMPLEX, font_scale=0.8, color=(0, 0, 255), thickness=2)
+
+
+def draw_target(frame, target_position, radius=cfg.TARGET_RADIUS):
     """
     Draw a target on the frame at the given position.
 
     Args:
     frame (numpy.ndarray): The input frame to draw the target on.
     target_position (tuple): The (x, y) coordinates of the target position.
+    radius (int): The radius of the target.
 
     Returns:
     numpy.ndarray: The frame with the target drawn on it.
     """
     x, y = target_position
-    radius = 40
     color = (0, 0, 255)
     thickness = 2
 
@@ -158,3 +182,94 @@ def draw_target(frame, target_position):
     frame = cv2.circle(frame, (x, y), radius, color, thickness)
 
     return frame
+
+
+def draw_targets(frame, target_positions, radius=cfg.TARGET_RADIUS):
+    """
+    Draw many targets at once, with the same pixels as draw_target (except for a few pixels along
+    the frame borders, where cv2.circle clips partly visible circles differently).
+
+    The pixels of one target circle are computed once per radius. They are stamped at every
+    position into a mask, or for many targets the mask is built by dilating the target centers
+    with the circle, and the color is copied through the mask in a single pass.
+
+    Args:
+    frame (numpy.ndarray): The input frame to draw the targets on.
+    target_positions (numpy.ndarray): (n, 2) integer array or list of (x, y) target positions.
+    radius (int): The radius of the targets.
+
+    Returns:
+    numpy.ndarray: The frame with the targets drawn on it.
+    """
+    positions = np.asarray(target_positions, dtype=np.int64).reshape(-1, 2)
+    if len(positions) == 0:
+        return frame
+
+    image_height, image_width = frame.shape[:2]
+    offsets_x, offsets_y, kernel = _target_stamp(radius)
+    mask = np.zeros((image_height, image_width), dtype=np.uint8)
+    # Stamping costs about the same per pixel of every circle as dilating costs per pixel of the frame
+    if len(positions) > image_height * image_width // 2048:
+        inside = ((positions[:, 0] >= 0) & (positions[:, 0] < image_width)
+                  & (positions[:, 1] >= 0) & (positions[:, 1] < image_height))
+        mask[positions[inside, 1], positions[inside, 0]] = 1
+        # Centers outside of the frame are missed by the dilation, stamp their visible pixels instead
+        positions = positions[~inside]
+        mask = cv2.dilate(mask, kernel)
+
+    xs = (positions[:, :1] + offsets_x).ravel()
+    ys = (positions[:, 1:] + offsets_y).ravel()
+    visible = (xs >= 0) & (xs < image_width) & (ys >= 0) & (ys < image_height)
+    mask[ys[visible], xs[visible]] = 1
+
+    cv2.copyTo(_solid_image(frame.shape, (0, 0, 255)), mask, frame)
+    return frame
+
+
+@lru_cache(maxsize=8)
+def _target_stamp(radius):
+    """
+    Return the (x, y) offsets from the center of the pixels set by draw_target, and the same
+    pixels as a dilation kernel.
+    """
+    center = radius + 4
+    mask = np.zeros((2 * center + 1, 2 * center + 1, 3), dtype=np.uint8)
+    draw_target(mask, (center, center), radius)
+    circle = mask.any(axis=2).astype(np.uint8)
+    offsets_y, offsets_x = np.nonzero(circle)
+    # Dilation takes the maximum over the mirrored kernel, so the kernel is flipped to stamp the circle
+    return offsets_x - center, offsets_y - center, np.ascontiguousarray(circle[::-1, ::-1])
+
+
+@lru_cache(maxsize=4)
+def _solid_image(shape, color):
+    image = np.empty(shape, dtype=np.uint8)
+    image[:] = color
+    image.flags.writeable = False
+    return image
+
+
+def draw_stats_hud(frame, metrics_registry):
+    """
+    Draw the frame rate and the median latency of the pipeline stages in the top left corner.
+
+    Args:
+    frame (numpy.ndarray): The image to draw on.
+    metrics_registry (MetricsRegistry): The registry holding the video loop and gaze client metrics.
+
+    Returns:
+    numpy.ndarray: The image with the statistics drawn.
+    """
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 0.45
+    text_color = (0, 255, 0)
+
+    lines = [f"FPS: {metrics_registry.gauge('video_fps').value:.1f}"]
+    for label, name in (("capture", "video_capture_latency_ms"), ("process", "video_processing_latency_ms"),
+                        ("inference", "gaze_inference_latency_ms"), ("render", "video_render_latency_ms")):
+        p50 = metrics_registry.histogram(name).quantile(0.5)
+        lines.append(f"{label}: {p50:.1f} ms" if p50 is not None else f"{label}: -")
+
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (10, 50 + 16 * i), font, font_scale, text_color, 1, cv2.LINE_AA)
+    return frame